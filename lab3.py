@@ -1,16 +1,25 @@
 import sys
+import os
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import cv2
 import numpy as np
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QFileDialog,
-                             QComboBox, QSlider, QSpinBox, QGridLayout, QGroupBox)
+                             QComboBox, QSlider, QSpinBox, QGridLayout, QGroupBox, QSizePolicy,
+                             QLineEdit)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QImage, QPixmap
-import imutils
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
+# Qt >= 5.14 умеет показывать BGR-буфер OpenCV без перестановки каналов
+BGR_FORMAT = getattr(QImage.Format, 'Format_BGR888', None)
+
 
 class HistogramWidget(QWidget):
     def __init__(self, parent=None):
@@ -28,18 +37,19 @@ class HistogramWidget(QWidget):
         self.ax.grid(True, color='gray', alpha=0.3)
         self.ax.tick_params(colors='white')
 
-    def update_histogram(self, image):
+    def update_histogram(self, image, histogram=None):
         self.ax.clear()
+        if histogram is None:
+            histogram = ImageHistogram(image)
+        hist = histogram.global_histogram()
         if len(image.shape) == 3:
             colors = ('b', 'g', 'r')
             labels = ('Blue', 'Green', 'Red')
-            for i, (color, label) in enumerate(zip(colors, labels)):
-                hist = cv2.calcHist([image], [i], None, [256], [0, 256])
-                self.ax.plot(hist, color=color, label=label, linewidth=2)
+            for channel, color, label in zip(hist, colors, labels):
+                self.ax.plot(channel, color=color, label=label, linewidth=2)
             self.ax.legend()
         else:
-            hist = cv2.calcHist([image], [0], None, [256], [0, 256])
-            self.ax.plot(hist, color='white', linewidth=2)
+            self.ax.plot(hist[0], color='white', linewidth=2)
 
         self.ax.set_xlim([0, 256])
         self.ax.set_ylim(bottom=0)  # Начинаем с нуля
@@ -48,6 +58,42 @@ class HistogramWidget(QWidget):
         self.canvas.draw()
 
 
+class ImageHistogram:
+    """
+    Кэш гистограмм изображения. Считается один раз и используется всеми
+    автоматическими операциями, поэтому подбор параметров не пересканирует изображение.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.channels = 1 if image.ndim == 2 else image.shape[2]
+        self._global = None
+        self._tiles = {}
+
+    def global_histogram(self):
+        """Гистограмма всего изображения, массив (channels, 256)"""
+        if self._global is None:
+            self._global = np.stack([
+                cv2.calcHist([self.image], [c], None, [256], [0, 256]).ravel()
+                for c in range(self.channels)
+            ])
+        return self._global
+
+    def tile_histograms(self, tiles):
+        """Гистограммы сетки tiles x tiles: (hist[rows, cols, channels, 256], границы строк, границы столбцов)"""
+        if tiles not in self._tiles:
+            height, width = self.image.shape[:2]
+            rows = np.linspace(0, height, min(tiles, height) + 1).astype(int)
+            cols = np.linspace(0, width, min(tiles, width) + 1).astype(int)
+            hist = np.empty((len(rows) - 1, len(cols) - 1, self.channels, 256))
+            for i in range(len(rows) - 1):
+                for j in range(len(cols) - 1):
+                    tile = self.image[rows[i]:rows[i + 1], cols[j]:cols[j + 1]]
+                    hist[i, j] = ImageHistogram(tile).global_histogram()
+            self._tiles[tiles] = (hist, rows, cols)
+        return self._tiles[tiles]
+
+
 class ImageProcessor:
     @staticmethod
     def linear_contrast(image, alpha, beta):
@@ -60,6 +106,299 @@ class ImageProcessor:
         new_image = np.clip(image * (contrast / 127 + 1) - contrast + brightness, 0, 255)
         return new_image.astype(np.uint8)
 
+    @staticmethod
+    def apply_lut(image, luts):
+        """Применение таблиц преобразования (channels, 256) к каждому каналу"""
+        luts = np.asarray(luts, dtype=np.uint8)
+        if image.ndim == 2:
+            return cv2.LUT(image, luts[0])
+        return cv2.LUT(image, np.ascontiguousarray(luts.T).reshape(256, 1, -1))
+
+    @staticmethod
+    def equalize_histogram(image, hist=None):
+        """Глобальное выравнивание гистограммы"""
+        if hist is None:
+            hist = ImageHistogram(image)
+        cdf = np.cumsum(hist.global_histogram(), axis=1)
+        total = cdf[:, -1:]
+        cdf_min = np.where(cdf > 0, cdf, total).min(axis=1, keepdims=True)
+        scale = np.where(total > cdf_min, 255.0 / np.maximum(total - cdf_min, 1), 0)
+        luts = np.rint((cdf - cdf_min) * scale)
+        # Однотонный канал оставляем без изменений
+        luts = np.where(total > cdf_min, luts, np.arange(256))
+        return ImageProcessor.apply_lut(image, np.clip(luts, 0, 255))
+
+    @staticmethod
+    def percentile_stretch(image, low=1.0, high=99.0, hist=None):
+        """Линейное контрастирование с alpha и beta, найденными по процентилям гистограммы"""
+        if hist is None:
+            hist = ImageHistogram(image)
+        h = hist.global_histogram()
+        cdf = np.cumsum(h, axis=1) / np.maximum(h.sum(axis=1, keepdims=True), 1)
+        levels = np.arange(256, dtype=np.float64)
+        luts = []
+        for channel_cdf in cdf:
+            lo = np.searchsorted(channel_cdf, low / 100.0)
+            hi = np.searchsorted(channel_cdf, high / 100.0)
+            if hi <= lo:
+                luts.append(levels)
+                continue
+            alpha = 255.0 / (hi - lo)
+            beta = -lo * alpha
+            luts.append(levels * alpha + beta)
+        return ImageProcessor.apply_lut(image, np.clip(np.rint(luts), 0, 255))
+
+    @staticmethod
+    def clahe(image, clip_limit=2.0, tiles=8, hist=None):
+        """Адаптивное выравнивание гистограммы с ограничением контраста (CLAHE)"""
+        if hist is None:
+            hist = ImageHistogram(image)
+        tile_hist, rows, cols = hist.tile_histograms(tiles)
+
+        # Ограничение гистограмм тайлов и равномерное перераспределение излишка
+        tile_pixels = np.outer(np.diff(rows), np.diff(cols))[:, :, None, None]
+        limit = np.maximum(clip_limit * tile_pixels / 256.0, 1.0)
+        clipped = np.minimum(tile_hist, limit)
+        clipped += (tile_hist - clipped).sum(axis=-1, keepdims=True) / 256.0
+        luts = np.clip(np.rint(np.cumsum(clipped, axis=-1) * 255.0 / tile_pixels), 0, 255)
+
+        # Билинейная интерполяция между таблицами соседних тайлов по центрам тайлов.
+        # Пиксели между одними и теми же центрами используют одни и те же четыре таблицы,
+        # поэтому каждая такая область обрабатывается быстрым cv2.LUT целиком.
+        height, width = image.shape[:2]
+        last_row, last_col = len(rows) - 2, len(cols) - 2
+        gy = np.interp(np.arange(height), (rows[:-1] + rows[1:] - 1) / 2.0, np.arange(last_row + 1))
+        gx = np.interp(np.arange(width), (cols[:-1] + cols[1:] - 1) / 2.0, np.arange(last_col + 1))
+        y0 = np.floor(gy).astype(np.intp)
+        x0 = np.floor(gx).astype(np.intp)
+        wy = (gy - y0).astype(np.float32)[:, None]
+        wx = (gx - x0).astype(np.float32)[None, :]
+        if image.ndim == 3:
+            wy, wx = wy[..., None], wx[..., None]
+
+        result = np.empty_like(image)
+        for i in range(last_row + 1):
+            r = slice(*np.searchsorted(y0, [i, i + 1]))
+            if r.start == r.stop:
+                continue
+            i1 = min(i + 1, last_row)
+            for j in range(last_col + 1):
+                c = slice(*np.searchsorted(x0, [j, j + 1]))
+                if c.start == c.stop:
+                    continue
+                j1 = min(j + 1, last_col)
+                block = image[r, c]
+                top = (ImageProcessor.apply_lut(block, luts[i, j]) * (1 - wx[:, c])
+                       + ImageProcessor.apply_lut(block, luts[i, j1]) * wx[:, c])
+                bottom = (ImageProcessor.apply_lut(block, luts[i1, j]) * (1 - wx[:, c])
+                          + ImageProcessor.apply_lut(block, luts[i1, j1]) * wx[:, c])
+                result[r, c] = np.rint(top * (1 - wy[r]) + bottom * wy[r])
+        return result
+
+    @staticmethod
+    def make_kernel(kernel='gaussian', size=5, sigma=0.0):
+        """Ядро свёртки по имени или из строки вида '0,-1,0;-1,5,-1;0,-1,0'"""
+        if not isinstance(kernel, str):
+            return np.asarray(kernel, dtype=np.float32)
+        size = max(1, int(size))
+        if kernel == 'box':
+            return np.full((size, size), 1.0 / (size * size), dtype=np.float32)
+        if kernel == 'gaussian':
+            g = cv2.getGaussianKernel(size, sigma, ktype=cv2.CV_32F)
+            return g @ g.T
+        if kernel == 'disk':
+            r = (size - 1) / 2.0
+            y, x = np.mgrid[:size, :size] - r
+            disk = (x * x + y * y <= r * r + 0.5).astype(np.float32)
+            return disk / disk.sum()
+        if kernel in ('sharpen', 'edge'):
+            delta = np.zeros((size, size), dtype=np.float32)
+            delta[size // 2, size // 2] = 1.0
+            blur = ImageProcessor.make_kernel('gaussian', size, sigma)
+            return 2 * delta - blur if kernel == 'sharpen' else delta - blur
+        if kernel in ('sobel_x', 'sobel_y'):
+            dx, dy = (1, 0) if kernel == 'sobel_x' else (0, 1)
+            kx, ky = cv2.getDerivKernels(dx, dy, max(3, size | 1), ktype=cv2.CV_32F)
+            return ky @ kx.T
+        rows = [row.split(',') for row in kernel.split(';')]
+        if len({len(row) for row in rows}) != 1:
+            raise ValueError(f"Строки ядра разной длины: {kernel}")
+        return np.array(rows, dtype=np.float32)
+
+    @staticmethod
+    def separate_kernel(kernel, tolerance=1e-6):
+        """Разложение ядра ранга 1 на столбец и строку, иначе None"""
+        one = np.ones((1, 1), dtype=np.float32)
+        if kernel.shape[0] == 1:
+            return one, kernel
+        if kernel.shape[1] == 1:
+            return kernel, one
+        u, s, vt = np.linalg.svd(kernel.astype(np.float64))
+        if s[1] > tolerance * s[0]:
+            return None
+        scale = np.sqrt(s[0])
+        return (u[:, :1] * scale).astype(np.float32), (vt[:1, :] * scale).astype(np.float32)
+
+    @staticmethod
+    def fft_correlate(image, kernel):
+        """
+        Корреляция через БПФ с отражением границ, как у cv2.filter2D.
+        Спектр ядра (упакованный формат CCS) считается один раз и используется для всех каналов.
+        Каналы преобразуются по очереди: если сложить их в одну высокую плоскость,
+        спектр ядра пришлось бы считать на ней же, и весь путь выходит примерно в 1.4 раза медленнее.
+        """
+        kh, kw = kernel.shape
+        height, width = image.shape[:2]
+        top, left = kh // 2, kw // 2
+        padded = cv2.copyMakeBorder(image, top, kh - 1 - top, left, kw - 1 - left, cv2.BORDER_REFLECT_101)
+        planes = padded.reshape(padded.shape[0], padded.shape[1], -1)
+        shape = (cv2.getOptimalDFTSize(planes.shape[0]), cv2.getOptimalDFTSize(planes.shape[1]))
+
+        kernel_padded = np.zeros(shape, dtype=np.float32)
+        kernel_padded[:kh, :kw] = kernel[::-1, ::-1]
+        kernel_spectrum = cv2.dft(kernel_padded, nonzeroRows=kh)
+
+        result = np.empty((height, width, planes.shape[2]), dtype=np.float32)
+        plane = np.zeros(shape, dtype=np.float32)
+        for c in range(planes.shape[2]):
+            plane[:planes.shape[0], :planes.shape[1]] = planes[..., c]
+            spectrum = cv2.dft(plane, nonzeroRows=planes.shape[0])
+            full = cv2.idft(cv2.mulSpectrums(spectrum, kernel_spectrum, 0),
+                            flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+            result[..., c] = full[kh - 1:kh - 1 + height, kw - 1:kw - 1 + width]
+        return result.reshape(image.shape)
+
+    @staticmethod
+    def convolve(image, kernel, method='auto', absolute=False):
+        """
+        Свёртка с выбором пути: 'separable' — два одномерных прохода, 'direct' — cv2.filter2D,
+        'fft' — через БПФ. 'auto' выбирает разделимый путь, если ядро разделимо, и БПФ для больших ядер.
+        """
+        kernel = np.asarray(kernel, dtype=np.float32)
+        if method == 'auto':
+            if ImageProcessor.separate_kernel(kernel) is not None:
+                method = 'separable'
+            elif kernel.size >= FFT_KERNEL_AREA:
+                method = 'fft'
+            else:
+                method = 'direct'
+
+        if method == 'separable':
+            parts = ImageProcessor.separate_kernel(kernel)
+            if parts is None:
+                raise ValueError("Ядро не разделимо")
+            column, row = parts
+            result = cv2.sepFilter2D(image, cv2.CV_32F, row.ravel(), column.ravel())
+        elif method == 'fft':
+            result = ImageProcessor.fft_correlate(image, kernel)
+        elif method == 'direct':
+            result = cv2.filter2D(image, cv2.CV_32F, kernel)
+        else:
+            raise ValueError(f"Неизвестный способ свёртки: {method}")
+
+        if absolute:
+            result = np.abs(result)
+        return np.clip(np.rint(result), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def apply_filter(image, kernel='gaussian', size=5, sigma=0.0, method='auto'):
+        """Пространственный фильтр: размытие, резкость, выделение границ или своё ядро"""
+        absolute = kernel in EDGE_KERNELS
+        return ImageProcessor.convolve(image, ImageProcessor.make_kernel(kernel, size, sigma), method, absolute)
+
+
+# Неразделимые ядра от этой площади сворачиваются через БПФ
+FFT_KERNEL_AREA = 15 * 15
+
+# Ядра, дающие знакопеременный отклик: результат берётся по модулю
+EDGE_KERNELS = ('edge', 'sobel_x', 'sobel_y')
+
+FILTER_KERNELS = ('box', 'gaussian', 'disk', 'sharpen', 'edge', 'sobel_x', 'sobel_y')
+
+
+# Операции, доступные из командной строки и потайловой обработки
+OPERATIONS = {
+    'linear_contrast': ImageProcessor.linear_contrast,
+    'brightness_contrast': ImageProcessor.apply_brightness_contrast,
+    'equalize': ImageProcessor.equalize_histogram,
+    'clahe': ImageProcessor.clahe,
+    'percentile_stretch': ImageProcessor.percentile_stretch,
+    'filter': ImageProcessor.apply_filter,
+}
+
+# Операции, принимающие готовую гистограмму (параметр hist)
+HISTOGRAM_OPERATIONS = {
+    ImageProcessor.equalize_histogram,
+    ImageProcessor.clahe,
+    ImageProcessor.percentile_stretch,
+}
+
+
+class TiledImageProcessor:
+    """Потайловая обработка больших изображений, отображённых в память (.npy или сырой файл)"""
+
+    def __init__(self, tile_size=1024):
+        self.tile_size = tile_size
+
+    @staticmethod
+    def open_image(path, shape=None, dtype=np.uint8):
+        """Открытие изображения без загрузки в оперативную память"""
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r')
+        if shape is None:
+            raise ValueError("Для сырого файла необходимо указать размеры (height, width[, channels])")
+        return np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape))
+
+    @staticmethod
+    def create_image(path, shape, dtype=np.uint8):
+        """Создание выходного файла, отображённого в память"""
+        if path.endswith('.npy'):
+            return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+        return np.memmap(path, dtype=dtype, mode='w+', shape=tuple(shape))
+
+    @staticmethod
+    def preview(image, max_side=1000):
+        """Уменьшенная копия для отображения: читаются только нужные строки и столбцы"""
+        step = max(1, -(-max(image.shape[:2]) // max_side))
+        return np.ascontiguousarray(image[::step, ::step])
+
+    def tiles(self, shape):
+        height, width = shape[:2]
+        for y in range(0, height, self.tile_size):
+            for x in range(0, width, self.tile_size):
+                yield (slice(y, min(y + self.tile_size, height)),
+                       slice(x, min(x + self.tile_size, width)))
+
+    def process(self, src, dst_path, operation, **params):
+        """Применение операции ImageProcessor к каждому тайлу с записью результата на диск"""
+        if operation is ImageProcessor.clahe:
+            raise ValueError("CLAHE не поддерживается в потайловом режиме")
+        if operation in HISTOGRAM_OPERATIONS and 'hist' not in params:
+            # Гистограмма всего файла, чтобы все тайлы получили одно и то же преобразование
+            params['hist'] = ImageHistogram(src)
+        halo = 0
+        if operation is ImageProcessor.apply_filter:
+            # Тайл читается с полями на радиус ядра, чтобы на стыках не было швов
+            kernel = ImageProcessor.make_kernel(params.get('kernel', 'gaussian'),
+                                                params.get('size', 5), params.get('sigma', 0.0))
+            halo = max(kernel.shape) // 2
+
+        height, width = src.shape[:2]
+        dst = self.create_image(dst_path, src.shape)
+        last_row = None
+        for rows, cols in self.tiles(src.shape):
+            # Сбрасываем грязные страницы после каждой полосы тайлов, чтобы память не росла
+            if last_row is not None and rows.start != last_row:
+                dst.flush()
+            last_row = rows.start
+            top, left = max(rows.start - halo, 0), max(cols.start - halo, 0)
+            bottom, right = min(rows.stop + halo, height), min(cols.stop + halo, width)
+            tile = np.ascontiguousarray(src[top:bottom, left:right])
+            result = operation(tile, **params)
+            dst[rows, cols] = result[rows.start - top:rows.stop - top, cols.start - left:cols.stop - left]
+        dst.flush()
+        return dst
+
 
 class ImageProcessingApp(QMainWindow):
     def __init__(self):
@@ -113,7 +452,10 @@ class ImageProcessingApp(QMainWindow):
         """)
 
         self.original_image = None
+        self.original_hist = None
         self.processed_image = None
+        # Масштабированные буферы для меток: живут столько же, сколько показанный QImage
+        self.display_cache = {}
         self.init_ui()
 
     def init_ui(self):
@@ -145,7 +487,11 @@ class ImageProcessingApp(QMainWindow):
         self.method_combo = QComboBox()
         self.method_combo.addItems([
             "Linear Contrast",
-            "Apply Brightness and Contrast"
+            "Apply Brightness and Contrast",
+            "Histogram Equalization",
+            "CLAHE",
+            "Percentile Stretch",
+            "Filter"
         ])
         self.method_combo.currentIndexChanged.connect(self.update_controls)
         layout.addWidget(self.method_combo)
@@ -158,6 +504,14 @@ class ImageProcessingApp(QMainWindow):
         process_btn.clicked.connect(self.process_image)
         layout.addWidget(process_btn)
 
+        large_file_btn = QPushButton("Process Large File")
+        large_file_btn.clicked.connect(self.process_large_file)
+        layout.addWidget(large_file_btn)
+
+        save_preset_btn = QPushButton("Save Preset")
+        save_preset_btn.clicked.connect(self.save_preset)
+        layout.addWidget(save_preset_btn)
+
         layout.addStretch()
         group_box.setLayout(layout)
         return group_box
@@ -171,6 +525,7 @@ class ImageProcessingApp(QMainWindow):
         original_layout.addWidget(QLabel("Original Image:"))
         self.original_label = QLabel()
         self.original_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.original_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
         original_layout.addWidget(self.original_label)
         layout.addWidget(original_container, 0, 0)
 
@@ -179,6 +534,7 @@ class ImageProcessingApp(QMainWindow):
         processed_layout.addWidget(QLabel("Processed Image:"))
         self.processed_label = QLabel()
         self.processed_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.processed_label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
         processed_layout.addWidget(self.processed_label)
         layout.addWidget(processed_container, 0, 1)
 
@@ -245,51 +601,239 @@ class ImageProcessingApp(QMainWindow):
             contrast_layout.addWidget(self.contrast_slider)
             self.params_layout.addWidget(contrast_container)
 
+        elif method == "CLAHE":
+            clip_container = QWidget()
+            clip_layout = QVBoxLayout(clip_container)
+            self.clip_slider = QSlider(Qt.Orientation.Horizontal)
+            self.clip_slider.setRange(10, 80)
+            self.clip_slider.setValue(20)
+            clip_layout.addWidget(QLabel("Clip limit:"))
+            clip_layout.addWidget(self.clip_slider)
+            self.params_layout.addWidget(clip_container)
+
+            tiles_container = QWidget()
+            tiles_layout = QVBoxLayout(tiles_container)
+            self.tiles_spin = QSpinBox()
+            self.tiles_spin.setRange(2, 16)
+            self.tiles_spin.setValue(8)
+            tiles_layout.addWidget(QLabel("Tiles:"))
+            tiles_layout.addWidget(self.tiles_spin)
+            self.params_layout.addWidget(tiles_container)
+
+        elif method == "Percentile Stretch":
+            low_container = QWidget()
+            low_layout = QVBoxLayout(low_container)
+            self.low_slider = QSlider(Qt.Orientation.Horizontal)
+            self.low_slider.setRange(0, 20)
+            self.low_slider.setValue(1)
+            low_layout.addWidget(QLabel("Low percentile:"))
+            low_layout.addWidget(self.low_slider)
+            self.params_layout.addWidget(low_container)
+
+            high_container = QWidget()
+            high_layout = QVBoxLayout(high_container)
+            self.high_slider = QSlider(Qt.Orientation.Horizontal)
+            self.high_slider.setRange(80, 100)
+            self.high_slider.setValue(99)
+            high_layout.addWidget(QLabel("High percentile:"))
+            high_layout.addWidget(self.high_slider)
+            self.params_layout.addWidget(high_container)
+
+        elif method == "Filter":
+            kernel_container = QWidget()
+            kernel_layout = QVBoxLayout(kernel_container)
+            self.kernel_combo = QComboBox()
+            self.kernel_combo.addItems(list(FILTER_KERNELS) + ["custom"])
+            kernel_layout.addWidget(QLabel("Kernel:"))
+            kernel_layout.addWidget(self.kernel_combo)
+            self.params_layout.addWidget(kernel_container)
+
+            size_container = QWidget()
+            size_layout = QVBoxLayout(size_container)
+            self.kernel_size_spin = QSpinBox()
+            self.kernel_size_spin.setRange(1, 63)
+            self.kernel_size_spin.setSingleStep(2)
+            self.kernel_size_spin.setValue(5)
+            size_layout.addWidget(QLabel("Kernel size:"))
+            size_layout.addWidget(self.kernel_size_spin)
+            self.params_layout.addWidget(size_container)
+
+            custom_container = QWidget()
+            custom_layout = QVBoxLayout(custom_container)
+            self.custom_kernel_edit = QLineEdit("0,-1,0;-1,5,-1;0,-1,0")
+            custom_layout.addWidget(QLabel("Custom kernel (rows separated by ';'):"))
+            custom_layout.addWidget(self.custom_kernel_edit)
+            self.params_layout.addWidget(custom_container)
+
+            filter_method_container = QWidget()
+            filter_method_layout = QVBoxLayout(filter_method_container)
+            self.filter_method_combo = QComboBox()
+            self.filter_method_combo.addItems(["auto", "direct", "separable", "fft"])
+            filter_method_layout.addWidget(QLabel("Convolution:"))
+            filter_method_layout.addWidget(self.filter_method_combo)
+            self.params_layout.addWidget(filter_method_container)
+
     def load_image(self):
         file_name, _ = QFileDialog.getOpenFileName(
             self, "Open Image", "", "Image Files (*.png *.jpg *.bmp)"
         )
         if file_name:
             self.original_image = cv2.imread(file_name)
+            self.original_hist = ImageHistogram(self.original_image)
             self.display_image(self.original_image, self.original_label)
-            self.original_histogram.update_histogram(self.original_image)
+            self.original_histogram.update_histogram(self.original_image, self.original_hist)
             self.processed_image = None
             self.processed_label.clear()
+            self.display_cache.pop(self.processed_label, None)
             self.processed_histogram.ax.clear()
             self.processed_histogram.canvas.draw()
 
-    def process_image(self):
-        if self.original_image is None:
-            return
-
+    def current_operation(self):
+        """Выбранная операция и её параметры из элементов управления"""
         method = self.method_combo.currentText()
 
         if method == "Linear Contrast":
             alpha = self.alpha_slider.value() / 10.0
             beta = self.beta_slider.value()
-            self.processed_image = ImageProcessor.linear_contrast(self.original_image, alpha, beta)
+            return ImageProcessor.linear_contrast, {'alpha': alpha, 'beta': beta}
 
         elif method == "Apply Brightness and Contrast":
             brightness = self.brightness_slider.value()
             contrast = self.contrast_slider.value()
-            self.processed_image = ImageProcessor.apply_brightness_contrast(self.original_image, brightness, contrast)
+            return ImageProcessor.apply_brightness_contrast, {'brightness': brightness, 'contrast': contrast}
+
+        elif method == "Histogram Equalization":
+            return ImageProcessor.equalize_histogram, {}
+
+        elif method == "CLAHE":
+            clip_limit = self.clip_slider.value() / 10.0
+            tiles = self.tiles_spin.value()
+            return ImageProcessor.clahe, {'clip_limit': clip_limit, 'tiles': tiles}
+
+        elif method == "Percentile Stretch":
+            low = self.low_slider.value()
+            high = self.high_slider.value()
+            return ImageProcessor.percentile_stretch, {'low': low, 'high': high}
+
+        elif method == "Filter":
+            kernel = self.kernel_combo.currentText()
+            if kernel == "custom":
+                kernel = self.custom_kernel_edit.text()
+            size = self.kernel_size_spin.value()
+            convolution = self.filter_method_combo.currentText()
+            return ImageProcessor.apply_filter, {'kernel': kernel, 'size': size, 'method': convolution}
+
+        return None, {}
+
+    def process_image(self):
+        if self.original_image is None:
+            return
+
+        operation, params = self.current_operation()
+        if operation in HISTOGRAM_OPERATIONS:
+            params['hist'] = self.original_hist
+        if operation is not None:
+            try:
+                self.processed_image = operation(self.original_image, **params)
+            except ValueError as error:
+                # Неразделимое ядро для 'separable' или неразборчивое своё ядро: исключение
+                # в слоте закрыло бы окно, поэтому сообщаем о нём в строке состояния
+                self.statusBar().showMessage(f"Ошибка: {error}")
+                return
+            self.statusBar().clearMessage()
 
         if self.processed_image is not None:
             self.display_image(self.processed_image, self.processed_label)
             self.processed_histogram.update_histogram(self.processed_image)
 
-    def display_image(self, image, label):
-        image = imutils.resize(image, width=500)
+    def save_preset(self):
+        """Сохранение текущих параметров для пакетной обработки (python -m lab3 batch)"""
+        operation, params = self.current_operation()
+        if operation is None:
+            return
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Save Preset", "", "Presets (*.json)"
+        )
+        if file_name:
+            method = next(name for name, op in OPERATIONS.items() if op is operation)
+            with open(file_name, 'w', encoding='utf-8') as f:
+                json.dump({'method': method, 'params': params}, f, indent=2)
+
+    def process_large_file(self):
+        operation, params = self.current_operation()
+        if operation is None:
+            return
+        if operation is ImageProcessor.clahe:
+            # TiledImageProcessor.process отказывается от CLAHE; проверяем до выбора файлов
+            self.statusBar().showMessage("CLAHE не поддерживается в потайловом режиме")
+            return
+
+        src_name, _ = QFileDialog.getOpenFileName(
+            self, "Open Large Image", "", "NumPy Arrays (*.npy)"
+        )
+        if not src_name:
+            return
+        dst_name, _ = QFileDialog.getSaveFileName(
+            self, "Save Processed Image", "", "NumPy Arrays (*.npy)"
+        )
+        if not dst_name:
+            return
+
+        src = TiledImageProcessor.open_image(src_name)
+        try:
+            dst = TiledImageProcessor().process(src, dst_name, operation, **params)
+        except ValueError as error:
+            self.statusBar().showMessage(f"Ошибка: {error}")
+            return
+        self.statusBar().clearMessage()
+
+        # В окне показываем только уменьшенные копии, целиком файлы в память не читаются
+        self.original_image = TiledImageProcessor.preview(src)
+        self.processed_image = TiledImageProcessor.preview(dst)
+        self.original_hist = ImageHistogram(self.original_image)
+        self.display_image(self.original_image, self.original_label)
+        self.original_histogram.update_histogram(self.original_image, self.original_hist)
+        self.display_image(self.processed_image, self.processed_label)
+        self.processed_histogram.update_histogram(self.processed_image)
+
+    @staticmethod
+    def display_size(image, label):
+        """Размер, в который изображение помещается в метку с сохранением пропорций"""
         height, width = image.shape[:2]
+        if label.width() < 2 or label.height() < 2:
+            # Метка ещё не размещена, показываем как раньше — шириной 500
+            return 500, max(1, round(height * 500 / width))
+        scale = min(label.width() / width, label.height() / height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
 
-        if len(image.shape) == 3:
-            bytes_per_line = 3 * width
-            q_image = QImage(image.data, width, height, bytes_per_line,
-                           QImage.Format.Format_RGB888).rgbSwapped()
+    @staticmethod
+    def display_buffer(image):
+        """Непрерывный буфер и формат QImage, подходящие для изображения без дополнительных копий"""
+        if image.ndim == 2:
+            return np.ascontiguousarray(image), QImage.Format.Format_Grayscale8
+        if image.shape[2] == 4:
+            return cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA), QImage.Format.Format_RGBA8888
+        if BGR_FORMAT is not None:
+            return np.ascontiguousarray(image), BGR_FORMAT
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), QImage.Format.Format_RGB888
+
+    def display_image(self, image, label):
+        size = self.display_size(image, label)
+        cached = self.display_cache.get(label)
+        if cached is not None and cached['source'] is image and cached['size'] == size:
+            # То же изображение и тот же размер метки — масштабировать заново не нужно
+            return
+
+        width, height = size
+        if size != (image.shape[1], image.shape[0]):
+            interpolation = cv2.INTER_AREA if width < image.shape[1] else cv2.INTER_LINEAR
+            image_scaled = cv2.resize(image, size, interpolation=interpolation)
         else:
-            bytes_per_line = width
-            q_image = QImage(image.data, width, height, bytes_per_line,
-                           QImage.Format.Format_Grayscale8)
+            image_scaled = image
+
+        buffer, image_format = self.display_buffer(image_scaled)
+        q_image = QImage(buffer.data, width, height, buffer.strides[0], image_format)
+        self.display_cache[label] = {'source': image, 'size': size, 'buffer': buffer, 'image': q_image}
 
         pixmap = QPixmap.fromImage(q_image)
         label.setPixmap(pixmap)
@@ -303,11 +847,267 @@ class ImageProcessingApp(QMainWindow):
             self.display_image(self.processed_image, self.processed_label)
 
 
-if __name__ == '__main__':
+def parse_params(items):
+    """Разбор параметров вида key=value"""
+    params = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        try:
+            params[key] = int(value)
+        except ValueError:
+            try:
+                params[key] = float(value)
+            except ValueError:
+                params[key] = value
+    return params
+
+
+def run_tiled(args):
+    processor = TiledImageProcessor(tile_size=args.tile_size)
+    src = processor.open_image(args.input, shape=args.shape)
+    processor.process(src, args.output, OPERATIONS[args.method], **parse_params(args.param))
+    return 0
+
+
+def glob_root(pattern):
+    """Каталог шаблона до первой части с подстановкой: пути результатов отсчитываются от него"""
+    root = os.path.dirname(pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or os.curdir
+
+
+def read_image(path):
+    """Чтение и декодирование файла, возвращает (изображение, время)"""
+    start = time.perf_counter()
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    return image, time.perf_counter() - start
+
+
+def write_image(image, path):
+    """Кодирование и запись файла, возвращает (удалось ли, время)"""
+    start = time.perf_counter()
+    try:
+        ok, encoded = cv2.imencode(os.path.splitext(path)[1], image)
+        if ok:
+            encoded.tofile(path)
+    except (cv2.error, OSError):
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+def batch_worker(paths, input_root, output_dir, method, params):
+    """
+    Обработка группы файлов в одном процессе. Чтение следующего файла и запись
+    предыдущего идут в фоновых потоках (cv2 отпускает GIL), пока считается текущий.
+    Результат пишется по тому же пути относительно input_root, что и исходный файл,
+    так что одноимённые файлы из разных подкаталогов не затирают друг друга.
+    """
+    operation = OPERATIONS[method]
+    stats = {'decode': 0.0, 'compute': 0.0, 'encode': 0.0, 'images': 0, 'pixels': 0, 'failed': []}
+
+    def finish_write(future, path, pixels):
+        # Файл считается обработанным, только когда результат записан
+        ok, elapsed = future.result()
+        stats['encode'] += elapsed
+        if ok:
+            stats['images'] += 1
+            stats['pixels'] += pixels
+        else:
+            stats['failed'].append(path)
+
+    with ThreadPoolExecutor(max_workers=2) as io:
+        pending_read = io.submit(read_image, paths[0])
+        pending_write = None
+        for i, path in enumerate(paths):
+            image, elapsed = pending_read.result()
+            stats['decode'] += elapsed
+            if i + 1 < len(paths):
+                pending_read = io.submit(read_image, paths[i + 1])
+            if image is None:
+                stats['failed'].append(path)
+                continue
+
+            # Ошибка на одном файле (например, цветная операция для серого снимка)
+            # не должна обрывать всю пачку и терять статистику остальных
+            start = time.perf_counter()
+            try:
+                result = operation(image, **params)
+            except (cv2.error, ValueError, TypeError, IndexError):
+                stats['failed'].append(path)
+                continue
+            finally:
+                stats['compute'] += time.perf_counter() - start
+
+            if pending_write is not None:
+                finish_write(*pending_write)
+            target = os.path.join(output_dir, os.path.relpath(path, input_root))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            pending_write = (io.submit(write_image, result, target),
+                             path, image.shape[0] * image.shape[1])
+
+        if pending_write is not None:
+            finish_write(*pending_write)
+
+    return stats
+
+
+def run_batch(args):
+    method, params = args.method, {}
+    if args.preset:
+        with open(args.preset, encoding='utf-8') as f:
+            preset = json.load(f)
+        # Параметры пресета относятся к его методу: с другим методом из --method они не нужны
+        if not method:
+            method = preset['method']
+            params.update(preset.get('params', {}))
+    params.update(parse_params(args.param))
+    if method not in OPERATIONS:
+        print(f"Неизвестный метод: {method}", file=sys.stderr)
+        return 2
+
+    paths = sorted(glob.glob(args.input, recursive=True))
+    if not paths:
+        print(f"Нет файлов по шаблону {args.input}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    chunks = [paths[i:i + args.chunk_size] for i in range(0, len(paths), args.chunk_size)]
+    total = {'decode': 0.0, 'compute': 0.0, 'encode': 0.0, 'images': 0, 'pixels': 0, 'failed': []}
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(batch_worker, chunk, glob_root(args.input), args.output, method, params)
+                   for chunk in chunks]
+        for future in futures:
+            stats = future.result()
+            for key in total:
+                total[key] += stats[key]
+    wall = time.perf_counter() - start
+
+    for path in total['failed']:
+        print(f"Не удалось обработать {path}", file=sys.stderr)
+
+    images, megapixels = total['images'], total['pixels'] / 1e6
+    for stage in ('decode', 'compute', 'encode'):
+        busy = max(total[stage], 1e-9)
+        print(f"{stage:8s}: {busy:8.2f} s busy, {images / busy:8.1f} img/s, "
+              f"{megapixels / busy:8.1f} MP/s per worker")
+    print(f"{'total':8s}: {images} images in {wall:.2f} s, {images / wall:.1f} img/s, "
+          f"{megapixels / wall:.1f} MP/s with {args.workers or os.cpu_count()} workers")
+    return 1 if total['failed'] else 0
+
+
+def benchmark_histogram(image, tweaks):
+    """Автоматический контраст: кэшированная гистограмма против пересчёта при каждом вызове"""
+    cases = [
+        ('equalize', ImageProcessor.equalize_histogram, [{} for _ in range(tweaks)]),
+        ('clahe', ImageProcessor.clahe, [{'clip_limit': 1.0 + 0.25 * i} for i in range(tweaks)]),
+        ('percentile', ImageProcessor.percentile_stretch,
+         [{'low': 0.5 * (i % 10), 'high': 100 - 0.5 * (i % 10)} for i in range(tweaks)]),
+    ]
+    for name, operation, sweep in cases:
+        start = time.perf_counter()
+        for params in sweep:
+            operation(image, **params)
+        naive = (time.perf_counter() - start) / len(sweep)
+
+        start = time.perf_counter()
+        hist = ImageHistogram(image)
+        for params in sweep:
+            operation(image, hist=hist, **params)
+        cached = (time.perf_counter() - start) / len(sweep)
+
+        print(f"{name:12s}: naive {naive * 1e3:8.2f} ms/call, cached {cached * 1e3:8.2f} ms/call, "
+              f"x{naive / cached:.2f}")
+
+
+def benchmark_filters(image, repeat):
+    """
+    Прямая свёртка, два одномерных прохода и БПФ на ядрах разного размера.
+    cv2.filter2D сам переходит на DFT для ядер от 11x11, это видно по столбцу direct.
+    """
+    print(f"{'kernel':10s}{'size':>6s}{'direct':>12s}{'separable':>12s}{'fft':>12s}   max diff")
+    for name in ('gaussian', 'disk'):
+        for size in (3, 5, 9, 15, 25, 41, 63):
+            kernel = ImageProcessor.make_kernel(name, size)
+            separable = ImageProcessor.separate_kernel(kernel) is not None
+            timings, results = {}, {}
+            for method in ('direct', 'separable', 'fft'):
+                if method == 'separable' and not separable:
+                    continue
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    results[method] = ImageProcessor.convolve(image, kernel, method)
+                timings[method] = (time.perf_counter() - start) / repeat
+            diff = max(int(np.abs(r.astype(int) - results['direct']).max()) for r in results.values())
+            cells = ''.join(f"{timings[m] * 1e3:9.2f} ms" if m in timings else f"{'-':>12s}"
+                            for m in ('direct', 'separable', 'fft'))
+            print(f"{name:10s}{size:6d}{cells}   {diff}")
+
+
+def run_benchmark(args):
+    width, height = args.size
+    rng = np.random.default_rng(args.seed)
+    # Низкоконтрастное изображение с плавным градиентом и шумом
+    gradient = np.linspace(80, 160, width)[None, :, None]
+    noise = rng.normal(0, 12, size=(height, width, 3))
+    image = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+
+    print(f"image {width}x{height}")
+    if args.suite == 'histogram':
+        benchmark_histogram(image, args.tweaks)
+    elif args.suite == 'filters':
+        benchmark_filters(image, args.repeat)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Image Processing Application")
+    subparsers = parser.add_subparsers(dest='command')
+
+    tiled_parser = subparsers.add_parser('tiled', help="потайловая обработка большого .npy или сырого файла")
+    tiled_parser.add_argument('input')
+    tiled_parser.add_argument('output')
+    tiled_parser.add_argument('--method', choices=sorted(OPERATIONS), required=True)
+    tiled_parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE')
+    tiled_parser.add_argument('--shape', type=int, nargs='+', metavar='N',
+                              help="размеры сырого файла: height width [channels]")
+    tiled_parser.add_argument('--tile-size', type=int, default=1024)
+
+    batch_parser = subparsers.add_parser('batch', help="пакетная обработка файлов по шаблону")
+    batch_parser.add_argument('input', help="шаблон входных файлов, например 'photos/*.jpg'")
+    batch_parser.add_argument('output', help="каталог для результатов")
+    batch_parser.add_argument('--method', choices=sorted(OPERATIONS))
+    batch_parser.add_argument('--param', action='append', default=[], metavar='KEY=VALUE')
+    batch_parser.add_argument('--preset', help="JSON-файл, сохранённый кнопкой Save Preset")
+    batch_parser.add_argument('--workers', type=int, default=None)
+    batch_parser.add_argument('--chunk-size', type=int, default=16)
+
+    bench_parser = subparsers.add_parser('bench', help="замеры производительности операций")
+    bench_parser.add_argument('suite', choices=['histogram', 'filters'])
+    bench_parser.add_argument('--size', type=int, nargs=2, default=[1920, 1080], metavar=('WIDTH', 'HEIGHT'))
+    bench_parser.add_argument('--tweaks', type=int, default=20, help="число подборов параметров (histogram)")
+    bench_parser.add_argument('--repeat', type=int, default=3, help="число повторов каждого замера (filters)")
+    bench_parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'tiled':
+        return run_tiled(args)
+    if args.command == 'batch':
+        return run_batch(args)
+    if args.command == 'bench':
+        return run_benchmark(args)
+
     app = QApplication(sys.argv)
 
     plt.style.use('dark_background')
 
     window = ImageProcessingApp()
     window.show()
-    sys.exit(app.exec())
+    return app.exec()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
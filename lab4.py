@@ -1,20 +1,45 @@
-import pygame
+from __future__ import annotations
+
+import sys
+import os
 import math
+import zlib
+import struct
+import itertools
 import time
-from typing import List, Tuple
+import json
+import random
+import argparse
+import platform
+import statistics
+import tracemalloc
+from typing import Iterator, List, Tuple
 import numpy as np
 
-pygame.init()
+# Без pygame доступны только Rasterizer, Framebuffer и консольные команды
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+if pygame is not None:
+    pygame.init()
 
 # Настройки экрана
 WIDTH = 1200
 HEIGHT = 800
 CELL_SIZE = 20
+MIN_CELL_SIZE = 2
+MAX_CELL_SIZE = 80
+MIN_GRID_SPACING = 6  # при более мелких клетках линии сетки рисуются только с шагом подписей
+LABEL_SPACING = 80  # минимальное расстояние между подписями осей в пикселях
+SPATIAL_BUCKET = 16  # сторона корзины пространственного индекса в клетках
 GRID_COLOR = (220, 220, 220)
 AXIS_COLOR = (50, 50, 50)
 TEXT_COLOR = (30, 30, 30)
 POINT_COLOR = (0, 0, 0)
 LINE_COLOR = (0, 0, 0)
+HIGHLIGHT_COLOR = (220, 60, 60)
 BACKGROUND = (245, 245, 245)
 
 # Настройки кнопок
@@ -25,7 +50,7 @@ BUTTON_COLOR = (200, 200, 200)
 BUTTON_HOVER_COLOR = (170, 170, 170)
 BUTTON_ACTIVE_COLOR = (100, 149, 237)  # Cornflower Blue
 
-FONT_NAME = pygame.font.match_font('arial')
+FONT_NAME = pygame.font.match_font('arial') if pygame is not None else None
 
 class Button:
     def __init__(self, text, x, y, width, height, algorithm):
@@ -36,6 +61,7 @@ class Button:
         self.hover = False
         self.active = False
         self.font = pygame.font.Font(FONT_NAME, 20)
+        self.text_surfaces = {}
     
     def draw(self, screen):
         # Изменение цвета при наведении и активном состоянии
@@ -49,8 +75,11 @@ class Button:
         # Рисование закругленного прямоугольника
         pygame.draw.rect(screen, color, self.rect, border_radius=8)
         
-        # Рендеринг текста
-        text_surf = self.font.render(self.text, True, (255, 255, 255) if self.active else TEXT_COLOR)
+        # Рендеринг текста (кэшируется для обычного и активного состояния)
+        if self.active not in self.text_surfaces:
+            self.text_surfaces[self.active] = self.font.render(
+                self.text, True, (255, 255, 255) if self.active else TEXT_COLOR)
+        text_surf = self.text_surfaces[self.active]
         text_rect = text_surf.get_rect(center=self.rect.center)
         screen.blit(text_surf, text_rect)
     
@@ -67,120 +96,50 @@ class Button:
         self.active = (current_algorithm == self.algorithm)
         return None
 
-class RasterizationApp:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("Растровые алгоритмы")
-        self.font = pygame.font.Font(FONT_NAME, 20)
-        self.clock = pygame.time.Clock()
-        self.offset_x = WIDTH // 2
-        self.offset_y = HEIGHT // 2
-        self.start_point = None
-        self.end_point = None
-        self.is_drawing = False
-        self.current_algorithm = "step"
-        self.show_smoothed = False
-        self.execution_time = 0
-        self.buttons = self.create_buttons()
-        self.drawn_lines = []
-        self.drawn_points = []
-    
-    def create_buttons(self):
-        buttons = []
-        algorithms = [
-            ('Step', 'step'),
-            ('DDA', 'dda'),
-            ('Bresenham', 'bresenham'),
-            ('Circle', 'circle'),
-            ('Castle-Pitway', 'castle'),
-            ("Wu's Line", 'smooth'),
-            ('Clear', 'clear')
-        ]
-        x = BUTTON_MARGIN
-        y = BUTTON_MARGIN
-        for text, algo in algorithms:
-            button = Button(text, x, y, BUTTON_WIDTH, BUTTON_HEIGHT, algo)
-            buttons.append(button)
-            y += BUTTON_HEIGHT + BUTTON_MARGIN
-        return buttons
-    
-    def clear(self):
-        self.start_point = None
-        self.end_point = None
-        self.is_drawing = False
-        self.execution_time = 0
-        self.drawn_lines = []
-        self.drawn_points = []
-    
-    def screen_to_grid(self, x: int, y: int) -> Tuple[int, int]:
-        return ((x - self.offset_x) // CELL_SIZE,
-                (self.offset_y - y) // CELL_SIZE)
-    
-    def grid_to_screen(self, x: int, y: int) -> Tuple[int, int]:
-        return (x * CELL_SIZE + self.offset_x,
-                self.offset_y - y * CELL_SIZE)
-    
-    def draw_grid(self):
-        self.screen.fill(BACKGROUND)
-        
-        # Рисование сетки
-        for x in range(0, WIDTH, CELL_SIZE):
-            color = GRID_COLOR if x != self.offset_x else AXIS_COLOR
-            pygame.draw.line(self.screen, color, (x, 0), (x, HEIGHT))
-            if x != self.offset_x and (x - self.offset_x) % (CELL_SIZE * 5) == 0:
-                grid_x = (x - self.offset_x) // CELL_SIZE
-                text = self.font.render(str(grid_x), True, TEXT_COLOR)
-                self.screen.blit(text, (x - self.font.size(str(grid_x))[0] // 2, self.offset_y + 5))
-        
-        for y in range(0, HEIGHT, CELL_SIZE):
-            color = GRID_COLOR if y != self.offset_y else AXIS_COLOR
-            pygame.draw.line(self.screen, color, (0, y), (WIDTH, y))
-            if y != self.offset_y and (self.offset_y - y) % (CELL_SIZE * 5) == 0:
-                grid_y = (self.offset_y - y) // CELL_SIZE
-                text = self.font.render(str(grid_y), True, TEXT_COLOR)
-                self.screen.blit(text, (self.offset_x + 5, y - self.font.get_height() // 2))
-        
-        # Рисование осей
-        pygame.draw.line(self.screen, AXIS_COLOR, (self.offset_x, 0),
-                         (self.offset_x, HEIGHT), 2)
-        pygame.draw.line(self.screen, AXIS_COLOR, (0, self.offset_y),
-                         (WIDTH, self.offset_y), 2)
-    
-    def draw_buttons(self):
-        # Рисование боковой панели
-        panel_width = BUTTON_WIDTH + 2 * BUTTON_MARGIN
-        pygame.draw.rect(self.screen, (230, 230, 230), (0, 0, panel_width, HEIGHT))
-        
-        for button in self.buttons:
-            button.draw(self.screen)
-    
-    def draw_coordinates(self):
-        info_y = HEIGHT - 80
-        padding = 10
-        
-        if self.start_point:
-            start_text = f"Start: ({self.start_point[0]}, {self.start_point[1]})"
-            text_surface = self.font.render(start_text, True, TEXT_COLOR)
-            self.screen.blit(text_surface, (padding, info_y))
-        
-        if self.end_point:
-            end_text = f"End: ({self.end_point[0]}, {self.end_point[1]})"
-            text_surface = self.font.render(end_text, True, TEXT_COLOR)
-            self.screen.blit(text_surface, (padding, info_y + 30))
-        
-        # Отображение времени выполнения, если есть
-        if self.execution_time > 0:
-            time_text = self.font.render(f"Time: {self.execution_time:.2f} µs", True, TEXT_COLOR)
-            self.screen.blit(time_text, (padding, info_y + 60))
-    
-    def draw_pixel(self, pos: Tuple[int, int, float]):
-        x, y, alpha = pos
-        screen_x, screen_y = self.grid_to_screen(x, y)
-        color = (*LINE_COLOR, int(255 * alpha))
-        surface = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-        pygame.draw.rect(surface, color, (0, 0, CELL_SIZE, CELL_SIZE))
-        self.screen.blit(surface, (screen_x, screen_y - CELL_SIZE))
-    
+class Rasterizer:
+    """Алгоритмы растеризации без зависимости от окна pygame"""
+
+    ALGORITHMS = {
+        'step': 'step_algorithm',
+        'dda': 'dda_algorithm',
+        'bresenham': 'bresenham_algorithm',
+        'circle': 'bresenham_circle',
+        'castle': 'castle_pitway_algorithm',
+        'smooth': 'wu_line_algorithm',
+        'smooth_circle': 'wu_circle_algorithm',
+        'thick': 'thick_line_algorithm',
+    }
+
+    BATCH_ALGORITHMS = {
+        'step': 'batch_step',
+        'dda': 'batch_dda',
+        'bresenham': 'batch_bresenham',
+        'circle': 'batch_circle',
+        'castle': 'batch_castle_pitway',
+        'smooth': 'batch_wu',
+    }
+
+    STREAM_ALGORITHMS = {
+        'step': 'iter_step',
+        'dda': 'iter_dda',
+        'bresenham': 'iter_bresenham',
+        'circle': 'iter_circle',
+        'castle': 'iter_castle_pitway',
+        'smooth': 'iter_wu',
+        'smooth_circle': 'iter_wu_circle',
+        'thick': 'iter_thick',
+    }
+
+    # Заливаемые фигуры, заданные двумя точками (центр и точка на границе)
+    SPAN_ALGORITHMS = {
+        'fill_circle': 'iter_filled_circle',
+        'fill_ellipse': 'iter_filled_ellipse',
+    }
+
+    def rasterize(self, algorithm: str, start: Tuple[int, int], end: Tuple[int, int]) -> List[Tuple[int, int, float]]:
+        name = self.ALGORITHMS.get(algorithm)
+        return getattr(self, name)(*start, *end) if name else []
+
     def step_algorithm(self, x0: int, y0: int, x1: int, y1: int) -> List[Tuple[int, int, float]]:
         points = []
         dx = x1 - x0
@@ -387,6 +346,1295 @@ class RasterizationApp:
 
         return points
 
+    def wu_circle_algorithm(self, x0: int, y0: int, x1: int, y1: int) -> List[Tuple[int, int, float]]:
+        # Окружность Ву: в октанте точная координата sqrt(r^2 - x^2) делит покрытие между двумя соседними клетками
+        points = []
+        r2 = (x1 - x0) ** 2 + (y1 - y0) ** 2
+        x = 0
+        while 2 * x * x <= r2:
+            y = math.sqrt(r2 - x * x)
+            lower = math.floor(y)
+            for cx, cy, alpha in ((x, lower, 1 - (y - lower)), (x, lower + 1, y - lower)):
+                points.extend([
+                    (x0 + cx, y0 + cy, alpha), (x0 + cy, y0 + cx, alpha),
+                    (x0 - cy, y0 + cx, alpha), (x0 - cx, y0 + cy, alpha),
+                    (x0 - cx, y0 - cy, alpha), (x0 - cy, y0 - cx, alpha),
+                    (x0 + cy, y0 - cx, alpha), (x0 + cx, y0 - cy, alpha)
+                ])
+            x += 1
+
+        return points
+
+    line_width = 3
+
+    def thick_line_algorithm(self, x0: int, y0: int, x1: int, y1: int) -> List[Tuple[int, int, float]]:
+        # Толстая линия по Ву: в каждом столбце основной оси закрыт отрезок [yc - h, yc + h]
+        # высотой line_width * sqrt(1 + k^2), крайние клетки получают долю перекрытия
+        points = []
+        steep = abs(y1 - y0) > abs(x1 - x0)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if x0 > x1:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+
+        dx = x1 - x0
+        dy = y1 - y0
+        gradient = dy / dx if dx != 0 else 0
+        half = self.line_width * math.hypot(dx, dy) / (2 * dx) if dx != 0 else self.line_width / 2
+
+        for x in range(x0, x1 + 1):
+            center = y0 + gradient * (x - x0)
+            low, high = center - half, center + half
+            for y in range(math.floor(low + 0.5), math.floor(high + 0.5) + 1):
+                coverage = min(high, y + 0.5) - max(low, y - 0.5)
+                if coverage > 0:
+                    points.append((y, x, min(coverage, 1.0)) if steep else (x, y, min(coverage, 1.0)))
+
+        return points
+
+    # Потоковые варианты: только целочисленная арифметика, пиксели выдаются по одному
+    # в виде (x, y, alpha), где alpha — целое 0..255, без построения промежуточных списков.
+
+    def iter_dda(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        dx = x1 - x0
+        dy = y1 - y0
+        steps = max(abs(dx), abs(dy))
+        if steps == 0:
+            yield x0, y0, 255
+            return
+
+        # Координата k-го шага x0 + k*dx/steps, округлённая как round() в dda_algorithm:
+        # половина — к чётному. Удвоенные числители с добавленной половиной
+        # накапливаются в целых, нулевой остаток означает половину
+        denominator = 2 * steps
+        acc_x = 2 * x0 * steps + steps
+        acc_y = 2 * y0 * steps + steps
+        for _ in range(steps + 1):
+            x, rest_x = divmod(acc_x, denominator)
+            y, rest_y = divmod(acc_y, denominator)
+            yield x - (x & 1 if rest_x == 0 else 0), y - (y & 1 if rest_y == 0 else 0), 255
+            acc_x += 2 * dx
+            acc_y += 2 * dy
+
+    def iter_step(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        return self.iter_dda(x0, y0, x1, y1)
+
+    def iter_bresenham(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        dx = abs(x1 - x0)
+        dy = abs(y1 - y0)
+        x, y = x0, y0
+        step_x = 1 if x1 > x0 else -1
+        step_y = 1 if y1 > y0 else -1
+
+        # Та же ошибка, что и в bresenham_algorithm, но удвоенная, чтобы не было dx / 2
+        if dx > dy:
+            err = dx
+            while x != x1:
+                yield x, y, 255
+                err -= 2 * dy
+                if err < 0:
+                    y += step_y
+                    err += 2 * dx
+                x += step_x
+        else:
+            err = dy
+            while y != y1:
+                yield x, y, 255
+                err -= 2 * dx
+                if err < 0:
+                    x += step_x
+                    err += 2 * dy
+                y += step_y
+        yield x, y, 255
+
+    def iter_circle(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        x = math.isqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
+        y = 0
+        err = 0
+        while x >= y:
+            yield x0 + x, y0 + y, 255
+            yield x0 + y, y0 + x, 255
+            yield x0 - y, y0 + x, 255
+            yield x0 - x, y0 + y, 255
+            yield x0 - x, y0 - y, 255
+            yield x0 - y, y0 - x, 255
+            yield x0 + y, y0 - x, 255
+            yield x0 + x, y0 - y, 255
+            y += 1
+            err += 1 + 2 * y
+            if 2 * (err - x) + 1 > 0:
+                x -= 1
+                err += 1 - 2 * x
+
+    def iter_castle_pitway(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        steep = abs(y1 - y0) > abs(x1 - x0)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if x0 > x1:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+
+        # Ошибка в единицах 1 / (2*dx): условие error >= 0.5 превращается в error >= dx
+        dx = x1 - x0
+        dy = abs(y1 - y0)
+        step_y = 1 if y1 > y0 else -1
+        error = 0
+        y = y0
+        for x in range(x0, x1 + 1):
+            yield (y, x, 255) if steep else (x, y, 255)
+            error += 2 * dy
+            if dx and error >= dx:
+                y += step_y
+                error -= 2 * dx
+
+    def iter_wu(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        steep = abs(y1 - y0) > abs(x1 - x0)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if x0 > x1:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+
+        def plot(x: int, y: int, alpha: int) -> Tuple[int, int, int]:
+            return (y, x, alpha) if steep else (x, y, alpha)
+
+        # Концы целочисленные, поэтому покрытие концевого пикселя — половина
+        yield plot(x0, y0, 127)
+        yield plot(x0, y0 + 1, 0)
+        yield plot(x1, y1, 127)
+        yield plot(x1, y1 + 1, 0)
+
+        # Дробная часть intery хранится как числитель frac / dx в диапазоне [0, dx)
+        dx = x1 - x0
+        dy = y1 - y0
+        y, frac = divmod(y0 * dx + dy, dx) if dx else (y0, 0)
+        for x in range(x0 + 1, x1):
+            upper = frac * 255 // dx
+            yield plot(x, y, 255 - upper)
+            yield plot(x, y + 1, upper)
+            frac += dy
+            if frac >= dx:
+                y += 1
+                frac -= dx
+            elif frac < 0:
+                y -= 1
+                frac += dx
+
+    def iter_wu_circle(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        r2 = (x1 - x0) ** 2 + (y1 - y0) ** 2
+        x = 0
+        while 2 * x * x <= r2:
+            # 256 * sqrt(r^2 - x^2) с округлением вниз: целая часть — клетка, остаток — покрытие соседней
+            y, frac = divmod(math.isqrt((r2 - x * x) << 16), 256)
+            upper = frac * 255 // 256
+            for cx, cy, alpha in ((x, y, 255 - upper), (x, y + 1, upper)):
+                yield x0 + cx, y0 + cy, alpha
+                yield x0 + cy, y0 + cx, alpha
+                yield x0 - cy, y0 + cx, alpha
+                yield x0 - cx, y0 + cy, alpha
+                yield x0 - cx, y0 - cy, alpha
+                yield x0 - cy, y0 - cx, alpha
+                yield x0 + cy, y0 - cx, alpha
+                yield x0 + cx, y0 - cy, alpha
+            x += 1
+
+    def iter_thick(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        steep = abs(y1 - y0) > abs(x1 - x0)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+        if x0 > x1:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+        return self.thick_columns(steep, x0, y0, x1, y1, 0, x1 - x0)
+
+    def thick_columns(self, steep: bool, x0: int, y0: int, x1: int, y1: int,
+                      first: int, last: int) -> Iterator[Tuple[int, int, int]]:
+        # Столбцы first..last упорядоченного отрезка. Всё в единицах 1 / (256 * dx): центр столбца k —
+        # 256 * (y0 * dx + dy * k), полувысота — 128 * line_width * sqrt(dx^2 + dy^2)
+        dx = x1 - x0
+        dy = y1 - y0
+        unit = 256 * max(dx, 1)
+        half = math.isqrt(self.line_width ** 2 * (dx * dx + dy * dy) << 14) if dx else 128 * self.line_width
+        for k in range(first, last + 1):
+            center = 256 * (y0 * dx + dy * k) if dx else 256 * y0
+            low, high = center - half, center + half
+            # Клетка y занимает [y * unit - unit / 2, y * unit + unit / 2]
+            for y in range((2 * low + unit) // (2 * unit), (2 * high + unit) // (2 * unit) + 1):
+                coverage = min(high, y * unit + unit // 2) - max(low, y * unit - unit // 2)
+                if coverage > 0:
+                    alpha = min(coverage * 255 // unit, 255)
+                    yield (y, x0 + k, alpha) if steep else (x0 + k, y, alpha)
+
+    def iter_pixels(self, algorithm: str, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int]]:
+        return getattr(self, self.STREAM_ALGORITHMS[algorithm])(x0, y0, x1, y1)
+
+    # Отсечение по окну: у отрезочных алгоритмов основная координата меняется ровно на 1 за шаг,
+    # а вторая отходит от идеальной прямой меньше чем на клетку. Поэтому видимые шаги находятся
+    # заранее, а пиксель шага k считается в замкнутой форме, без прохода по невидимой части.
+
+    @staticmethod
+    def step_range(x0: int, y0: int, x1: int, y1: int, steps: int, rect: Tuple[int, int, int, int],
+                   margin: int = 2) -> Tuple[int, int]:
+        """Шаги k из 0..steps, при которых точка x0 + k*(x1 - x0)/steps прямой лежит в rect, расширенном на margin"""
+        low, high = 0.0, float(steps)
+        for start, delta, lo, hi in ((x0, x1 - x0, rect[0] - margin, rect[2] + margin),
+                                     (y0, y1 - y0, rect[1] - margin, rect[3] + margin)):
+            if delta == 0:
+                if not lo <= start <= hi:
+                    return 0, -1
+                continue
+            t0, t1 = (lo - start) * steps / delta, (hi - start) * steps / delta
+            low, high = max(low, min(t0, t1)), min(high, max(t0, t1))
+        return max(0, math.floor(low)), min(steps, math.ceil(high))
+
+    def iter_visible_steps(self, algorithm: str, x0: int, y0: int, x1: int, y1: int,
+                           rect: Tuple[int, int, int, int]) -> Iterator[Tuple[int, int, int]]:
+        if algorithm in ('step', 'dda'):
+            dx, dy = x1 - x0, y1 - y0
+            steps = max(abs(dx), abs(dy))
+            if steps == 0:
+                yield x0, y0, 255
+                return
+            first, last = self.step_range(x0, y0, x1, y1, steps, rect)
+            for k in range(first, last + 1):
+                # Как в iter_dda: половина округляется к чётному
+                x, rest_x = divmod(2 * (x0 * steps + k * dx) + steps, 2 * steps)
+                y, rest_y = divmod(2 * (y0 * steps + k * dy) + steps, 2 * steps)
+                yield x - (x & 1 if rest_x == 0 else 0), y - (y & 1 if rest_y == 0 else 0), 255
+            return
+
+        if algorithm == 'bresenham':
+            dx, dy = abs(x1 - x0), abs(y1 - y0)
+            step_x = 1 if x1 > x0 else -1
+            step_y = 1 if y1 > y0 else -1
+            major, minor = (dx, dy) if dx > dy else (dy, dx)
+            if major == 0:
+                yield x0, y0, 255
+                return
+            first, last = self.step_range(x0, y0, x1, y1, major, rect)
+            for k in range(first, last + 1):
+                # Как в batch_bresenham: число шагов по второй оси после k шагов по основной
+                m = -((major - 2 * k * minor) // (2 * major))
+                along_x, along_y = (k, m) if dx > dy else (m, k)
+                yield x0 + along_x * step_x, y0 + along_y * step_y, 255
+            return
+
+        steep = abs(y1 - y0) > abs(x1 - x0)
+        if steep:
+            x0, y0, x1, y1 = y0, x0, y1, x1
+            rect = (rect[1], rect[0], rect[3], rect[2])
+        if x0 > x1:
+            x0, x1, y0, y1 = x1, x0, y1, y0
+        dx = x1 - x0
+        dy = y1 - y0
+
+        def plot(x: int, y: int, alpha: int) -> Tuple[int, int, int]:
+            return (y, x, alpha) if steep else (x, y, alpha)
+
+        if algorithm == 'castle':
+            if dx == 0:
+                yield plot(x0, y0, 255)
+                return
+            step_y = 1 if dy > 0 else -1
+            first, last = self.step_range(x0, y0, x1, y1, dx, rect)
+            for k in range(first, last + 1):
+                yield plot(x0 + k, y0 + step_y * ((2 * abs(dy) * k + dx) // (2 * dx)), 255)
+        elif algorithm == 'thick':
+            first, last = self.step_range(x0, y0, x1, y1, dx, rect, margin=2 + self.line_width)
+            yield from self.thick_columns(steep, x0, y0, x1, y1, first, last)
+        elif algorithm == 'smooth':
+            yield plot(x0, y0, 127)
+            yield plot(x0, y0 + 1, 0)
+            yield plot(x1, y1, 127)
+            yield plot(x1, y1 + 1, 0)
+            if dx < 2:
+                return
+            first, last = self.step_range(x0, y0, x1, y1, dx, rect)
+            for k in range(max(first, 1), min(last, dx - 1) + 1):
+                y, frac = divmod(y0 * dx + dy * k, dx)
+                upper = frac * 255 // dx
+                yield plot(x0 + k, y, 255 - upper)
+                yield plot(x0 + k, y + 1, upper)
+
+    def iter_clipped(self, algorithm: str, x0: int, y0: int, x1: int, y1: int,
+                     rect: Tuple[int, int, int, int]) -> Iterator[Tuple[int, int, int]]:
+        """Пиксели потокового варианта, попадающие в rect = (x_min, y_min, x_max, y_max)"""
+        x_min, y_min, x_max, y_max = rect
+        if algorithm in ('circle', 'smooth_circle'):
+            radius = math.isqrt((x1 - x0) ** 2 + (y1 - y0) ** 2) + 1
+            if x0 + radius < x_min or x0 - radius > x_max or y0 + radius < y_min or y0 - radius > y_max:
+                return
+            pixels = self.iter_pixels(algorithm, x0, y0, x1, y1)
+        else:
+            pixels = self.iter_visible_steps(algorithm, x0, y0, x1, y1, rect)
+        for x, y, alpha in pixels:
+            if x_min <= x <= x_max and y_min <= y <= y_max:
+                yield x, y, alpha
+
+    def iter_spans(self, algorithm: str, x0: int, y0: int, x1: int, y1: int,
+                   rect: Tuple[int, int, int, int] = None) -> Iterator[Tuple[int, int, int, int]]:
+        """Горизонтальные участки (x_start, x_end, y, alpha) из соседних пикселей одной строки"""
+        span = None
+        if rect is None:
+            pixels = self.iter_pixels(algorithm, x0, y0, x1, y1)
+        else:
+            pixels = self.iter_clipped(algorithm, x0, y0, x1, y1, rect)
+        for x, y, alpha in pixels:
+            if span and y == span[2] and alpha == span[3] and span[0] - 1 <= x <= span[1] + 1:
+                span[0] = min(span[0], x)
+                span[1] = max(span[1], x)
+                continue
+            if span:
+                yield tuple(span)
+            span = [x, x, y, alpha]
+        if span:
+            yield tuple(span)
+
+    def pixel_bound(self, algorithm: str, x0: int, y0: int, x1: int, y1: int) -> int:
+        """Верхняя оценка числа пикселей для потокового варианта"""
+        length = max(abs(x1 - x0), abs(y1 - y0))
+        if algorithm == 'circle':
+            return 8 * (math.isqrt((x1 - x0) ** 2 + (y1 - y0) ** 2) + 1)
+        if algorithm == 'smooth':
+            return 2 * length + 4
+        if algorithm == 'smooth_circle':
+            return 16 * (math.isqrt((x1 - x0) ** 2 + (y1 - y0) ** 2) + 1)
+        if algorithm == 'thick':
+            return (length + 1) * (3 * self.line_width // 2 + 3)
+        return length + 1
+
+    def rasterize_into(self, algorithm: str, x0: int, y0: int, x1: int, y1: int, out, offset: int = 0) -> int:
+        """
+        Запись пикселей тройками x, y, alpha в буфер вызывающего (array('i') или массив NumPy)
+        начиная с offset. Возвращает число записанных пикселей.
+        """
+        if len(out) - offset < 3 * self.pixel_bound(algorithm, x0, y0, x1, y1):
+            raise ValueError("Буфер слишком мал для отрезка")
+        i = offset
+        for x, y, alpha in self.iter_pixels(algorithm, x0, y0, x1, y1):
+            out[i] = x
+            out[i + 1] = y
+            out[i + 2] = alpha
+            i += 3
+        return (i - offset) // 3
+
+    # Заливка фигур: выдаются горизонтальные участки (x_start, x_end, y, alpha),
+    # которые рисуются целиком, а не по пикселю.
+
+    def iter_filled_circle(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int, int]]:
+        # Полуширина строк берётся из того же целочисленного обхода, что и у bresenham_circle,
+        # поэтому заливка совпадает с контуром
+        radius = math.isqrt((x1 - x0) ** 2 + (y1 - y0) ** 2)
+        extent = [0] * (radius + 1)
+        x, y, err = radius, 0, 0
+        while x >= y:
+            extent[y] = max(extent[y], x)
+            extent[x] = max(extent[x], y)
+            y += 1
+            err += 1 + 2 * y
+            if 2 * (err - x) + 1 > 0:
+                x -= 1
+                err += 1 - 2 * x
+        for row in range(-radius, radius + 1):
+            half = extent[abs(row)]
+            yield x0 - half, x0 + half, y0 + row, 255
+
+    def iter_filled_ellipse(self, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int, int]]:
+        # Центр в (x0, y0), полуоси |x1 - x0| и |y1 - y0|; полуширина строки — наибольшее x
+        # с x^2 * ry^2 + y^2 * rx^2 <= rx^2 * ry^2
+        rx, ry = abs(x1 - x0), abs(y1 - y0)
+        if ry == 0:
+            yield x0 - rx, x0 + rx, y0, 255
+            return
+        for row in range(-ry, ry + 1):
+            half = math.isqrt(rx * rx * (ry * ry - row * row) // (ry * ry))
+            yield x0 - half, x0 + half, y0 + row, 255
+
+    def iter_filled_polygon(self, vertices: List[Tuple[int, int]]) -> Iterator[Tuple[int, int, int, int]]:
+        """Построчная заливка многоугольника с таблицей рёбер и списком активных рёбер (чётно-нечётное правило)"""
+        n = len(vertices)
+        # Таблица рёбер: [y_min, y_max, числитель x, приращение числителя, знаменатель];
+        # x ребра на строке y равен числителю, делённому на знаменатель (y_max - y_min)
+        edges = []
+        for i in range(n):
+            (xa, ya), (xb, yb) = vertices[i], vertices[(i + 1) % n]
+            if ya == yb:
+                continue
+            if ya > yb:
+                xa, ya, xb, yb = xb, yb, xa, ya
+            edges.append([ya, yb, xa * (yb - ya), xb - xa, yb - ya])
+        edges.sort(key=lambda edge: edge[0])
+
+        active = []
+        i = 0
+        y_end = max((edge[1] for edge in edges), default=0)
+        for y in range(edges[0][0] if edges else 0, y_end):
+            while i < len(edges) and edges[i][0] == y:
+                active.append(edges[i])
+                i += 1
+            # Ребро активно на полуинтервале [y_min, y_max), чтобы общая вершина не считалась дважды
+            active = [edge for edge in active if edge[1] > y]
+            active.sort(key=lambda edge: edge[2] / edge[4])
+            for left, right in zip(active[::2], active[1::2]):
+                x_start = -(-left[2] // left[4])
+                x_end = right[2] // right[4]
+                if x_start <= x_end:
+                    yield x_start, x_end, y, 255
+            for edge in active:
+                edge[2] += edge[3]
+
+        # Контур поверх заливки: закрывает верхнюю строку и правые границы, отброшенные правилом выше
+        for i in range(n):
+            (xa, ya), (xb, yb) = vertices[i], vertices[(i + 1) % n]
+            yield from self.iter_spans('bresenham', xa, ya, xb, yb)
+
+    def iter_shape_spans(self, algorithm: str, x0: int, y0: int, x1: int, y1: int) -> Iterator[Tuple[int, int, int, int]]:
+        return getattr(self, self.SPAN_ALGORITHMS[algorithm])(x0, y0, x1, y1)
+
+    # Пакетные варианты: принимают массив отрезков N x 4 (x0, y0, x1, y1) и возвращают
+    # плоские массивы пикселей (M x 2) и покрытия (M), а также смещения (N + 1):
+    # точки i-го отрезка лежат в [offsets[i], offsets[i + 1]) в том же порядке, что и у скалярных версий.
+
+    BATCH_CHUNK = 4096
+
+    @staticmethod
+    def segments_array(segments) -> np.ndarray:
+        return np.asarray(segments, dtype=np.int64).reshape(-1, 4)
+
+    @staticmethod
+    def ragged_offsets(counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Смещения отрезков, номер отрезка и номер шага для каждой выходной точки
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        segment = np.repeat(np.arange(len(counts)), counts)
+        step = np.arange(offsets[-1]) - offsets[segment]
+        return offsets, segment, step
+
+    @classmethod
+    def accumulate(cls, start: np.ndarray, increment: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """
+        Значения start, start + inc, (start + inc) + inc, ... для каждого отрезка подряд.
+        Суммирование последовательное, как в цикле x += inc, поэтому округление совпадает со скалярным.
+        """
+        result = np.empty(int(counts.sum()), dtype=np.float64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        order = np.argsort(counts, kind='stable')
+        # Отрезки близкой длины обрабатываются вместе, чтобы не раздувать выравнивание строк
+        for chunk in range(0, len(order), cls.BATCH_CHUNK):
+            rows = order[chunk:chunk + cls.BATCH_CHUNK]
+            rows = rows[counts[rows] > 0]
+            if len(rows) == 0:
+                continue
+            width = int(counts[rows].max())
+            values = np.empty((len(rows), width), dtype=np.float64)
+            values[:, 0] = start[rows]
+            values[:, 1:] = increment[rows, None]
+            np.cumsum(values, axis=1, out=values)
+            valid = np.arange(width) < counts[rows, None]
+            target = offsets[rows, None] + np.arange(width)
+            result[target[valid]] = values[valid]
+        return result
+
+    def batch_step(self, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return self.batch_dda(segments)
+
+    def batch_dda(self, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        x0, y0, x1, y1 = self.segments_array(segments).T
+        dx, dy = x1 - x0, y1 - y0
+        steps = np.maximum(np.abs(dx), np.abs(dy))
+        safe = np.maximum(steps, 1)
+        counts = steps + 1
+        offsets, _, _ = self.ragged_offsets(counts)
+        xs = np.round(self.accumulate(x0.astype(np.float64), dx / safe, counts))
+        ys = np.round(self.accumulate(y0.astype(np.float64), dy / safe, counts))
+        pixels = np.stack([xs, ys], axis=1).astype(np.int64)
+        return pixels, np.ones(len(pixels)), offsets
+
+    def batch_bresenham(self, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        x0, y0, x1, y1 = self.segments_array(segments).T
+        dx, dy = np.abs(x1 - x0), np.abs(y1 - y0)
+        step_x = np.where(x1 > x0, 1, -1)
+        step_y = np.where(y1 > y0, 1, -1)
+        x_major = dx > dy
+        major, minor = np.where(x_major, dx, dy), np.where(x_major, dy, dx)
+
+        counts = major + 1
+        offsets, segment, i = self.ragged_offsets(counts)
+        major, minor = major[segment], minor[segment]
+        # Число шагов по второй оси после i шагов по основной: ошибка err = major/2 - i*minor + m*major
+        # остаётся в [0, major), откуда m = ceil((2*i*minor - major) / (2*major))
+        m = -((major - 2 * i * minor) // np.maximum(2 * major, 1))
+        along_x = np.where(x_major[segment], i, m)
+        along_y = np.where(x_major[segment], m, i)
+        pixels = np.stack([x0[segment] + along_x * step_x[segment],
+                           y0[segment] + along_y * step_y[segment]], axis=1)
+        return pixels, np.ones(len(pixels)), offsets
+
+    def batch_circle(self, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        cx, cy, px, py = self.segments_array(segments).T
+        x = np.hypot(px - cx, py - cy).astype(np.int64)
+        y = np.zeros_like(x)
+        err = np.zeros_like(x)
+        active = x >= y
+        columns, masks = [], []
+        # Все окружности шагают одновременно, каждая пока выполняется её условие x >= y
+        while active.any():
+            columns.append(x.copy())
+            masks.append(active.copy())
+            y = y + 1
+            err = err + 1 + 2 * y
+            outside = 2 * (err - x) + 1 > 0
+            x = x - outside
+            err = err + np.where(outside, 1 - 2 * x, 0)
+            active &= x >= y
+
+        n = len(cx)
+        if not columns:
+            return np.empty((0, 2), dtype=np.int64), np.empty(0), np.zeros(n + 1, dtype=np.int64)
+        xs = np.stack(columns, axis=1)
+        valid = np.stack(masks, axis=1)
+        ys = np.broadcast_to(np.arange(xs.shape[1]), xs.shape)
+        cx, cy = cx[:, None], cy[:, None]
+        octants_x = np.stack([cx + xs, cx + ys, cx - ys, cx - xs, cx - xs, cx - ys, cx + ys, cx + xs], axis=-1)
+        octants_y = np.stack([cy + ys, cy + xs, cy + xs, cy + ys, cy - ys, cy - xs, cy - xs, cy - ys], axis=-1)
+        pixels = np.stack([octants_x[valid].ravel(), octants_y[valid].ravel()], axis=1)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1) * 8, out=offsets[1:])
+        return pixels, np.ones(len(pixels)), offsets
+
+    @staticmethod
+    def oriented(segments: np.ndarray):
+        # Перестановка координат для крутых отрезков и упорядочивание концов по основной оси
+        x0, y0, x1, y1 = segments.T
+        steep = np.abs(y1 - y0) > np.abs(x1 - x0)
+        x0, y0, x1, y1 = (np.where(steep, y0, x0), np.where(steep, x0, y0),
+                          np.where(steep, y1, x1), np.where(steep, x1, y1))
+        swap = x0 > x1
+        x0, y0, x1, y1 = (np.where(swap, x1, x0), np.where(swap, y1, y0),
+                          np.where(swap, x0, x1), np.where(swap, y0, y1))
+        return steep, x0, y0, x1, y1
+
+    def batch_castle_pitway(self, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        steep, x0, y0, x1, y1 = self.oriented(self.segments_array(segments))
+        dx, dy = x1 - x0, y1 - y0
+        derror = np.abs(dy / np.where(dx != 0, dx, 1)) * (dx != 0)
+        step_y = np.where(y1 > y0, 1, -1)
+
+        counts = dx + 1
+        offsets, segment, i = self.ragged_offsets(counts)
+        minor = np.empty(len(segment), dtype=np.int64)
+        order = np.argsort(counts, kind='stable')
+        # Ошибка накапливается в float, поэтому шаги выполняются одновременно для всех отрезков,
+        # повторяя скалярные операции над ошибкой один в один
+        for chunk in range(0, len(order), self.BATCH_CHUNK):
+            rows = order[chunk:chunk + self.BATCH_CHUNK]
+            width = int(counts[rows].max())
+            y = y0[rows].copy()
+            error = np.zeros(len(rows))
+            values = np.empty((len(rows), width), dtype=np.int64)
+            for k in range(width):
+                values[:, k] = y
+                error += derror[rows]
+                moved = error >= 0.5
+                y += moved * step_y[rows]
+                error -= moved
+            valid = np.arange(width) < counts[rows, None]
+            target = offsets[rows, None] + np.arange(width)
+            minor[target[valid]] = values[valid]
+
+        major = x0[segment] + i
+        pixels = np.where(steep[segment, None], np.stack([minor, major], axis=1), np.stack([major, minor], axis=1))
+        return pixels, np.ones(len(pixels)), offsets
+
+    def batch_wu(self, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        steep, x0, y0, x1, y1 = self.oriented(self.segments_array(segments))
+        dx, dy = x1 - x0, y1 - y0
+        gradient = np.where(dx != 0, dy / np.where(dx != 0, dx, 1), 1.0)
+
+        def fpart(v):
+            return v - np.floor(v)
+
+        # Концы отрезка: по два пикселя на каждый, как в скалярной версии
+        xend1 = np.floor(x0 + 0.5)
+        yend1 = y0 + gradient * (xend1 - x0)
+        xgap1 = 1 - fpart(x0 + 0.5)
+        xend2 = np.floor(x1 + 0.5)
+        yend2 = y1 + gradient * (xend2 - x1)
+        xgap2 = fpart(x1 + 0.5)
+        ends_major = np.stack([xend1, xend1, xend2, xend2], axis=1)
+        ends_minor = np.stack([np.floor(yend1), np.floor(yend1) + 1, np.floor(yend2), np.floor(yend2) + 1], axis=1)
+        ends_alpha = np.stack([(1 - fpart(yend1)) * xgap1, fpart(yend1) * xgap1,
+                               (1 - fpart(yend2)) * xgap2, fpart(yend2) * xgap2], axis=1)
+
+        # Основной цикл: intery накапливается последовательно, по два пикселя на столбец
+        inner = np.maximum(xend2 - xend1 - 1, 0).astype(np.int64)
+        intery = self.accumulate(yend1 + gradient, gradient, inner)
+        _, inner_segment, inner_step = self.ragged_offsets(inner)
+        inner_major = np.repeat(xend1[inner_segment] + 1 + inner_step, 2)
+        inner_minor = np.stack([np.floor(intery), np.floor(intery) + 1], axis=1).ravel()
+        inner_alpha = np.stack([1 - fpart(intery), fpart(intery)], axis=1).ravel()
+
+        counts = 4 + 2 * inner
+        offsets, segment, i = self.ragged_offsets(counts)
+        major = np.empty(len(segment))
+        minor = np.empty(len(segment))
+        alpha = np.empty(len(segment))
+        is_end = i < 4
+        major[is_end], minor[is_end], alpha[is_end] = ends_major.ravel(), ends_minor.ravel(), ends_alpha.ravel()
+        major[~is_end], minor[~is_end], alpha[~is_end] = inner_major, inner_minor, inner_alpha
+
+        pixels = np.where(steep[segment, None], np.stack([minor, major], axis=1), np.stack([major, minor], axis=1))
+        return pixels.astype(np.int64), alpha, offsets
+
+    def batch_rasterize(self, algorithm: str, segments) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        name = self.BATCH_ALGORITHMS.get(algorithm)
+        if name:
+            return getattr(self, name)(segments)
+        # Без векторного варианта результаты скалярной версии склеиваются в тот же формат
+        results = [self.rasterize(algorithm, (x0, y0), (x1, y1))
+                   for x0, y0, x1, y1 in self.segments_array(segments).tolist()]
+        offsets = np.zeros(len(results) + 1, dtype=np.int64)
+        np.cumsum([len(points) for points in results], out=offsets[1:])
+        points = np.array([point for points in results for point in points], dtype=np.float64).reshape(-1, 3)
+        return points[:, :2].astype(np.int64), points[:, 2], offsets
+
+class Framebuffer:
+    """Растр клеток в массиве NumPy (height, width, 3) uint8 — рисование и экспорт без pygame"""
+
+    def __init__(self, width: int, height: int, origin: Tuple[int, int] = None,
+                 background: Tuple[int, int, int] = BACKGROUND, color: Tuple[int, int, int] = LINE_COLOR):
+        self.width = width
+        self.height = height
+        # Клетка (0, 0) сетки лежит в столбце origin[0] и строке origin[1] - 1, ось y направлена вверх
+        self.origin = tuple(origin) if origin is not None else (width // 2, height // 2)
+        self.color = tuple(color)
+        self.pixels = np.empty((height, width, 3), dtype=np.uint8)
+        self.pixels[...] = background
+
+    def to_buffer(self, x, y) -> Tuple[np.ndarray, np.ndarray]:
+        return self.origin[0] + np.asarray(x), self.origin[1] - 1 - np.asarray(y)
+
+    def blend(self, x, y, alpha, color: Tuple[int, int, int] = None):
+        """Наложение клеток цвета color с покрытием alpha (0..255) поверх буфера"""
+        cols, rows = self.to_buffer(x, y)
+        alpha = np.broadcast_to(np.asarray(alpha), cols.shape)
+        inside = (cols >= 0) & (cols < self.width) & (rows >= 0) & (rows < self.height)
+        if not inside.any():
+            return
+        index = rows[inside] * self.width + cols[inside]
+        # Последовательное наложение одного цвета сводится к одному наложению с покрытием
+        # 1 - prod(1 - a_i), поэтому повторяющиеся клетки (концы линий Ву) собираются заранее
+        cells, inverse = np.unique(index, return_inverse=True)
+        keep = np.ones(len(cells))
+        np.multiply.at(keep, inverse, 1.0 - alpha[inside] / 255.0)
+        flat = self.pixels.reshape(-1, 3)
+        source = np.array(color or self.color, dtype=np.float64)
+        blended = flat[cells] * keep[:, None] + source * (1.0 - keep[:, None])
+        flat[cells] = np.rint(blended).astype(np.uint8)
+
+    def fill_span(self, x_start: int, x_end: int, y: int, alpha: int = 255, color: Tuple[int, int, int] = None):
+        (left, right), row = self.to_buffer([x_start, x_end], y)
+        left, right = max(int(left), 0), min(int(right), self.width - 1)
+        if not 0 <= row < self.height or left > right:
+            return
+        if alpha == 255:
+            self.pixels[row, left:right + 1] = color or self.color
+        else:
+            self.blend(np.arange(x_start, x_end + 1), y, alpha, color)
+
+    def draw_spans(self, spans, color: Tuple[int, int, int] = None):
+        for x_start, x_end, y, alpha in spans:
+            self.fill_span(x_start, x_end, y, alpha, color)
+
+    def draw_lines(self, rasterizer: Rasterizer, algorithm: str, segments, color: Tuple[int, int, int] = None,
+                   width: int = None):
+        # Все отрезки одного алгоритма растеризуются одним пакетом
+        if width is not None and width != rasterizer.line_width:
+            rasterizer = Rasterizer()
+            rasterizer.line_width = width
+        pixels, coverage, _ = rasterizer.batch_rasterize(algorithm, segments)
+        self.blend(pixels[:, 0], pixels[:, 1], (255 * coverage).astype(np.uint8), color)
+
+    def draw_shape(self, rasterizer: Rasterizer, shape: dict):
+        """Фигура в формате сцены: {'algorithm', 'start', 'end'} или {'algorithm': 'fill_polygon', 'vertices'}"""
+        algorithm = shape['algorithm']
+        color = shape.get('color')
+        if algorithm == 'fill_polygon':
+            self.draw_spans(rasterizer.iter_filled_polygon([tuple(v) for v in shape['vertices']]), color)
+        elif algorithm in rasterizer.SPAN_ALGORITHMS:
+            self.draw_spans(rasterizer.iter_shape_spans(algorithm, *shape['start'], *shape['end']), color)
+        elif algorithm in rasterizer.ALGORITHMS:
+            self.draw_lines(rasterizer, algorithm, [(*shape['start'], *shape['end'])], color, shape.get('width'))
+        else:
+            raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+
+    def image(self, scale: int = 1) -> np.ndarray:
+        if scale == 1:
+            return self.pixels
+        return self.pixels.repeat(scale, axis=0).repeat(scale, axis=1)
+
+    def save(self, path: str, scale: int = 1):
+        """Сохранение в PNG или PPM (P6) по расширению файла"""
+        image = self.image(scale)
+        if path.lower().endswith('.ppm'):
+            data = b'P6\n%d %d\n255\n' % (image.shape[1], image.shape[0]) + image.tobytes()
+        else:
+            data = encode_png(image)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    # Несжатые фильтром строки RGB, сжатые zlib; хватает стандартной библиотеки
+    height, width = image.shape[:2]
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b''))
+
+
+def render_scene(scene: dict, rasterizer: Rasterizer = None) -> Framebuffer:
+    """Сцена JSON: {'width', 'height', 'origin', 'background', 'color', 'shapes': [...]}"""
+    rasterizer = rasterizer or Rasterizer()
+    framebuffer = Framebuffer(scene.get('width', WIDTH // CELL_SIZE), scene.get('height', HEIGHT // CELL_SIZE),
+                              scene.get('origin'), tuple(scene.get('background', BACKGROUND)),
+                              tuple(scene.get('color', LINE_COLOR)))
+
+    def batch_key(shape):
+        # Подряд идущие отрезки одного алгоритма, цвета и толщины рисуются одним пакетом; порядок фигур
+        # разного цвета сохраняется, так как от него зависит результат наложения
+        if shape['algorithm'] in Rasterizer.ALGORITHMS:
+            return shape['algorithm'], tuple(shape.get('color') or ()), shape.get('width')
+        return None
+
+    for key, group in itertools.groupby(scene.get('shapes', []), key=batch_key):
+        if key is None:
+            for shape in group:
+                framebuffer.draw_shape(rasterizer, shape)
+        else:
+            segments = np.array([(*shape['start'], *shape['end']) for shape in group], dtype=np.int64)
+            framebuffer.draw_lines(rasterizer, key[0], segments, key[1] or None, key[2])
+    return framebuffer
+
+
+def render_scenes(paths: List[str], output_dir: str, image_format: str = 'png', scale: int = 1) -> List[str]:
+    """Пакетная отрисовка: файл может содержать одну сцену или список сцен"""
+    rasterizer = Rasterizer()
+    written = []
+    os.makedirs(output_dir, exist_ok=True)
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            scenes = json.load(f)
+        if isinstance(scenes, dict):
+            scenes = [scenes]
+        stem = os.path.splitext(os.path.basename(path))[0]
+        for i, scene in enumerate(scenes):
+            name = scene.get('name') or (stem if len(scenes) == 1 else f"{stem}_{i}")
+            output = os.path.join(output_dir, f"{name}.{image_format}")
+            render_scene(scene, rasterizer).save(output, scene.get('scale', scale))
+            written.append(output)
+    return written
+
+
+class SpatialHash:
+    """
+    Равномерная сетка корзин bucket x bucket клеток. В корзине хранятся ключи фигур,
+    задевающих её, поэтому запрос области перебирает только корзины внутри неё.
+    """
+
+    def __init__(self, bucket: int = SPATIAL_BUCKET):
+        self.bucket = bucket
+        self.buckets = {}
+        self.entries = {}
+
+    def insert(self, key, pixels: np.ndarray):
+        self.add(key, np.unique(np.asarray(pixels).reshape(-1, 2) // self.bucket, axis=0))
+
+    def insert_spans(self, key, spans: np.ndarray):
+        # Участок строки задевает корзины от x_start // bucket до x_end // bucket
+        first = spans[:, 0] // self.bucket
+        counts = spans[:, 1] // self.bucket - first + 1
+        starts = np.cumsum(counts) - counts
+        columns = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(starts, counts)
+        rows = np.repeat(spans[:, 2] // self.bucket, counts)
+        self.add(key, np.unique(np.stack([columns, rows], axis=1), axis=0))
+
+    def add(self, key, cells: np.ndarray):
+        for cell in map(tuple, cells.tolist()):
+            self.buckets.setdefault(cell, set()).add(key)
+        self.entries[key] = cells
+
+    def remove(self, key):
+        for cell in map(tuple, self.entries.pop(key).tolist()):
+            keys = self.buckets[cell]
+            keys.discard(key)
+            if not keys:
+                del self.buckets[cell]
+
+    def query(self, rect: Tuple[int, int, int, int]) -> set:
+        """Ключи фигур, задевающих корзины области rect = (x_min, y_min, x_max, y_max)"""
+        x_min, y_min, x_max, y_max = (value // self.bucket for value in rect)
+        found = set()
+        if (x_max - x_min + 1) * (y_max - y_min + 1) > len(self.buckets):
+            # Область больше занятой части сетки: дешевле пройти по непустым корзинам
+            for (x, y), keys in self.buckets.items():
+                if x_min <= x <= x_max and y_min <= y <= y_max:
+                    found |= keys
+        else:
+            for x in range(x_min, x_max + 1):
+                for y in range(y_min, y_max + 1):
+                    keys = self.buckets.get((x, y))
+                    if keys:
+                        found |= keys
+        return found
+
+    def query_point(self, x: int, y: int) -> set:
+        return self.buckets.get((x // self.bucket, y // self.bucket), set())
+
+
+class CoverageBuffer:
+    """
+    Покрытие клеток окна view = (x_min, y_min, x_max, y_max). Пиксели, попавшие в одну клетку,
+    объединяются максимумом или суммой с насыщением, а не накладываются друг на друга.
+    """
+
+    MODES = ('max', 'sum')
+
+    def __init__(self, view: Tuple[int, int, int, int], mode: str = 'max'):
+        self.view = view
+        self.mode = mode
+        x_min, y_min, x_max, y_max = view
+        # Строка 0 — верхняя строка окна, как на экране
+        self.values = np.zeros((max(y_max - y_min + 1, 0), max(x_max - x_min + 1, 0)), dtype=np.uint32)
+
+    def clip(self, rect: Tuple[int, int, int, int]):
+        x_min, y_min = max(rect[0], self.view[0]), max(rect[1], self.view[1])
+        x_max, y_max = min(rect[2], self.view[2]), min(rect[3], self.view[3])
+        if x_min > x_max or y_min > y_max:
+            return None
+        return x_min, y_min, x_max, y_max
+
+    def block(self, rect: Tuple[int, int, int, int]) -> np.ndarray:
+        x_min, y_min, x_max, y_max = rect
+        return self.values[self.view[3] - y_max:self.view[3] - y_min + 1,
+                           x_min - self.view[0]:x_max - self.view[0] + 1]
+
+    def add_pixels(self, pixels: np.ndarray, alpha: np.ndarray, rect: Tuple[int, int, int, int] = None):
+        rect = self.clip(rect or self.view)
+        if rect is None or len(pixels) == 0:
+            return
+        x, y = pixels[:, 0], pixels[:, 1]
+        inside = (x >= rect[0]) & (x <= rect[2]) & (y >= rect[1]) & (y <= rect[3])
+        index = (self.view[3] - y[inside], x[inside] - self.view[0])
+        if self.mode == 'max':
+            np.maximum.at(self.values, index, alpha[inside])
+        else:
+            np.add.at(self.values, index, alpha[inside])
+
+    def add_span(self, x_start: int, x_end: int, y: int, alpha: int, rect: Tuple[int, int, int, int] = None):
+        rect = self.clip(rect or self.view)
+        if rect is None or not rect[1] <= y <= rect[3]:
+            return
+        x_start, x_end = max(x_start, rect[0]), min(x_end, rect[2])
+        if x_start > x_end:
+            return
+        block = self.block((x_start, y, x_end, y))
+        if self.mode == 'max':
+            np.maximum(block, alpha, out=block)
+        else:
+            block += alpha
+
+    def add_spans(self, spans, rect: Tuple[int, int, int, int] = None):
+        for x_start, x_end, y, alpha in spans:
+            self.add_span(x_start, x_end, y, alpha, rect)
+
+    def clear(self, rect: Tuple[int, int, int, int]):
+        self.block(rect)[...] = 0
+
+    def alpha(self, rect: Tuple[int, int, int, int]) -> np.ndarray:
+        return np.minimum(self.block(rect), 255).astype(np.uint8)
+
+    def bounds(self):
+        # Рамка ненулевых клеток или None
+        rows = np.flatnonzero(self.values.any(axis=1))
+        if len(rows) == 0:
+            return None
+        cols = np.flatnonzero(self.values.any(axis=0))
+        return (self.view[0] + int(cols[0]), self.view[3] - int(rows[-1]),
+                self.view[0] + int(cols[-1]), self.view[3] - int(rows[0]))
+
+
+class RasterizationApp(Rasterizer):
+    def __init__(self):
+        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        pygame.display.set_caption("Растровые алгоритмы")
+        self.font = pygame.font.Font(FONT_NAME, 20)
+        self.clock = pygame.time.Clock()
+        self.offset_x = WIDTH // 2
+        self.offset_y = HEIGHT // 2
+        self.cell_size = CELL_SIZE
+        self.pan_anchor = None
+        self.start_point = None
+        self.end_point = None
+        self.is_drawing = False
+        self.current_algorithm = "step"
+        self.show_smoothed = False
+        self.execution_time = 0
+        self.frame_time = 0
+        self.use_streaming = False
+        self.coverage_mode = 'max'
+        self.line_width = Rasterizer.line_width
+        self.buttons = self.create_buttons()
+        # Зафиксированные фигуры по номеру в порядке рисования и их пространственный индекс
+        self.drawn_lines = {}
+        self.line_ids = itertools.count()
+        self.index = SpatialHash()
+        self.hover_id = None
+        self.drawn_points = []
+        self.polygon_points = []
+
+        # Слои: сетка с зафиксированными линиями перерисовывается целиком только при смене смещения,
+        # новые линии дорисовываются в неё по одной, превью обновляется по грязным прямоугольникам
+        self.scene = pygame.Surface((WIDTH, HEIGHT))
+        self.scene_key = None
+        self.scene_coverage = None
+        self.label_surfaces = {}
+        self.dirty_rects = []
+        self.preview_rect = None
+        self.panel_state = None
+    
+    def create_buttons(self):
+        buttons = []
+        algorithms = [
+            ('Step', 'step'),
+            ('DDA', 'dda'),
+            ('Bresenham', 'bresenham'),
+            ('Circle', 'circle'),
+            ('Castle-Pitway', 'castle'),
+            ("Wu's Line", 'smooth'),
+            ('Wu Circle', 'smooth_circle'),
+            ('Thick Line', 'thick'),
+            ('Filled Circle', 'fill_circle'),
+            ('Ellipse', 'fill_ellipse'),
+            ('Polygon', 'fill_polygon'),
+            ('Clear', 'clear')
+        ]
+        x = BUTTON_MARGIN
+        y = BUTTON_MARGIN
+        for text, algo in algorithms:
+            button = Button(text, x, y, BUTTON_WIDTH, BUTTON_HEIGHT, algo)
+            buttons.append(button)
+            y += BUTTON_HEIGHT + BUTTON_MARGIN
+        return buttons
+    
+    def clear(self):
+        self.start_point = None
+        self.end_point = None
+        self.is_drawing = False
+        self.execution_time = 0
+        self.drawn_lines = {}
+        self.index = SpatialHash()
+        self.hover_id = None
+        self.drawn_points = []
+        self.polygon_points = []
+        self.scene_key = None
+    
+    def scene_dict(self) -> dict:
+        # Нарисованные фигуры в формате сцены для render_scene
+        shapes = []
+        for line in self.drawn_lines.values():
+            shape = {'algorithm': line['algorithm'], 'start': list(line['start']), 'end': list(line['end'])}
+            if 'vertices' in line:
+                shape['vertices'] = [list(v) for v in line['vertices']]
+            if 'width' in line:
+                shape['width'] = line['width']
+            shapes.append(shape)
+        return {
+            'width': WIDTH // self.cell_size,
+            'height': HEIGHT // self.cell_size,
+            'origin': [self.offset_x // self.cell_size, self.offset_y // self.cell_size],
+            'scale': self.cell_size,
+            'shapes': shapes,
+        }
+
+    def screen_to_grid(self, x: int, y: int) -> Tuple[int, int]:
+        return ((x - self.offset_x) // self.cell_size,
+                (self.offset_y - y) // self.cell_size)
+    
+    def grid_to_screen(self, x: int, y: int) -> Tuple[int, int]:
+        return (x * self.cell_size + self.offset_x,
+                self.offset_y - y * self.cell_size)
+
+    def viewport(self) -> Tuple[int, int, int, int]:
+        # Видимые клетки (x_min, y_min, x_max, y_max)
+        x_min, y_max = self.screen_to_grid(0, 0)
+        x_max, y_min = self.screen_to_grid(WIDTH - 1, HEIGHT - 1)
+        return x_min, y_min, x_max, y_max
+
+    def zoom(self, factor: float, pos: Tuple[int, int]):
+        # Точка сетки под курсором остаётся на месте
+        cell_size = min(max(round(self.cell_size * factor), MIN_CELL_SIZE), MAX_CELL_SIZE)
+        if cell_size == self.cell_size:
+            cell_size = min(max(self.cell_size + (1 if factor > 1 else -1), MIN_CELL_SIZE), MAX_CELL_SIZE)
+        x, y = pos
+        self.offset_x = x - round((x - self.offset_x) * cell_size / self.cell_size)
+        self.offset_y = y - round((y - self.offset_y) * cell_size / self.cell_size)
+        self.cell_size = cell_size
+
+    def label_stride(self) -> int:
+        # Наименьший шаг 1, 2, 5, 10, 20, 50, ... с подписями не ближе LABEL_SPACING пикселей
+        for power in itertools.count():
+            for multiplier in (1, 2, 5):
+                stride = multiplier * 10 ** power
+                if stride * self.cell_size >= LABEL_SPACING:
+                    return stride
+
+    def label(self, value: int) -> pygame.Surface:
+        text = self.label_surfaces.get(value)
+        if text is None:
+            text = self.label_surfaces[value] = self.font.render(str(value), True, TEXT_COLOR)
+        return text
+    
+    def draw_grid(self, surface: pygame.Surface):
+        surface.fill(BACKGROUND)
+        
+        # Рисование сетки: перебираются только видимые линии, подписи — с шагом под текущий масштаб
+        x_min, y_min, x_max, y_max = self.viewport()
+        stride = self.label_stride()
+        step = 1 if self.cell_size >= MIN_GRID_SPACING else stride
+        for grid_x in range(x_min - x_min % step, x_max + 2, step):
+            x = self.offset_x + grid_x * self.cell_size
+            color = GRID_COLOR if grid_x != 0 else AXIS_COLOR
+            pygame.draw.line(surface, color, (x, 0), (x, HEIGHT))
+            if grid_x != 0 and grid_x % stride == 0:
+                text = self.label(grid_x)
+                surface.blit(text, (x - text.get_width() // 2, self.offset_y + 5))
+        
+        for grid_y in range(y_min - y_min % step, y_max + 2, step):
+            y = self.offset_y - grid_y * self.cell_size
+            color = GRID_COLOR if grid_y != 0 else AXIS_COLOR
+            pygame.draw.line(surface, color, (0, y), (WIDTH, y))
+            if grid_y != 0 and grid_y % stride == 0:
+                text = self.label(grid_y)
+                surface.blit(text, (self.offset_x + 5, y - text.get_height() // 2))
+        
+        # Рисование осей
+        pygame.draw.line(surface, AXIS_COLOR, (self.offset_x, 0),
+                         (self.offset_x, HEIGHT), 2)
+        pygame.draw.line(surface, AXIS_COLOR, (0, self.offset_y),
+                         (WIDTH, self.offset_y), 2)
+    
+    def draw_buttons(self) -> bool:
+        # Рисование боковой панели; возвращает True, если вид кнопок изменился
+        panel_width = BUTTON_WIDTH + 2 * BUTTON_MARGIN
+        pygame.draw.rect(self.screen, (230, 230, 230), (0, 0, panel_width, HEIGHT))
+        
+        for button in self.buttons:
+            button.draw(self.screen)
+
+        state = [(button.hover, button.active) for button in self.buttons]
+        changed = state != self.panel_state
+        self.panel_state = state
+        return changed
+    
+    def draw_coordinates(self):
+        info_y = HEIGHT - 80
+        padding = 10
+
+        coverage_text = f"Coverage: {self.coverage_mode} (A)   Width: {self.line_width} ([ ])"
+        text_surface = self.font.render(coverage_text, True, TEXT_COLOR)
+        self.screen.blit(text_surface, (padding, info_y - 60))
+
+        mode_text = f"Mode: {'integer stream' if self.use_streaming else 'lists'} (I)"
+        text_surface = self.font.render(mode_text, True, TEXT_COLOR)
+        self.screen.blit(text_surface, (padding, info_y - 30))
+        
+        if self.start_point:
+            start_text = f"Start: ({self.start_point[0]}, {self.start_point[1]})"
+            text_surface = self.font.render(start_text, True, TEXT_COLOR)
+            self.screen.blit(text_surface, (padding, info_y))
+        
+        if self.end_point:
+            end_text = f"End: ({self.end_point[0]}, {self.end_point[1]})"
+            text_surface = self.font.render(end_text, True, TEXT_COLOR)
+            self.screen.blit(text_surface, (padding, info_y + 30))
+        
+        # Отображение времени выполнения, если есть, и времени кадра
+        time_text = f"Frame: {self.frame_time:.2f} ms"
+        if self.execution_time > 0:
+            time_text = f"Time: {self.execution_time:.2f} µs   " + time_text
+        text_surface = self.font.render(time_text, True, TEXT_COLOR)
+        self.screen.blit(text_surface, (padding, info_y + 60))
+    
+    def cells_rect(self, pixels: np.ndarray) -> pygame.Rect:
+        # Экранный прямоугольник, покрывающий все клетки
+        if len(pixels) == 0:
+            return pygame.Rect(0, 0, 0, 0)
+        (min_x, min_y), (max_x, max_y) = pixels.min(axis=0), pixels.max(axis=0)
+        left, top = self.grid_to_screen(int(min_x), int(max_y) + 1)
+        return pygame.Rect(left, top, (int(max_x - min_x) + 1) * self.cell_size,
+                           (int(max_y - min_y) + 1) * self.cell_size)
+
+    def accumulate_line(self, buffer: CoverageBuffer, line: dict, rect: Tuple[int, int, int, int] = None):
+        # В буфер попадают только клетки внутри rect (по умолчанию — окна буфера); фигуры вне него отбрасываются по рамке
+        rect = buffer.clip(rect or buffer.view)
+        left, bottom, right, top = line['bounds']
+        if rect is None or right < rect[0] or left > rect[2] or top < rect[1] or bottom > rect[3]:
+            return
+        # Участки отсортированы по строке, пиксели — по основной оси, поэтому видимая часть
+        # находится двоичным поиском и стоимость не зависит от длины невидимой части
+        if 'spans' in line:
+            spans = line['spans']
+            first, last = np.searchsorted(spans[:, 2], (rect[1], rect[3] + 1))
+            for x_start, x_end, y in spans[first:last].tolist():
+                buffer.add_span(x_start, x_end, y, 255, rect)
+        else:
+            axis = line['axis']
+            first, last = np.searchsorted(line['pixels'][:, axis], (rect[axis], rect[axis + 2] + 1))
+            buffer.add_pixels(line['pixels'][first:last], line['alpha'][first:last], rect)
+
+    def resolve(self, buffer: CoverageBuffer, rect: Tuple[int, int, int, int], surface: pygame.Surface,
+                color=LINE_COLOR):
+        """Покрытие области переводится в альфа-канал, по пикселю на клетку, и накладывается одним blit"""
+        rect = buffer.clip(rect) if rect else None
+        if rect is None:
+            return None
+        alpha = buffer.alpha(rect)
+        rows, cols = alpha.shape
+        cells = pygame.Surface((cols, rows), pygame.SRCALPHA)
+        cells.fill((*color, 0))
+        pygame.surfarray.pixels_alpha(cells)[...] = alpha.T
+        cells = pygame.transform.scale(cells, (cols * self.cell_size, rows * self.cell_size))
+        return surface.blit(cells, self.grid_to_screen(rect[0], rect[3] + 1))
+
+    def covers(self, line: dict, x: int, y: int) -> bool:
+        # Точная проверка клетки тем же двоичным поиском, что и при отрисовке
+        if 'spans' in line:
+            spans = line['spans']
+            first, last = np.searchsorted(spans[:, 2], (y, y + 1))
+            return bool(((spans[first:last, 0] <= x) & (x <= spans[first:last, 1])).any())
+        axis = line['axis']
+        first, last = np.searchsorted(line['pixels'][:, axis], ((x, y)[axis], (x, y)[axis] + 1))
+        hit = (line['pixels'][first:last] == (x, y)).all(axis=1) & (line['alpha'][first:last] > 0)
+        return bool(hit.any())
+
+    def line_at(self, x: int, y: int):
+        # Верхняя из фигур, закрывающих клетку; кандидаты берутся из одной корзины индекса
+        for line_id in sorted(self.index.query_point(x, y), reverse=True):
+            if self.covers(self.drawn_lines[line_id], x, y):
+                return line_id
+        return None
+
+    def update_scene(self) -> bool:
+        # Пересборка сетки и зафиксированных линий при смене смещения, масштаба или режима покрытия;
+        # True, если сцена собрана заново
+        key = (self.offset_x, self.offset_y, self.cell_size, self.coverage_mode)
+        if key == self.scene_key:
+            return False
+        view = self.viewport()
+        self.scene_coverage = CoverageBuffer(view, self.coverage_mode)
+        for line_id in self.index.query(view):
+            self.accumulate_line(self.scene_coverage, self.drawn_lines[line_id])
+        self.draw_grid(self.scene)
+        self.resolve(self.scene_coverage, view, self.scene)
+        self.scene_key = key
+        return True
+
+    def redraw_region(self, bounds: Tuple[int, int, int, int]):
+        # Перерисовка области сцены: покрытие собирается заново только из фигур в корзинах этой области,
+        # сетка под ним рисуется под маской
+        if self.scene_key is None:
+            return
+        region = self.scene_coverage.clip(bounds)
+        if region is None:
+            return
+        self.scene_coverage.clear(region)
+        for line_id in self.index.query(region):
+            self.accumulate_line(self.scene_coverage, self.drawn_lines[line_id], region)
+        rect = self.cells_rect(np.array([region[:2], region[2:]]))
+        self.scene.set_clip(rect)
+        self.draw_grid(self.scene)
+        self.resolve(self.scene_coverage, region, self.scene)
+        self.scene.set_clip(None)
+        self.dirty_rects.append(rect)
+
+    def delete_line(self, line_id):
+        line = self.drawn_lines.pop(line_id)
+        self.index.remove(line_id)
+        if self.hover_id == line_id:
+            self.hover_id = None
+        self.redraw_region(line['bounds'])
+
+    @staticmethod
+    def bounds(pixels: np.ndarray) -> Tuple[int, int, int, int]:
+        # Рамка клеток (x_min, y_min, x_max, y_max); у пустой фигуры — пустая рамка
+        if len(pixels) == 0:
+            return 0, 0, -1, -1
+        (x_min, y_min), (x_max, y_max) = pixels.min(axis=0).tolist(), pixels.max(axis=0).tolist()
+        return x_min, y_min, x_max, y_max
+
+    def commit_line(self, start: Tuple[int, int], end: Tuple[int, int], algorithm: str):
+        # Концы отрезка после отпускания мыши не меняются, поэтому точки считаются один раз
+        if algorithm in self.SPAN_ALGORITHMS:
+            spans = self.iter_shape_spans(algorithm, *start, *end)
+            self.commit_spans(start, end, algorithm, spans)
+            return
+        if self.use_streaming:
+            buffer = np.empty(3 * self.pixel_bound(algorithm, *start, *end), dtype=np.int32)
+            count = self.rasterize_into(algorithm, *start, *end, buffer)
+            triples = buffer[:3 * count].reshape(-1, 3)
+            pixels, alpha = triples[:, :2].copy(), triples[:, 2].astype(np.uint8)
+        else:
+            points = self.rasterize(algorithm, start, end)
+            pixels = np.array([(x, y) for x, y, _ in points], dtype=np.int32).reshape(-1, 2)
+            alpha = np.array([int(255 * alpha) for _, _, alpha in points], dtype=np.uint8)
+        bounds = self.bounds(pixels)
+        axis = 0 if bounds[2] - bounds[0] >= bounds[3] - bounds[1] else 1
+        order = np.argsort(pixels[:, axis], kind='stable')
+        line = {
+            'start': start,
+            'end': end,
+            'algorithm': algorithm,
+            'pixels': pixels[order],
+            'alpha': alpha[order],
+            'axis': axis,
+            'bounds': bounds,
+        }
+        if algorithm == 'thick':
+            line['width'] = self.line_width
+        self.add_to_scene(line)
+
+    def commit_spans(self, start: Tuple[int, int], end: Tuple[int, int], algorithm: str, spans, **extra):
+        # Залитые фигуры хранятся участками строк (x_start, x_end, y)
+        spans = np.array([span[:3] for span in spans], dtype=np.int32).reshape(-1, 3)
+        spans = spans[np.argsort(spans[:, 2], kind='stable')]
+        self.add_to_scene({
+            'start': start,
+            'end': end,
+            'algorithm': algorithm,
+            'spans': spans,
+            'bounds': self.bounds(np.concatenate([spans[:, [0, 2]], spans[:, [1, 2]]])),
+            **extra,
+        })
+
+    def commit_polygon(self):
+        if len(self.polygon_points) >= 3:
+            vertices = list(self.polygon_points)
+            self.commit_spans(vertices[0], vertices[-1], 'fill_polygon',
+                              self.iter_filled_polygon(vertices), vertices=vertices)
+        self.polygon_points = []
+
+    def add_to_scene(self, line: dict):
+        line_id = next(self.line_ids)
+        self.drawn_lines[line_id] = line
+        if 'spans' in line:
+            self.index.insert_spans(line_id, line['spans'])
+        else:
+            self.index.insert(line_id, line['pixels'])
+        self.redraw_region(line['bounds'])
+    
     def run(self):
         running = True
         while running:
@@ -401,87 +1649,297 @@ class RasterizationApp:
                             self.clear()
                         else:
                             self.current_algorithm = result
+                            self.polygon_points = []
                             self.start_point = None
                             self.end_point = None
                             self.is_drawing = False
                         break
                 else:
-                    if event.type == pygame.MOUSEBUTTONDOWN:
+                    panel_width = BUTTON_WIDTH + 2 * BUTTON_MARGIN
+                    if event.type == pygame.MOUSEWHEEL:
+                        self.zoom(1.25 if event.y > 0 else 0.8, pygame.mouse.get_pos())
+                    elif event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and event.button in (4, 5):
+                        # Колесо мыши обрабатывается через MOUSEWHEEL
+                        pass
+                    elif (event.type == pygame.MOUSEBUTTONDOWN and event.pos[0] > panel_width
+                          and (event.button == 2 or (event.button == 1 and pygame.key.get_mods() & pygame.KMOD_SHIFT))):
+                        # Перетаскивание сетки: средняя кнопка или Shift + левая
+                        self.pan_anchor = (event.pos, self.offset_x, self.offset_y)
+                    elif event.type == pygame.MOUSEMOTION and self.pan_anchor:
+                        (x, y), offset_x, offset_y = self.pan_anchor
+                        self.offset_x = offset_x + event.pos[0] - x
+                        self.offset_y = offset_y + event.pos[1] - y
+                    elif event.type == pygame.MOUSEMOTION and not self.is_drawing:
+                        # Подсветка фигуры под курсором
+                        if event.pos[0] > panel_width:
+                            self.hover_id = self.line_at(*self.screen_to_grid(*event.pos))
+                        else:
+                            self.hover_id = None
+                    elif event.type == pygame.MOUSEBUTTONUP and self.pan_anchor:
+                        self.pan_anchor = None
+                    elif (event.type == pygame.MOUSEBUTTONDOWN and event.button == 3 and event.pos[0] > panel_width
+                          and not self.polygon_points):
+                        # Правый клик по фигуре удаляет её
+                        line_id = self.line_at(*self.screen_to_grid(*event.pos))
+                        if line_id is not None:
+                            self.delete_line(line_id)
+                    elif event.type == pygame.MOUSEBUTTONDOWN and self.current_algorithm == 'fill_polygon':
+                        # Многоугольник: левый клик добавляет вершину, правый — замыкает
+                        x, y = event.pos
+                        if event.button == 3:
+                            self.commit_polygon()
+                        elif x > panel_width:
+                            self.polygon_points.append(self.screen_to_grid(x, y))
+                            self.start_point = self.polygon_points[0]
+                            self.end_point = self.polygon_points[-1]
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN:
+                        self.commit_polygon()
+                    elif event.type == pygame.MOUSEBUTTONDOWN:
                         x, y = event.pos
-                        panel_width = BUTTON_WIDTH + 2 * BUTTON_MARGIN
                         if x > panel_width:
                             self.start_point = self.screen_to_grid(x, y)
                             self.is_drawing = True
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_i:
+                        self.use_streaming = not self.use_streaming
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_a:
+                        modes = CoverageBuffer.MODES
+                        self.coverage_mode = modes[(modes.index(self.coverage_mode) + 1) % len(modes)]
+                    elif event.type == pygame.KEYDOWN and event.key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+                        step = 1 if event.key == pygame.K_RIGHTBRACKET else -1
+                        self.line_width = min(max(self.line_width + step, 1), 15)
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
+                        with open('scene.json', 'w', encoding='utf-8') as f:
+                            json.dump(self.scene_dict(), f, indent=2)
                     elif event.type == pygame.MOUSEBUTTONUP and self.is_drawing:
                         x, y = event.pos
-                        panel_width = BUTTON_WIDTH + 2 * BUTTON_MARGIN
                         if x > panel_width:
                             self.end_point = self.screen_to_grid(x, y)
                             self.is_drawing = False
                             
                             if self.start_point and self.end_point:
-                                self.drawn_lines.append({
-                                    'start': self.start_point,
-                                    'end': self.end_point,
-                                    'algorithm': self.current_algorithm
-                                })
-            
-            self.draw_grid()
-            self.draw_buttons()
-            self.draw_coordinates()
+                                self.commit_line(self.start_point, self.end_point, self.current_algorithm)
 
-            for line in self.drawn_lines:
-                algorithm = line['algorithm']
-                if algorithm == 'step':
-                    points = self.step_algorithm(*line['start'], *line['end'])
-                elif algorithm == 'dda':
-                    points = self.dda_algorithm(*line['start'], *line['end'])
-                elif algorithm == 'bresenham':
-                    points = self.bresenham_algorithm(*line['start'], *line['end'])
-                elif algorithm == 'circle':
-                    points = self.bresenham_circle(*line['start'], *line['end'])
-                elif algorithm == 'castle':
-                    points = self.castle_pitway_algorithm(*line['start'], *line['end'])
-                elif algorithm == 'smooth':
-                    points = self.wu_line_algorithm(*line['start'], *line['end'])
-                else:
-                    points = []
+            frame_start = time.perf_counter()
+            full_redraw = self.update_scene()
+            dirty_rects = self.dirty_rects
+            self.dirty_rects = []
+
+            # Стираем прошлое превью и область подписей, восстанавливая их из сцены
+            info_rect = pygame.Rect(0, HEIGHT - 145, WIDTH // 2, 145)
+            if full_redraw:
+                self.screen.blit(self.scene, (0, 0))
+                dirty_rects = [self.screen.get_rect()]
+            else:
+                if self.preview_rect:
+                    dirty_rects.append(self.preview_rect)
+                dirty_rects.append(info_rect)
+                for rect in dirty_rects:
+                    self.screen.blit(self.scene, rect, rect)
+            self.preview_rect = None
 
-                for point in points:
-                    self.draw_pixel(point)
+            view = self.viewport()
+            if self.hover_id is not None and not self.is_drawing:
+                # Подсветка рисуется поверх сцены как превью и стирается в следующем кадре
+                line = self.drawn_lines[self.hover_id]
+                highlight = CoverageBuffer(view, self.coverage_mode)
+                self.accumulate_line(highlight, line)
+                self.preview_rect = self.resolve(highlight, line['bounds'], self.screen, HIGHLIGHT_COLOR)
 
-            if self.start_point and self.is_drawing:
+            # Превью собирается в буфер покрытия кадра и выводится одним наложением
+            preview = CoverageBuffer(view, self.coverage_mode)
+            if self.polygon_points:
                 current_end = self.screen_to_grid(*pygame.mouse.get_pos())
 
                 start_time = time.perf_counter()
+                preview.add_spans(self.iter_filled_polygon(self.polygon_points + [current_end]))
+                self.preview_rect = self.resolve(preview, preview.bounds(), self.screen)
+                self.execution_time = (time.perf_counter() - start_time) * 1_000_000  # в микросекундах
 
-                algorithm = self.current_algorithm
-                if algorithm == 'step':
-                    points = self.step_algorithm(*self.start_point, *current_end)
-                elif algorithm == 'dda':
-                    points = self.dda_algorithm(*self.start_point, *current_end)
-                elif algorithm == 'bresenham':
-                    points = self.bresenham_algorithm(*self.start_point, *current_end)
-                elif algorithm == 'circle':
-                    points = self.bresenham_circle(*self.start_point, *current_end)
-                elif algorithm == 'castle':
-                    points = self.castle_pitway_algorithm(*self.start_point, *current_end)
-                elif algorithm == 'smooth':
-                    points = self.wu_line_algorithm(*self.start_point, *current_end)
-                else:
-                    points = []
+            elif self.start_point and self.is_drawing:
+                current_end = self.screen_to_grid(*pygame.mouse.get_pos())
+
+                start_time = time.perf_counter()
 
-                for point in points:
-                    self.draw_pixel(point)
+                if self.current_algorithm in self.SPAN_ALGORITHMS:
+                    preview.add_spans(self.iter_shape_spans(self.current_algorithm, *self.start_point, *current_end))
+                elif self.use_streaming:
+                    # Пиксели идут участками прямо из генератора, шаги вне окна не вычисляются
+                    preview.add_spans(self.iter_spans(self.current_algorithm, *self.start_point, *current_end, view))
+                else:
+                    # Превью меняется каждый кадр, поэтому и в режиме списков считаются только шаги внутри окна:
+                    # полный отрезок строится один раз, при фиксации
+                    points = list(self.iter_clipped(self.current_algorithm, *self.start_point, *current_end, view))
+                    points = np.array(points, dtype=np.int64).reshape(-1, 3)
+                    preview.add_pixels(points[:, :2], points[:, 2].astype(np.uint32))
+                self.preview_rect = self.resolve(preview, preview.bounds(), self.screen)
 
                 end_time = time.perf_counter()
                 self.execution_time = (end_time - start_time) * 1_000_000  # в микросекундах
 
-            pygame.display.flip()
+            if self.preview_rect:
+                dirty_rects.append(self.preview_rect)
+
+            if self.draw_buttons():
+                dirty_rects.append(pygame.Rect(0, 0, BUTTON_WIDTH + 2 * BUTTON_MARGIN, HEIGHT))
+            self.draw_coordinates()
+
+            pygame.display.update(dirty_rects)
+            self.frame_time = (time.perf_counter() - frame_start) * 1000  # в миллисекундах
             self.clock.tick(60)
 
         pygame.quit()
 
-if __name__ == '__main__':
+def benchmark_segments(rng: random.Random, length: int, octant: int, count: int) -> List[Tuple[int, int, int, int]]:
+    # Отрезки заданной длины с направлением внутри октанта; для окружности длина — радиус
+    segments = []
+    for _ in range(count):
+        angle = math.radians(45 * (octant + rng.random()))
+        x0, y0 = rng.randint(-1000, 1000), rng.randint(-1000, 1000)
+        segments.append((x0, y0, x0 + round(length * math.cos(angle)), y0 + round(length * math.sin(angle))))
+    return segments
+
+
+def benchmark_case(rasterizer: Rasterizer, algorithm: str, mode: str, segments, repeat: int,
+                   sample_time: float = 0.005) -> dict:
+    if mode == 'batch':
+        array = np.array(segments, dtype=np.int64)
+
+        def workload():
+            return len(rasterizer.batch_rasterize(algorithm, array)[0])
+    else:
+        def workload():
+            return sum(len(rasterizer.rasterize(algorithm, (x0, y0), (x1, y1))) for x0, y0, x1, y1 in segments)
+
+    # Прогрев и подбор числа повторов, чтобы один замер длился не меньше sample_time секунд
+    start = time.perf_counter()
+    pixels = workload()
+    number = max(1, int(sample_time / max(time.perf_counter() - start, 1e-7)))
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            workload()
+        samples.append((time.perf_counter_ns() - start) / (number * max(pixels, 1)))
+
+    tracemalloc.start()
+    workload()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'algorithm': algorithm,
+        'mode': mode,
+        'pixels': pixels,
+        'ns_per_pixel': statistics.mean(samples),
+        'ns_per_pixel_min': min(samples),
+        'ns_per_pixel_stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'peak_bytes': peak,
+        'bytes_per_pixel': peak / max(pixels, 1),
+    }
+
+
+def run_benchmark(lengths=(4, 32, 256), counts=(1, 64), repeat=5, seed=0, modes=('scalar', 'batch'), label=''):
+    """Замер всех алгоритмов Rasterizer по сетке длин, октантов и количества отрезков"""
+    rasterizer = Rasterizer()
+    results = []
+    for algorithm in Rasterizer.ALGORITHMS:
+        for length in lengths:
+            for octant in range(8):
+                for count in counts:
+                    # Отдельный генератор на случай: набор отрезков не зависит от состава сетки
+                    rng = random.Random(f"{seed}:{length}:{octant}:{count}")
+                    segments = benchmark_segments(rng, length, octant, count)
+                    for mode in modes:
+                        case = benchmark_case(rasterizer, algorithm, mode, segments, repeat)
+                        case.update(length=length, octant=octant, count=count)
+                        results.append(case)
+    return {
+        'label': label,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def print_benchmark(report: dict, baseline: dict = None, threshold: float = 0.1):
+    def key(case):
+        return case['algorithm'], case['mode'], case['length'], case['octant'], case['count']
+
+    previous = {key(case): case for case in baseline['results']} if baseline else {}
+    print(f"{'algorithm':10s}{'mode':>8s}{'length':>8s}{'ns/px':>10s}{'stdev':>9s}{'B/px':>9s}"
+          + (f"{'vs base':>10s}" if baseline else ""))
+
+    # Сводка по октантам и количеству отрезков
+    groups = {}
+    for case in report['results']:
+        groups.setdefault((case['algorithm'], case['mode'], case['length']), []).append(case)
+    for (algorithm, mode, length), cases in groups.items():
+        ns = statistics.mean(c['ns_per_pixel'] for c in cases)
+        stdev = statistics.mean(c['ns_per_pixel_stdev'] for c in cases)
+        bpp = statistics.mean(c['bytes_per_pixel'] for c in cases)
+        line = f"{algorithm:10s}{mode:>8s}{length:8d}{ns:10.1f}{stdev:9.1f}{bpp:9.1f}"
+        old = [previous[key(c)]['ns_per_pixel'] for c in cases if key(c) in previous]
+        if old:
+            line += f"{ns / statistics.mean(old):9.2f}x"
+        print(line)
+
+    if baseline:
+        regressions = [c for c in report['results'] if key(c) in previous
+                       and c['ns_per_pixel_min'] > previous[key(c)]['ns_per_pixel_min'] * (1 + threshold)]
+        print(f"{len(regressions)} of {len(report['results'])} cases slower than "
+              f"{baseline.get('label') or 'baseline'} by more than {threshold:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Растровые алгоритмы")
+    subparsers = parser.add_subparsers(dest='command')
+
+    bench_parser = subparsers.add_parser('bench', help="замер алгоритмов без окна")
+    bench_parser.add_argument('--lengths', type=int, nargs='+', default=[4, 32, 256])
+    bench_parser.add_argument('--counts', type=int, nargs='+', default=[1, 64])
+    bench_parser.add_argument('--modes', nargs='+', choices=['scalar', 'batch'], default=['scalar', 'batch'])
+    bench_parser.add_argument('--repeat', type=int, default=5)
+    bench_parser.add_argument('--seed', type=int, default=0)
+    bench_parser.add_argument('--label', default='', help="метка версии, сохраняется в JSON")
+    bench_parser.add_argument('--output', help="файл для сохранения результатов в JSON")
+    bench_parser.add_argument('--compare', help="JSON прошлого запуска для сравнения")
+
+    render_parser = subparsers.add_parser('render', help="отрисовка сцен JSON в PNG/PPM без окна")
+    render_parser.add_argument('scenes', nargs='+', help="файлы сцен (клавиша S в окне сохраняет scene.json)")
+    render_parser.add_argument('--output-dir', default='.')
+    render_parser.add_argument('--format', choices=['png', 'ppm'], default='png')
+    render_parser.add_argument('--scale', type=int, default=1, help="размер клетки в пикселях")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'render':
+        for path in render_scenes(args.scenes, args.output_dir, args.format, args.scale):
+            print(path)
+        return 0
+
+    if args.command == 'bench':
+        report = run_benchmark(args.lengths, args.counts, args.repeat, args.seed, args.modes, args.label)
+        baseline = None
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+        print_benchmark(report, baseline)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    if pygame is None:
+        parser.error("для окна нужен pygame")
     app = RasterizationApp()
     app.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
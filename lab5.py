@@ -1,8 +1,34 @@
-import pygame
-import pygame.gfxdraw
+from __future__ import annotations
+
+import gc
+import os
+import re
+import sys
+import json
+import struct
+import math
+import time
+import threading
+import random
+import itertools
+import argparse
+import statistics
+import multiprocessing
+import numpy as np
 from enum import Enum
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from fractions import Fraction
 from typing import List, Tuple
 
+# Без pygame доступны только Clipper и консольные команды
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # приветствие pygame попало бы в вывод clip
+try:
+    import pygame
+    import pygame.gfxdraw
+except ImportError:
+    pygame = None
+
 # ПАРАМЕТРЫ ОКНА И СЕТКИ
 WINDOW_WIDTH = 1400
 WINDOW_HEIGHT = 800
@@ -19,6 +45,8 @@ POLYGON_COLOR = (70, 150, 230) # Отрисовка многоугольнико
 CLIPPED_COLOR = (255, 200, 50) # Цвет отсечённых фигур
 PANEL_COLOR = (40, 40, 50)     # Фон панели справа
 TEXT_COLOR = (220, 220, 220)   # Текст
+LAYER_KEY = (255, 0, 255)      # Прозрачный цвет кэшированных слоёв, в рисунке не встречается
+FPS_INTERVAL = 0.5             # Период обновления FPS на панели, с
 
 class Mode(Enum):
     LINE = 1
@@ -28,98 +56,776 @@ class State(Enum):
     DRAWING = 1
     WINDOW_CREATION = 2
 
-class App:
+
+BOOLEAN_OPERATIONS = ('intersection', 'union', 'difference')
+
+# Положение рамки фигуры относительно окна отсечения
+BOX_UNKNOWN = -1  # фигура ещё не отсекалась
+BOX_CROSSING = 0
+BOX_INSIDE = 1
+BOX_OUTSIDE = 2
+PERTURBATION = 1e-6  # сдвиг окна в пикселях при вырожденных пересечениях
+PERTURBATION_ATTEMPTS = 8
+RTREE_NODE_SIZE = 16  # максимальное число записей в узле R-дерева
+RTREE_SCAN_RATIO = 64  # окно крупнее 1/64 сцены дешевле проверить полным векторным проходом
+JOIN_TOLERANCE = 1e-9  # относительный допуск при склейке кусков ломаной
+# Оценка ошибки orient2d в float (Шевчук, ccwerrboundA): знак, который больше
+# неё по модулю, верен, иначе определитель пересчитывается точно
+ORIENT_ERROR_BOUND = (3 + 8 * sys.float_info.epsilon) * sys.float_info.epsilon / 2
+
+# Файл сцены: заголовок, затем offsets (int64, фигур + 1) и вершины (float64, V×2)
+SCENE_MAGIC = b'LAB5SCN1'
+SCENE_HEADER = struct.Struct('<8sQQ')  # сигнатура, число фигур, число вершин
+SCENE_PATH = 'scene.lab5'
+SCENE_SIZE = 100000  # фигур в случайной сцене (R)
+
+# Параллельное отсечение
+POOL_BACKENDS = ('thread', 'process')
+PARALLEL_MIN_SHAPES = 2000  # меньший пересчёт быстрее сделать на месте, чем раздать пулу
+PARALLEL_CHUNKS = 4  # частей на исполнителя: успевший раньше берёт следующую
+SCALING_WINDOW = (200, 150, 700, 550)
+
+
+class PredicateStats(threading.local):
+    """
+    Сколько раз знак orient2d дал float (fast) и сколько — точный пересчёт
+    (exact). У каждого потока свои счётчики: потоки пула не мешают друг другу
+    и отдают набранное вместе с результатом, как и процессы.
+    """
+
     def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        # Меняем заголовок окна (можно дополнить уточнением “Обновлённый интерфейс”):
-        pygame.display.set_caption("Алгоритм Коэна-Сазерленда (Обновлённый интерфейс)")
-        self.clock = pygame.time.Clock()
-        # Изменяем шрифт и размер на что-то более читаемое:
-        self.font = pygame.font.SysFont("Arial", 20)
+        self.fast = 0
+        self.exact = 0
 
-        self.mode = Mode.LINE
-        self.state = State.DRAWING
-        self.temp_point = None
-        self.current_line = []
-        self.current_polygon = []
-        self.shapes = []
-        self.clipping_window = None
-        self.window_start = None
-        self.clipped_shapes = []
-        self.show_grid = True
-        self.creating_window = False
-        self.window_mode = False
+    def as_dict(self) -> dict:
+        return {'fast': self.fast, 'exact': self.exact}
+
+    def add(self, counts: dict):
+        self.fast += counts['fast']
+        self.exact += counts['exact']
+
+
+PREDICATE_STATS = PredicateStats()
+
+
+def signed_area(polygon: List[Tuple[float, float]]) -> float:
+    """
+    Удвоенная ориентированная площадь: положительна при обходе против часовой
+    стрелки в системе координат с осью y вверх.
+    """
+    n = len(polygon)
+    return sum(polygon[i][0] * polygon[(i + 1) % n][1] - polygon[(i + 1) % n][0] * polygon[i][1]
+               for i in range(n))
+
+
+def orient2d(ax: float, ay: float, bx: float, by: float, cx: float, cy: float) -> int:
+    """
+    Знак (b - a) × (c - a): 1, если c слева от направленной прямой a→b,
+    -1 — справа, 0 — на прямой. Сначала определитель считается в float, и его
+    знак принимается, если модуль превышает оценку ошибки округления; почти
+    вырожденные случаи пересчитываются точно в рациональных числах, так что
+    ответ не зависит от округления.
+    """
+    left = (bx - ax) * (cy - ay)
+    right = (by - ay) * (cx - ax)
+    det = left - right
+    bound = ORIENT_ERROR_BOUND * (abs(left) + abs(right))
+    if det > bound or -det > bound:
+        PREDICATE_STATS.fast += 1
+        return 1 if det > 0 else -1
+
+    PREDICATE_STATS.exact += 1
+    try:
+        ax, ay, bx, by, cx, cy = map(Fraction, (ax, ay, bx, by, cx, cy))
+    except (ValueError, OverflowError):
+        return 0  # NaN или бесконечность: точки на прямой не различить
+    det = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    return (det > 0) - (det < 0)
+
+
+def line_crossing(ax: float, ay: float, bx: float, by: float,
+                  px: float, py: float, qx: float, qy: float) -> float:
+    """
+    Параметр t точки, где отрезок p→q пересекает прямую a→b, для концов по
+    разные стороны прямой (это проверяет orient2d). t берётся из отношения
+    расстояний концов до прямой и зажимается в [0, 1], поэтому почти
+    параллельные рёбра не дают ни деления на ноль, ни точки вне отрезка.
+    """
+    dp = (bx - ax) * (py - ay) - (by - ay) * (px - ax)
+    dq = (bx - ax) * (qy - ay) - (by - ay) * (qx - ax)
+    if dp == dq:
+        return 0.5
+    return min(max(dp / (dp - dq), 0.0), 1.0)
+
+
+def point_in_polygon(x: float, y: float, polygon: List[Tuple[float, float]]) -> bool:
+    """
+    Проверка по правилу чётности: считаем рёбра, которые пересекает луч из точки вправо.
+    Подходит и для невыпуклых многоугольников. С какой стороны ребра лежит
+    точка, решает orient2d, а не вычисленная абсцисса пересечения.
+    """
+    inside = False
+    for (ax, ay), (bx, by) in zip(polygon[-1:] + polygon[:-1], polygon):
+        if (ay > y) != (by > y) and orient2d(ax, ay, bx, by, x, y) == (1 if by > ay else -1):
+            inside = not inside
+    return inside
+
+
+def edge_intersections(subject: List[Tuple[float, float]],
+                       clip: List[Tuple[float, float]]) -> Tuple[List[Tuple[int, int, float, float]], bool]:
+    """
+    Поиск пересечений рёбер двух многоугольников заметающей прямой по x.
+    Рёбра упорядочены по левому концу, и каждое сравнивается только с активными
+    рёбрами другого многоугольника, x-интервалы которых его перекрывают, поэтому
+    для длинных контуров из коротких рёбер число проверок близко к линейному.
+    Возвращает список (i, j, alpha, beta) — номера рёбер и параметры точки на
+    каждом из них — и признак вырожденного случая: вершина на ребре или наложение
+    коллинеарных рёбер. Пересекаются ли рёбра и вырожден ли случай, решают
+    точные знаки orient2d, а не сравнение параметров с допуском.
+    """
+    edges = []
+    for owner, polygon in enumerate((subject, clip)):
+        for i, ((ax, ay), (bx, by)) in enumerate(zip(polygon, polygon[1:] + polygon[:1])):
+            edges.append((min(ax, bx), max(ax, bx), min(ay, by), max(ay, by), owner, i, ax, ay, bx, by))
+    edges.sort()
+
+    found = []
+    degenerate = False
+    active = ([], [])
+    for edge in edges:
+        xmin, _, ymin, ymax, owner = edge[:5]
+        others = [other for other in active[1 - owner] if other[1] >= xmin]
+        active[1 - owner][:] = others
+        for other in others:
+            if other[3] < ymin or other[2] > ymax:
+                continue
+            s, c = (edge, other) if owner == 0 else (other, edge)
+            sax, say, sbx, sby = s[6], s[7], s[8], s[9]
+            cax, cay, cbx, cby = c[6], c[7], c[8], c[9]
+            c0 = orient2d(sax, say, sbx, sby, cax, cay)
+            c1 = orient2d(sax, say, sbx, sby, cbx, cby)
+            if c0 == c1 != 0:
+                continue
+            s0 = orient2d(cax, cay, cbx, cby, sax, say)
+            s1 = orient2d(cax, cay, cbx, cby, sbx, sby)
+            if s0 == s1 != 0:
+                continue
+            if 0 in (c0, c1, s0, s1):
+                # Рёбра на одной прямой с перекрывающимися рамками накладываются;
+                # иначе конец на прямой другого ребра лежит на нём самом, если
+                # попадает в его рамку
+                degenerate |= (c0 == c1 == 0) \
+                    or (c0 == 0 and s[0] <= cax <= s[1] and s[2] <= cay <= s[3]) \
+                    or (c1 == 0 and s[0] <= cbx <= s[1] and s[2] <= cby <= s[3]) \
+                    or (s0 == 0 and c[0] <= sax <= c[1] and c[2] <= say <= c[3]) \
+                    or (s1 == 0 and c[0] <= sbx <= c[1] and c[2] <= sby <= c[3])
+                continue
+            # Собственное пересечение: параметр на каждом ребре — по расстояниям до другого
+            alpha = line_crossing(cax, cay, cbx, cby, sax, say, sbx, sby)
+            beta = line_crossing(sax, say, sbx, sby, cax, cay, cbx, cby)
+            found.append((s[5], c[5], alpha, beta))
+        active[owner].append(edge)
+    return found, degenerate
+
+
+class ClipVertex:
+    """Вершина двусвязного кольца Грейнера-Хормана"""
+
+    def __init__(self, x: float, y: float, intersect: bool = False):
+        self.x = x
+        self.y = y
+        self.intersect = intersect
+        self.entry = False
+        self.visited = False
+        self.neighbour = None
+        self.next = None
+        self.prev = None
+
+
+def build_ring(polygon: List[Tuple[float, float]], hits: dict) -> List[ClipVertex]:
+    # Вершины многоугольника и точки пересечения, упорядоченные по параметру на каждом ребре
+    ring = []
+    for i, (x, y) in enumerate(polygon):
+        ring.append(ClipVertex(x, y))
+        ring.extend(vertex for _, vertex in sorted(hits.get(i, []), key=lambda hit: hit[0]))
+    for vertex, following in zip(ring, ring[1:] + ring[:1]):
+        vertex.next = following
+        following.prev = vertex
+    return ring
+
+
+def original_crossing(sa: Tuple[float, float], sb: Tuple[float, float],
+                      ca: Tuple[float, float], cb: Tuple[float, float],
+                      x: float, y: float) -> Tuple[float, float]:
+    """
+    Точка пересечения ребра sa-sb с ребром ca-cb исходного окна, найденная у
+    сдвинутого окна в (x, y). Если конец одного ребра лежит на другом (касание
+    или наложение, из-за которых окно и сдвигали), это и есть точка
+    пересечения: берётся ближайший к (x, y) такой конец. При собственном
+    пересечении параметр считается заново по исходному ребру. Рёбра, которые
+    без сдвига не встречаются, оставляют (x, y).
+    """
+    touching = [(px, py) for (px, py), (ax, ay), (bx, by) in ((ca, sa, sb), (cb, sa, sb), (sa, ca, cb), (sb, ca, cb))
+                if orient2d(ax, ay, bx, by, px, py) == 0
+                and min(ax, bx) <= px <= max(ax, bx) and min(ay, by) <= py <= max(ay, by)]
+    if touching:
+        return min(touching, key=lambda p: (p[0] - x) ** 2 + (p[1] - y) ** 2)
+    if orient2d(*sa, *sb, *ca) * orient2d(*sa, *sb, *cb) < 0 and orient2d(*ca, *cb, *sa) * orient2d(*ca, *cb, *sb) < 0:
+        t = line_crossing(*ca, *cb, *sa, *sb)
+        return sa[0] + t * (sb[0] - sa[0]), sa[1] + t * (sb[1] - sa[1])
+    return x, y
+
+
+def is_spike(p: Tuple[float, float], q: Tuple[float, float], r: Tuple[float, float]) -> bool:
+    # q повторяет p или контур в q разворачивается назад по той же прямой
+    return q == p or (orient2d(*p, *q, *r) == 0 and (q[0] - p[0]) * (r[0] - q[0]) + (q[1] - p[1]) * (r[1] - q[1]) <= 0)
+
+
+def drop_spikes(contour: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """
+    Контур без повторов соседних точек и «шипов» нулевой ширины A→B→A. Такие
+    шипы остаются вдоль общих рёбер многоугольника и окна, когда тонкие
+    полоски от сдвига окна пересчитываются по исходному окну.
+    """
+    result = []
+    for point in contour:
+        result.append(point)
+        while len(result) >= 3 and is_spike(*result[-3:]):
+            del result[-2]
+        if len(result) == 2 and result[0] == result[1]:
+            result.pop()
+    # Стык конца контура с началом
+    while len(result) >= 3:
+        if is_spike(result[-2], result[-1], result[0]):
+            result.pop()
+        elif is_spike(result[-1], result[0], result[1]):
+            result.pop(0)
+        else:
+            break
+    return result
+
+
+def polygon_boolean(subject: List[Tuple[float, float]], clip: List[Tuple[float, float]],
+                    operation: str = 'intersection') -> List[List[Tuple[float, float]]]:
+    """
+    Булева операция над простыми (в том числе невыпуклыми) многоугольниками
+    по Грейнеру-Хорману: intersection, union или difference (subject минус clip).
+    Возвращает список контуров; отверстие, которое получается при вычитании
+    вложенного окна, идёт отдельным контуром с обратным обходом.
+    Касания в вершинах и наложения рёбер снимаются сдвигом окна на PERTURBATION
+    пикселя. Сдвиг только выбирает, как обходить такие места: точки пересечений
+    пересчитываются по исходному окну (см. original_crossing), и в результат
+    попадают исходные вершины обоих многоугольников.
+    """
+    if operation not in BOOLEAN_OPERATIONS:
+        raise ValueError(f"неизвестная операция: {operation}")
+    if len(clip) < 3:
+        return [subject] if operation != 'intersection' and len(subject) >= 3 else []
+    if len(subject) < 3:
+        return [clip] if operation == 'union' else []
 
-    def draw_grid(self):
+    moved = clip
+    hits, degenerate = edge_intersections(subject, moved)
+    for attempt in range(1, PERTURBATION_ATTEMPTS + 1):
+        if not degenerate:
+            break
+        # Направление сдвига меняется на золотой угол, чтобы не попасть вдоль тех же рёбер
+        angle = 2.399963 * attempt
+        dx, dy = PERTURBATION * attempt * math.cos(angle), PERTURBATION * attempt * math.sin(angle)
+        moved = [(x + dx, y + dy) for x, y in clip]
+        hits, degenerate = edge_intersections(subject, moved)
+
+    subject_in_clip = point_in_polygon(*subject[0], moved)
+    clip_in_subject = point_in_polygon(*moved[0], subject)
+
+    if not hits:
+        # Контуры не пересекаются: результат определяется вложенностью
+        if operation == 'intersection':
+            return [subject] if subject_in_clip else [clip] if clip_in_subject else []
+        if operation == 'union':
+            return [clip] if subject_in_clip else [subject] if clip_in_subject else [subject, clip]
+        if subject_in_clip:
+            return []
+        if clip_in_subject:
+            hole = clip if (signed_area(clip) > 0) != (signed_area(subject) > 0) else clip[::-1]
+            return [subject, hole]
+        return [subject]
+
+    subject_hits, clip_hits = {}, {}
+    for i, j, alpha, beta in hits:
+        sx0, sy0 = subject[i]
+        sx1, sy1 = subject[(i + 1) % len(subject)]
+        x, y = sx0 + alpha * (sx1 - sx0), sy0 + alpha * (sy1 - sy0)
+        if moved is not clip:
+            # Порядок точек на рёбрах берётся из сдвинутого окна, координаты — из исходного
+            x, y = original_crossing(subject[i], subject[(i + 1) % len(subject)],
+                                     clip[j], clip[(j + 1) % len(clip)], x, y)
+        on_subject, on_clip = ClipVertex(x, y, True), ClipVertex(x, y, True)
+        on_subject.neighbour, on_clip.neighbour = on_clip, on_subject
+        subject_hits.setdefault(i, []).append((alpha, on_subject))
+        clip_hits.setdefault(j, []).append((beta, on_clip))
+    subject_ring = build_ring(subject, subject_hits)
+    clip_ring = build_ring(clip, clip_hits)
+
+    # Пересечение идёт по обоим контурам вперёд, объединение — по обоим назад,
+    # разность — назад по subject; флаги входа чередуются вдоль каждого кольца
+    forward_subject, forward_clip = {
+        'intersection': (True, True),
+        'union': (False, False),
+        'difference': (False, True),
+    }[operation]
+    for ring, entry in ((subject_ring, forward_subject != subject_in_clip),
+                        (clip_ring, forward_clip != clip_in_subject)):
+        for vertex in ring:
+            if vertex.intersect:
+                vertex.entry = entry
+                entry = not entry
+
+    result = []
+    for start in subject_ring:
+        if not start.intersect or start.visited:
+            continue
+        contour = []
+        current = start
+        while not current.visited:
+            current.visited = current.neighbour.visited = True
+            contour.append((current.x, current.y))
+            forward = current.entry
+            current = current.next if forward else current.prev
+            while not current.intersect:
+                contour.append((current.x, current.y))
+                current = current.next if forward else current.prev
+            current = current.neighbour
+        contour = drop_spikes(contour)
+        if len(contour) >= 3:
+            result.append(contour)
+    return result
+
+
+def clip_segment_region(x1: float, y1: float, x2: float, y2: float,
+                        region: List[Tuple[float, float]]) -> List[Tuple[float, float, float, float]]:
+    """
+    Отсечение отрезка произвольным многоугольником: параметры пересечений с
+    рёбрами сортируются, и остаются куски, середина которых лежит внутри.
+    Невыпуклое окно может разрезать отрезок на несколько частей.
+    """
+    dx, dy = x2 - x1, y2 - y1
+    params = [0.0, 1.0]
+    for (ax, ay), (bx, by) in zip(region, region[1:] + region[:1]):
+        # Ребро задевает отрезок, если его концы не по одну сторону отрезка, и наоборот;
+        # коллинеарные рёбра точек разреза не дают, куски вдоль них решает проверка середины
+        a, b = orient2d(x1, y1, x2, y2, ax, ay), orient2d(x1, y1, x2, y2, bx, by)
+        if a == b:
+            continue
+        p, q = orient2d(ax, ay, bx, by, x1, y1), orient2d(ax, ay, bx, by, x2, y2)
+        if p == q or 0 in (p, q):
+            continue
+        params.append(line_crossing(ax, ay, bx, by, x1, y1, x2, y2))
+    params.sort()
+
+    pieces = []
+    for t0, t1 in zip(params, params[1:]):
+        if t1 == t0 and len(params) > 2:
+            continue
+        t = (t0 + t1) / 2
+        if not point_in_polygon(x1 + t * dx, y1 + t * dy, region):
+            continue
+        if pieces and pieces[-1][1] == t0:
+            pieces[-1][1] = t1
+        else:
+            pieces.append([t0, t1])
+    return [(x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy) for t0, t1 in pieces]
+
+
+def box_union(boxes) -> Tuple[float, float, float, float]:
+    xmin, ymin, xmax, ymax = zip(*boxes)
+    return min(xmin), min(ymin), max(xmax), max(ymax)
+
+
+def box_merge(a: tuple, b: tuple) -> Tuple[float, float, float, float]:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def box_area(box: Tuple[float, float, float, float]) -> float:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+class RTreeNode:
+    """Узел R-дерева: рамки записей и сами записи — ключи в листе, дочерние узлы выше"""
+
+    def __init__(self, leaf: bool, boxes: list = None, children: list = None):
+        self.leaf = leaf
+        self.boxes = boxes or []
+        self.children = children or []
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return box_union(self.boxes)
+
+
+class RTree:
+    """
+    R-дерево рамок (Гуттман, квадратичное разбиение) с пакетной загрузкой
+    Sort-Tile-Recursive. Ключи — произвольные значения, рамки — (xmin, ymin, xmax, ymax).
+    """
+
+    def __init__(self, max_entries: int = RTREE_NODE_SIZE):
+        self.max_entries = max_entries
+        self.min_entries = max(2, max_entries * 2 // 5)
+        self.root = RTreeNode(leaf=True)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @classmethod
+    def bulk_load(cls, boxes: np.ndarray, keys, max_entries: int = RTREE_NODE_SIZE) -> 'RTree':
         """
-        Отрисовка сетки и осей координат.
+        Построение по STR: записи сортируются по центру x, режутся на вертикальные
+        полосы по √(N/M) листов, внутри полосы сортируются по центру y и пакуются
+        в листы по M записей; верхние уровни строятся так же из рамок узлов.
         """
-        if not self.show_grid:
-            return
+        tree = cls(max_entries)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        keys = list(keys)
+        tree.size = len(keys)
+        if not keys:
+            return tree
 
-        # Вертикальные и горизонтальные линии сетки:
-        for x in range(0, WINDOW_WIDTH - INFO_PANEL_WIDTH, GRID_SIZE):
-            pygame.draw.line(self.screen, GRID_COLOR, (x, 0), (x, WINDOW_HEIGHT))
-        for y in range(0, WINDOW_HEIGHT, GRID_SIZE):
-            pygame.draw.line(self.screen, GRID_COLOR, (0, y), (WINDOW_WIDTH - INFO_PANEL_WIDTH, y))
+        level = [(tuple(box), key) for box, key in zip(boxes.tolist(), keys)]
+        leaf = True
+        while True:
+            nodes = []
+            for group in tree.tile([box for box, _ in level]):
+                nodes.append(RTreeNode(leaf, [level[i][0] for i in group], [level[i][1] for i in group]))
+            if len(nodes) == 1:
+                tree.root = nodes[0]
+                return tree
+            level = [(node.bounds(), node) for node in nodes]
+            leaf = False
 
-        # Оси X и Y:
-        mid_x = (WINDOW_WIDTH - INFO_PANEL_WIDTH) // 2
-        mid_y = WINDOW_HEIGHT // 2
-        pygame.draw.line(self.screen, AXIS_COLOR, (0, mid_y), (WINDOW_WIDTH - INFO_PANEL_WIDTH, mid_y), 2)
-        pygame.draw.line(self.screen, AXIS_COLOR, (mid_x, 0), (mid_x, WINDOW_HEIGHT), 2)
+    def tile(self, boxes: list) -> List[List[int]]:
+        # Разбиение записей уровня на группы по max_entries для bulk_load
+        array = np.array(boxes, dtype=np.float64)
+        cx = array[:, 0] + array[:, 2]
+        cy = array[:, 1] + array[:, 3]
+        leaves = -(-len(boxes) // self.max_entries)
+        slab = self.max_entries * math.ceil(math.sqrt(leaves))
+        order = np.argsort(cx, kind='stable')
+        groups = []
+        for start in range(0, len(order), slab):
+            strip = order[start:start + slab]
+            strip = strip[np.argsort(cy[strip], kind='stable')].tolist()
+            groups.extend(strip[i:i + self.max_entries] for i in range(0, len(strip), self.max_entries))
+        return groups
 
-        # Подписи на осях X и Y:
-        for i in range(-10, 11):
-            if i != 0:
-                x_pos = mid_x + (i * GRID_SIZE)
-                label_x = self.font.render(str(i), True, TEXT_COLOR)
-                self.screen.blit(label_x, (x_pos - 10, mid_y + 5))
+    def insert(self, key, box: Tuple[float, float, float, float]):
+        box = tuple(box)
+        split = self.insert_into(self.root, key, box)
+        if split:
+            self.root = RTreeNode(False, [self.root.bounds(), split.bounds()], [self.root, split])
+        self.size += 1
 
-                y_pos = mid_y - (i * GRID_SIZE)
-                label_y = self.font.render(str(i), True, TEXT_COLOR)
-                self.screen.blit(label_y, (mid_x + 5, y_pos - 10))
+    def insert_into(self, node: RTreeNode, key, box: tuple):
+        if node.leaf:
+            node.boxes.append(box)
+            node.children.append(key)
+        else:
+            # Поддерево, рамка которого расширится меньше всего, при равенстве — меньшее по площади
+            bx0, by0, bx1, by1 = box
+            best, best_cost = 0, None
+            for i, (x0, y0, x1, y1) in enumerate(node.boxes):
+                area = (x1 - x0) * (y1 - y0)
+                cost = ((max(x1, bx1) - min(x0, bx0)) * (max(y1, by1) - min(y0, by0)) - area, area)
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = i, cost
+            child = node.children[best]
+            split = self.insert_into(child, key, box)
+            node.boxes[best] = child.bounds()
+            if split:
+                node.boxes.append(split.bounds())
+                node.children.append(split)
+        return self.split(node) if len(node.children) > self.max_entries else None
 
-    def draw_info_panel(self):
+    def split(self, node: RTreeNode) -> RTreeNode:
         """
-        Отрисовка панели с информацией и подсказками управления.
+        Квадратичное разбиение Гуттмана: зёрна — пара записей с наибольшей
+        «пустой» площадью общей рамки, остальные записи раздаются по одной,
+        начиная с той, что сильнее всего предпочитает одну из групп.
+        Первая группа остаётся в node, вторая возвращается новым узлом.
         """
-        panel_rect = pygame.Rect(WINDOW_WIDTH - INFO_PANEL_WIDTH, 0, INFO_PANEL_WIDTH, WINDOW_HEIGHT)
-        pygame.draw.rect(self.screen, PANEL_COLOR, panel_rect)
-        pygame.draw.line(self.screen, AXIS_COLOR,
-                         (WINDOW_WIDTH - INFO_PANEL_WIDTH, 0),
-                         (WINDOW_WIDTH - INFO_PANEL_WIDTH, WINDOW_HEIGHT), 3)
+        entries = list(zip(node.boxes, node.children))
+        areas = [box_area(box) for box, _ in entries]
+        _, first, second = max((box_area(box_merge(entries[i][0], entries[j][0])) - areas[i] - areas[j], i, j)
+                               for i in range(len(entries)) for j in range(i + 1, len(entries)))
+        groups = ([entries[first]], [entries[second]])
+        bounds = [entries[first][0], entries[second][0]]
+        rest = [entry for i, entry in enumerate(entries) if i not in (first, second)]
 
-        mode_text = f"Режим: {'Многоугольник' if self.mode == Mode.POLYGON else 'Линия'}"
-        window_mode_text = f"Окно: {'Включено' if self.window_mode else 'Выключено'}"
-        state_text = f"Состояние: {'Рисование' if self.state == State.DRAWING else 'Создание окна'}"
-        mode_surface = self.font.render(mode_text, True, TEXT_COLOR)
-        window_mode_surface = self.font.render(window_mode_text, True, TEXT_COLOR)
-        state_surface = self.font.render(state_text, True, TEXT_COLOR)
+        while rest:
+            # Если группе не хватает записей до минимума, она забирает все оставшиеся
+            for g in (0, 1):
+                if len(groups[g]) + len(rest) <= self.min_entries:
+                    groups[g].extend(rest)
+                    bounds[g] = box_union([bounds[g]] + [box for box, _ in rest])
+                    rest = []
+            if not rest:
+                break
 
-        self.screen.blit(mode_surface, (WINDOW_WIDTH - INFO_PANEL_WIDTH + 20, 20))
-        self.screen.blit(window_mode_surface, (WINDOW_WIDTH - INFO_PANEL_WIDTH + 20, 50))
-        self.screen.blit(state_surface, (WINDOW_WIDTH - INFO_PANEL_WIDTH + 20, 80))
+            def growth(entry):
+                return [box_area(box_merge(bounds[g], entry[0])) - box_area(bounds[g]) for g in (0, 1)]
 
-        controls = [
-            "Управление:",
-            "M    - Сменить режим (линия/многоуг.)",
-            "W    - Вкл/выкл создание окна",
-            "Space - Замкнуть многоугольник",
-            "Enter - Отсечь все фигуры",
-            "Backspace - Удалить последнюю точку",
-            "Delete    - Удалить последнюю фигуру",
-            "C    - Сбросить окно отсечения",
-            "G    - Показать/скрыть сетку",
-            "ESC  - Очистить всё",
-        ]
+            growths = [growth(entry) for entry in rest]
+            index = max(range(len(rest)), key=lambda i: abs(growths[i][0] - growths[i][1]))
+            entry = rest.pop(index)
+            d0, d1 = growths[index]
+            g = 0 if (d0, box_area(bounds[0]), len(groups[0])) <= (d1, box_area(bounds[1]), len(groups[1])) else 1
+            groups[g].append(entry)
+            bounds[g] = box_merge(bounds[g], entry[0])
 
-        y_offset = 120
-        for control in controls:
-            control_surface = self.font.render(control, True, TEXT_COLOR)
-            self.screen.blit(control_surface, (WINDOW_WIDTH - INFO_PANEL_WIDTH + 20, y_offset))
-            y_offset += 30
+        node.boxes = [box for box, _ in groups[0]]
+        node.children = [child for _, child in groups[0]]
+        return RTreeNode(node.leaf, [box for box, _ in groups[1]], [child for _, child in groups[1]])
+
+    def remove(self, key, box: Tuple[float, float, float, float]) -> bool:
+        """
+        Удаление записи; box нужен, чтобы спускаться только в покрывающие узлы.
+        Узлы, в которых осталось меньше min_entries записей, распускаются,
+        а их листовые записи вставляются заново.
+        """
+        orphans = []
+        if not self.remove_from(self.root, key, tuple(box), orphans):
+            return False
+        self.size -= 1 + len(orphans)
+        if not self.root.leaf and len(self.root.children) == 1:
+            self.root = self.root.children[0]
+        for orphan_box, orphan_key in orphans:
+            self.insert(orphan_key, orphan_box)
+        return True
+
+    def remove_from(self, node: RTreeNode, key, box: tuple, orphans: list) -> bool:
+        if node.leaf:
+            for i, (entry_box, entry_key) in enumerate(zip(node.boxes, node.children)):
+                if entry_key == key and entry_box == box:
+                    del node.boxes[i], node.children[i]
+                    return True
+            return False
+
+        for i, (child_box, child) in enumerate(zip(node.boxes, node.children)):
+            if not (child_box[0] <= box[0] and child_box[1] <= box[1] and child_box[2] >= box[2] and child_box[3] >= box[3]):
+                continue
+            if self.remove_from(child, key, box, orphans):
+                if len(child.children) < self.min_entries:
+                    del node.boxes[i], node.children[i]
+                    orphans.extend(self.entries(child))
+                else:
+                    node.boxes[i] = child.bounds()
+                return True
+        return False
+
+    def entries(self, node: RTreeNode) -> List[tuple]:
+        # Все листовые записи (рамка, ключ) поддерева
+        if node.leaf:
+            return list(zip(node.boxes, node.children))
+        return [entry for child in node.children for entry in self.entries(child)]
+
+    def window_query(self, box: Tuple[float, float, float, float]) -> Tuple[list, list]:
+        """
+        Запрос окном: ключи записей, рамки которых целиком внутри окна, и ключи
+        тех, что его пересекают (касание границы считается пересечением).
+        Поддеревья, рамка которых целиком внутри окна, собираются без проверок.
+        """
+        xmin, ymin, xmax, ymax = box
+        inside, crossing = [], []
+        stack = [self.root] if self.root.children else []
+        while stack:
+            node = stack.pop()
+            for (bx0, by0, bx1, by1), child in zip(node.boxes, node.children):
+                if bx1 < xmin or bx0 > xmax or by1 < ymin or by0 > ymax:
+                    continue
+                if bx0 >= xmin and bx1 <= xmax and by0 >= ymin and by1 <= ymax:
+                    inside.extend([child] if node.leaf else [key for _, key in self.entries(child)])
+                elif node.leaf:
+                    crossing.append(child)
+                else:
+                    stack.append(child)
+        return inside, crossing
+
+class Clipper:
+    """
+    Алгоритмы отсечения без зависимости от окна pygame: прямоугольное окно
+    clipping_window (xmin, ymin, xmax, ymax) или окно-многоугольник clip_region,
+    выбранный алгоритм для отрезков и булева операция для многоугольников.
+    """
+    # Алгоритмы отсечения отрезков: скалярная и пакетная версии
+    CLIP_ENGINES = {
+        'cohen_sutherland': 'cohen_sutherland_clip',
+        'liang_barsky': 'liang_barsky_clip',
+        'cyrus_beck': 'cyrus_beck_clip',
+    }
+
+    BATCH_CLIP_ENGINES = {
+        'cohen_sutherland': 'batch_cohen_sutherland_clip',
+        'liang_barsky': 'batch_liang_barsky_clip',
+        'cyrus_beck': 'batch_cyrus_beck_clip',
+    }
+
+    ENGINE_NAMES = {
+        'cohen_sutherland': 'Коэн-Сазерленд',
+        'liang_barsky': 'Лян-Барски',
+        'cyrus_beck': 'Кирус-Бек',
+        'region': 'невыпуклое окно',
+    }
+
+    OPERATION_NAMES = {
+        'intersection': 'пересечение',
+        'union': 'объединение',
+        'difference': 'разность',
+    }
+
+    def __init__(self, window: Tuple[float, float, float, float] = None,
+                 region: List[Tuple[float, float]] = None,
+                 engine: str = 'cohen_sutherland', operation: str = 'intersection'):
+        if engine not in self.CLIP_ENGINES:
+            raise ValueError(f"неизвестный алгоритм: {engine}")
+        if operation not in BOOLEAN_OPERATIONS:
+            raise ValueError(f"неизвестная операция: {operation}")
+        self.clipping_window = tuple(window) if window else None
+        self.clip_region = None  # окно-многоугольник (вершины против часовой стрелки)
+        self.region_convex = False
+        self.engine = engine
+        self.operation = operation
+        if region is not None and not self.set_region(region):
+            raise ValueError("вырожденное окно-многоугольник")
+
+    def set_region(self, polygon: List[Tuple[float, float]]) -> bool:
+        """
+        Окно-многоугольник вместо прямоугольного окна. Возвращает False и
+        ничего не меняет, если многоугольник вырожденный.
+        """
+        window = self.oriented_polygon([(x, y) for x, y in polygon])
+        if not window:
+            return False
+        self.clip_region = window
+        self.region_convex = self.is_convex(window)
+        self.clipping_window = None
+        return True
+
+    def copy(self) -> 'Clipper':
+        # Только настройки отсечения, без состояния подкласса: такой Clipper можно передать в другой процесс
+        return Clipper(self.clipping_window, self.clip_region, self.engine, self.operation)
+
+    def window_box(self) -> Tuple[float, float, float, float]:
+        # Рамка окна отсечения или None, если окна нет
+        window = self.window_polygon()
+        if not window:
+            return None
+        return (min(x for x, _ in window), min(y for _, y in window),
+                max(x for x, _ in window), max(y for _, y in window))
+
+    def box_status(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Положение рамок N×4 относительно рамки окна: BOX_INSIDE, BOX_CROSSING
+        или BOX_OUTSIDE. Для окна-многоугольника рамка внутри его рамки ничего
+        не гарантирует и считается пересекающей, как и все рамки без окна.
+        """
+        box = self.window_box()
+        if box is None:
+            return np.full(len(boxes), BOX_CROSSING, dtype=np.int8)
+        xmin, ymin, xmax, ymax = box
+        bx0, by0, bx1, by1 = np.asarray(boxes, dtype=np.float64).reshape(-1, 4).T
+        inside = (bx0 >= xmin) & (bx1 <= xmax) & (by0 >= ymin) & (by1 <= ymax)
+        status = np.where(inside, BOX_CROSSING if self.clip_region else BOX_INSIDE, BOX_CROSSING)
+        status = np.where((bx1 < xmin) | (bx0 > xmax) | (by1 < ymin) | (by0 > ymax), BOX_OUTSIDE, status)
+        return status.astype(np.int8)
+
+    def clip_segment_array(self, segments) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Отсечение массива отрезков N×4 (x1, y1, x2, y2). Возвращает (pieces,
+        source): куски M×4 и номера исходных отрезков по возрастанию. Отрезок
+        даёт не больше одного куска, для невыпуклого окна — несколько.
+        """
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        if not self.window_polygon():
+            return np.empty((0, 4)), np.empty(0, dtype=np.intp)
+        if self.active_engine() == 'region':
+            pieces, source = [], []
+            for i, (x1, y1, x2, y2) in enumerate(segments.tolist()):
+                for piece in clip_segment_region(x1, y1, x2, y2, self.clip_region):
+                    pieces.append(piece)
+                    source.append(i)
+            return np.array(pieces, dtype=np.float64).reshape(-1, 4), np.array(source, dtype=np.intp)
+        accept, clipped = self.batch_clip(segments)
+        return clipped[accept], np.flatnonzero(accept)
+
+    def clip_polygon_array(self, vertices, offsets, operation: str = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Булева операция с окном для P многоугольников, записанных подряд:
+        вершины V×2, многоугольник i — vertices[offsets[i]:offsets[i + 1]].
+        Возвращает контуры результата в том же виде (vertices, offsets) и
+        номера исходных многоугольников source для каждого контура.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.intp)
+        operation = operation or self.operation
+        count = len(offsets) - 1
+        if count <= 0:
+            return np.empty((0, 2)), np.zeros(1, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+        starts = offsets[:-1]
+        boxes = np.stack([np.minimum.reduceat(vertices[:, 0], starts), np.minimum.reduceat(vertices[:, 1], starts),
+                          np.maximum.reduceat(vertices[:, 0], starts), np.maximum.reduceat(vertices[:, 1], starts)],
+                         axis=1)
+        result_vertices, result_offsets, source = [], [0], []
+        for i, position in enumerate(self.box_status(boxes).tolist()):
+            polygon = [(x, y) for x, y in vertices[offsets[i]:offsets[i + 1]].tolist()]
+            contours = self.trivial_result(polygon, position, operation)
+            if contours is None:
+                contours = self.clip_polygon_shape(polygon, operation)
+            for contour in contours:
+                result_vertices.extend(contour)
+                result_offsets.append(len(result_vertices))
+                source.append(i)
+        return (np.array(result_vertices, dtype=np.float64).reshape(-1, 2),
+                np.array(result_offsets, dtype=np.intp), np.array(source, dtype=np.intp))
+
+    def clip_scene(self, vertices, offsets, indices, status) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Отсечение фигур indices сцены (vertices, offsets), как в файле сцены,
+        при положении их рамок status. Делает то же, что App.recompute, но
+        возвращает контуры в виде (vertices, offsets) и номера source — позиции
+        фигур в indices: такой результат дёшево передать между процессами.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.intp)
+        indices = np.asarray(indices, dtype=np.intp)
+        status = np.asarray(status, dtype=np.int8)
+        starts, ends = offsets[indices], offsets[indices + 1]
+        batched = (status == BOX_CROSSING) & (ends - starts == 2)
+        if self.active_engine() == 'region':
+            batched[:] = False
+
+        results = [None] * len(indices)
+        for k in np.flatnonzero(~batched).tolist():
+            shape = [(x, y) for x, y in vertices[starts[k]:ends[k]].tolist()]
+            result = self.trivial_result(shape, int(status[k]))
+            results[k] = result if result is not None else self.clip_shape(shape)
+
+        batch = np.flatnonzero(batched)
+        if len(batch):
+            accept, clipped = self.batch_clip(np.hstack([vertices[starts[batch]], vertices[starts[batch] + 1]]))
+            for k in batch.tolist():
+                results[k] = []
+            for k, (x1, y1, x2, y2) in zip(batch[accept].tolist(), clipped[accept].tolist()):
+                results[k] = [[(x1, y1), (x2, y2)]]
+
+        result_vertices, result_offsets, source = [], [0], []
+        for k, contours in enumerate(results):
+            for contour in contours:
+                result_vertices.extend(contour)
+                result_offsets.append(len(result_vertices))
+                source.append(k)
+        return (np.array(result_vertices, dtype=np.float64).reshape(-1, 2),
+                np.array(result_offsets, dtype=np.intp), np.array(source, dtype=np.intp))
 
     def compute_outcode(self, x: float, y: float) -> int:
         """
@@ -188,28 +894,275 @@ class App:
 
         return accept, x1, y1, x2, y2
 
+    def compute_outcodes(self, x: np.ndarray, y: np.ndarray, window: Tuple[float, float, float, float]) -> np.ndarray:
+        """
+        Вычисление кодов положения сразу для массивов координат x и y.
+        Биты те же, что и в compute_outcode.
+        """
+        xmin, ymin, xmax, ymax = window
+        code = np.where(x < xmin, 1, np.where(x > xmax, 2, 0))
+        code |= np.where(y < ymin, 4, np.where(y > ymax, 8, 0))
+        return code.astype(np.uint8)
+
+    def batch_cohen_sutherland_clip(self, segments) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Отсечение массива отрезков N×4 (x1, y1, x2, y2) по Коэну-Сазерленду.
+        Коды считаются для всех концов за один проход, тривиально принятые и
+        отброшенные отрезки отделяются побитовыми операциями, а пересечения
+        вычисляются только для оставшихся (не более четырёх итераций).
+        Возвращает (accept, clipped) — маску принятых отрезков и массив N×4
+        с концами после отсечения; результат совпадает с cohen_sutherland_clip.
+        """
+        clipped = np.array(segments, dtype=np.float64).reshape(-1, 4)
+        accept = np.zeros(len(clipped), dtype=bool)
+        if not self.clipping_window:
+            return accept, clipped
+
+        window = self.clipping_window
+        xmin, ymin, xmax, ymax = window
+        codes = np.empty((len(clipped), 2), dtype=np.uint8)
+        codes[:, 0] = self.compute_outcodes(clipped[:, 0], clipped[:, 1], window)
+        codes[:, 1] = self.compute_outcodes(clipped[:, 2], clipped[:, 3], window)
+
+        pending = np.arange(len(clipped))
+        while pending.size:
+            code1 = codes[pending, 0]
+            code2 = codes[pending, 1]
+            # Полностью внутри
+            inside = (code1 | code2) == 0
+            accept[pending[inside]] = True
+            # Полностью вне отбрасываем, остальные отсекаем дальше
+            pending = pending[~inside & ((code1 & code2) == 0)]
+            if not pending.size:
+                break
+
+            code1 = codes[pending, 0]
+            first = code1 != 0
+            outcode_out = np.where(first, code1, codes[pending, 1])
+            x1, y1, x2, y2 = clipped[pending].T
+            x = np.empty(len(pending))
+            y = np.empty(len(pending))
+
+            # Порядок проверки битов тот же, что в скалярной версии
+            above = (outcode_out & 8) != 0
+            below = ~above & ((outcode_out & 4) != 0)
+            right = ~above & ~below & ((outcode_out & 2) != 0)
+            left = ~above & ~below & ~right
+            for side, bound in ((above, ymax), (below, ymin)):
+                x[side] = x1[side] + (x2[side] - x1[side]) * (bound - y1[side]) / (y2[side] - y1[side])
+                y[side] = bound
+            for side, bound in ((right, xmax), (left, xmin)):
+                y[side] = y1[side] + (y2[side] - y1[side]) * (bound - x1[side]) / (x2[side] - x1[side])
+                x[side] = bound
+
+            # Заменяем тот конец, который лежал вне окна
+            for end, rows in ((0, first), (1, ~first)):
+                index = pending[rows]
+                clipped[index, 2 * end] = x[rows]
+                clipped[index, 2 * end + 1] = y[rows]
+                codes[index, end] = self.compute_outcodes(x[rows], y[rows], window)
+
+        return accept, clipped
+
+    @staticmethod
+    def parametric_clip(x1: float, y1: float, x2: float, y2: float,
+                        planes: List[Tuple[float, float]]) -> Tuple[bool, float, float, float, float]:
+        """
+        Параметрическое отсечение отрезка P(t) = P1 + t·(P2 - P1), t ∈ [0, 1].
+        Каждая граница задаётся парой (p, q) с условием p·t <= q: при p < 0
+        граница входная и поднимает t0, при p > 0 — выходная и опускает t1,
+        при p = 0 отрезок параллелен границе и отбрасывается, если q < 0.
+        """
+        t0, t1 = 0.0, 1.0
+        for p, q in planes:
+            if p == 0:
+                if q < 0:
+                    return False, x1, y1, x2, y2
+                continue
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return False, x1, y1, x2, y2
+                if t > t0:
+                    t0 = t
+            else:
+                if t < t0:
+                    return False, x1, y1, x2, y2
+                if t < t1:
+                    t1 = t
+
+        dx, dy = x2 - x1, y2 - y1
+        return True, x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy
+
+    @staticmethod
+    def batch_parametric_clip(segments: np.ndarray, planes) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Пакетный вариант parametric_clip: planes — пары массивов (p, q) длины N.
+        Отрезок принимается, если итоговые t0 <= t1, что совпадает с ранними
+        выходами скалярной версии.
+        """
+        accept = np.ones(len(segments), dtype=bool)
+        t0 = np.zeros(len(segments))
+        t1 = np.ones(len(segments))
+        for p, q in planes:
+            parallel = p == 0
+            accept &= ~(parallel & (q < 0))
+            t = q / np.where(parallel, 1, p)
+            t0 = np.where((p < 0) & (t > t0), t, t0)
+            t1 = np.where((p > 0) & (t < t1), t, t1)
+        accept &= t0 <= t1
+
+        x1, y1, x2, y2 = segments.T
+        dx, dy = x2 - x1, y2 - y1
+        clipped = np.stack([x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy], axis=1)
+        return accept, clipped
+
+    def liang_barsky_clip(self, x1: float, y1: float, x2: float, y2: float) -> Tuple[bool, float, float, float, float]:
+        """
+        Отсечение отрезка прямоугольным окном по Ляну-Барски: четыре границы
+        за один проход без повторного вычисления пересечений.
+        """
+        if not self.clipping_window:
+            return False, x1, y1, x2, y2
+
+        xmin, ymin, xmax, ymax = self.clipping_window
+        dx, dy = x2 - x1, y2 - y1
+        return self.parametric_clip(x1, y1, x2, y2,
+                                    [(-dx, x1 - xmin), (dx, xmax - x1), (-dy, y1 - ymin), (dy, ymax - y1)])
+
+    def batch_liang_barsky_clip(self, segments) -> Tuple[np.ndarray, np.ndarray]:
+        segments = np.array(segments, dtype=np.float64).reshape(-1, 4)
+        if not self.clipping_window:
+            return np.zeros(len(segments), dtype=bool), segments
+
+        xmin, ymin, xmax, ymax = self.clipping_window
+        x1, y1, x2, y2 = segments.T
+        dx, dy = x2 - x1, y2 - y1
+        return self.batch_parametric_clip(segments,
+                                          [(-dx, x1 - xmin), (dx, xmax - x1), (-dy, y1 - ymin), (dy, ymax - y1)])
+
+    def window_polygon(self) -> List[Tuple[float, float]]:
+        """
+        Окно отсечения в виде многоугольника с обходом против часовой стрелки
+        (в системе координат с осью y вверх), как того требует clip_polygon.
+        """
+        if self.clip_region:
+            return self.clip_region
+        if not self.clipping_window:
+            return []
+        xmin, ymin, xmax, ymax = self.clipping_window
+        return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+
+    @staticmethod
+    def oriented_polygon(polygon: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        """
+        Вершины многоугольника с обходом против часовой стрелки или пустой
+        список, если он вырожденный.
+        """
+        if len(polygon) < 3:
+            return []
+        area = signed_area(polygon)
+        if area == 0:
+            return []
+        return list(polygon) if area > 0 else list(reversed(polygon))
+
+    @staticmethod
+    def is_convex(vertices: List[Tuple[float, float]]) -> bool:
+        # Вершины должны идти против часовой стрелки (см. oriented_polygon)
+        n = len(vertices)
+        for i in range(n):
+            (ax, ay), (bx, by), (cx, cy) = vertices[i], vertices[(i + 1) % n], vertices[(i + 2) % n]
+            if orient2d(ax, ay, bx, by, cx, cy) < 0:
+                return False
+        return True
+
+    def cyrus_beck_clip(self, x1: float, y1: float, x2: float, y2: float) -> Tuple[bool, float, float, float, float]:
+        """
+        Отсечение отрезка выпуклым окном по Кирусу-Беку. Для ребра A→B
+        внутренняя нормаль даёт f(P) = (B - A) × (P - A) >= 0, так что вдоль
+        отрезка f(t) = f(P1) + t·((B - A) × (P2 - P1)).
+        """
+        window = self.window_polygon()
+        if not window:
+            return False, x1, y1, x2, y2
+
+        dx, dy = x2 - x1, y2 - y1
+        planes = []
+        for (ax, ay), (bx, by) in zip(window, window[1:] + window[:1]):
+            ex, ey = bx - ax, by - ay
+            planes.append((ey * dx - ex * dy, ex * (y1 - ay) - ey * (x1 - ax)))
+        return self.parametric_clip(x1, y1, x2, y2, planes)
+
+    def batch_cyrus_beck_clip(self, segments) -> Tuple[np.ndarray, np.ndarray]:
+        segments = np.array(segments, dtype=np.float64).reshape(-1, 4)
+        window = self.window_polygon()
+        if not window:
+            return np.zeros(len(segments), dtype=bool), segments
+
+        x1, y1, x2, y2 = segments.T
+        dx, dy = x2 - x1, y2 - y1
+        planes = []
+        for (ax, ay), (bx, by) in zip(window, window[1:] + window[:1]):
+            ex, ey = bx - ax, by - ay
+            planes.append((ey * dx - ex * dy, ex * (y1 - ay) - ey * (x1 - ax)))
+        return self.batch_parametric_clip(segments, planes)
+
+    def active_engine(self) -> str:
+        # Выпуклое окно умеет отсекать только Кирус-Бек, невыпуклое — clip_segment_region
+        if self.clip_region:
+            return 'cyrus_beck' if self.region_convex else 'region'
+        return self.engine
+
+    def next_engine(self):
+        engines = list(self.CLIP_ENGINES)
+        self.engine = engines[(engines.index(self.engine) + 1) % len(engines)]
+
+    def next_operation(self):
+        self.operation = BOOLEAN_OPERATIONS[(BOOLEAN_OPERATIONS.index(self.operation) + 1) % len(BOOLEAN_OPERATIONS)]
+
+    def clip_segment(self, x1: float, y1: float, x2: float, y2: float) -> Tuple[bool, float, float, float, float]:
+        return getattr(self, self.CLIP_ENGINES[self.active_engine()])(x1, y1, x2, y2)
+
+    def clip_polygon_shape(self, polygon: List[Tuple[float, float]],
+                           operation: str = None) -> List[List[Tuple[float, float]]]:
+        """
+        Булева операция многоугольника с окном (по умолчанию self.operation).
+        Пересечение двух выпуклых многоугольников остаётся за
+        Сазерлендом-Ходжменом, остальные случаи (невыпуклый многоугольник или
+        окно, объединение, разность) считаются по Грейнеру-Хорману и могут дать
+        несколько контуров.
+        """
+        operation = operation or self.operation
+        window = self.window_polygon()
+        if not window:
+            return [polygon]
+        if operation == 'intersection' and (self.region_convex or not self.clip_region):
+            vertices = self.oriented_polygon(polygon)
+            if vertices and self.is_convex(vertices):
+                clipped = self.clip_polygon(polygon)
+                return [clipped] if clipped else []
+        return polygon_boolean(polygon, window, operation)
+
+    def batch_clip(self, segments) -> Tuple[np.ndarray, np.ndarray]:
+        return getattr(self, self.BATCH_CLIP_ENGINES[self.active_engine()])(segments)
+
     def clip_polygon(self, polygon: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
         """
         Отсечение многоугольника алгоритмом Клипа–Коэна (Sutherland–Hodgman).
+        Точки на границе окна считаются внутренними и попадают в результат
+        как есть; пересечение ищется, только когда концы ребра строго по разные
+        стороны границы, поэтому параллельные границе рёбра ничего не делят.
         """
-        def inside(p: Tuple[float, float], cp1: Tuple[float, float], cp2: Tuple[float, float]) -> bool:
-            return (cp2[0] - cp1[0]) * (p[1] - cp1[1]) > (cp2[1] - cp1[1]) * (p[0] - cp1[0])
-
         def compute_intersection(p1: Tuple[float, float], p2: Tuple[float, float],
                                  cp1: Tuple[float, float], cp2: Tuple[float, float]) -> Tuple[float, float]:
-            dc = (cp1[0] - cp2[0], cp1[1] - cp2[1])
-            dp = (p1[0] - p2[0], p1[1] - p2[1])
-            n1 = cp1[0] * cp2[1] - cp1[1] * cp2[0]
-            n2 = p1[0] * p2[1] - p1[1] * p2[0]
-            n3 = 1.0 / (dc[0] * dp[1] - dc[1] * dp[0])
-            return ((n1 * dp[0] - n2 * dc[0]) * n3, (n1 * dp[1] - n2 * dc[1]) * n3)
+            t = line_crossing(*cp1, *cp2, *p1, *p2)
+            return (p1[0] + t * (p2[0] - p1[0]), p1[1] + t * (p2[1] - p1[1]))
 
-        if not self.clipping_window:
+        clip_polygon = self.window_polygon()
+        if not clip_polygon:
             return polygon
 
         output_polygon = polygon
-        xmin, ymin, xmax, ymax = self.clipping_window
-        clip_polygon = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
 
         for i in range(len(clip_polygon)):
             cp1 = clip_polygon[i]
@@ -221,35 +1174,624 @@ class App:
             if not input_polygon:
                 break
 
-            s = input_polygon[-1]
-            for e in input_polygon:
-                if inside(e, cp1, cp2):
-                    if not inside(s, cp1, cp2):
+            # Сторона каждой вершины: 1 — внутри, 0 — на границе, -1 — снаружи
+            sides = [orient2d(*cp1, *cp2, *p) for p in input_polygon]
+            s, s_side = input_polygon[-1], sides[-1]
+            for e, e_side in zip(input_polygon, sides):
+                if e_side >= 0:
+                    if s_side < 0 < e_side:
                         output_polygon.append(compute_intersection(s, e, cp1, cp2))
                     output_polygon.append(e)
-                elif inside(s, cp1, cp2):
+                elif s_side > 0:
                     output_polygon.append(compute_intersection(s, e, cp1, cp2))
-                s = e
+                s, s_side = e, e_side
 
+        # От многоугольника, который только касается окна, остаются точки на границе
+        if len(output_polygon) < 3 or signed_area(output_polygon) == 0:
+            return []
         return output_polygon
 
-    def clip_shapes(self):
+    def trivial_result(self, shape: List[Tuple[float, float]], status: int, operation: str = None):
+        """
+        Результат для фигуры целиком внутри или снаружи окна без вызова отсечения;
+        None, если его нужно вычислять. Для многоугольников учитывается операция,
+        отрезки всегда пересекаются с окном.
+        """
+        operation = operation or self.operation
+        if status == BOX_CROSSING or (len(shape) > 2 and operation == 'union'):
+            return None
+        keep = status == BOX_INSIDE
+        if len(shape) > 2 and operation == 'difference':
+            keep = not keep
+        return [shape] if keep else []
+
+    def clip_shape(self, shape: List[Tuple[float, float]]) -> List[List[Tuple[float, float]]]:
+        """
+        Отсечение одной фигуры: отрезок даёт не больше одного куска
+        (несколько — для невыпуклого окна), многоугольник — список контуров.
+        """
+        if len(shape) > 2:
+            return self.clip_polygon_shape(shape)
+        (x1, y1), (x2, y2) = shape
+        if self.active_engine() == 'region':
+            return [[(x1, y1), (x2, y2)] for x1, y1, x2, y2 in clip_segment_region(x1, y1, x2, y2, self.clip_region)]
+        accept, x1, y1, x2, y2 = self.clip_segment(x1, y1, x2, y2)
+        return [[(x1, y1), (x2, y2)]] if accept else []
+
+
+# Сцена, к которой подключился процесс-исполнитель: имя блока → (блок, vertices, offsets)
+ATTACHED_SCENES = {}
+
+
+def attached_scene(name: str, vertex_count: int, shape_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Массивы сцены из блока общей памяти name без копирования. Процесс держит
+    подключённой только последнюю сцену: прежние блоки закрываются.
+    """
+    if name not in ATTACHED_SCENES:
+        for old in list(ATTACHED_SCENES):
+            memory = ATTACHED_SCENES.pop(old)[0]
+            memory.close()
+        memory = SharedMemory(name=name)
+        vertices = np.ndarray((vertex_count, 2), dtype=np.float64, buffer=memory.buf)
+        offsets = np.ndarray(shape_count + 1, dtype=np.int64, buffer=memory.buf, offset=vertices.nbytes)
+        ATTACHED_SCENES[name] = (memory, vertices, offsets)
+    return ATTACHED_SCENES[name][1:]
+
+
+def clip_part(clipper: Clipper, vertices: np.ndarray, offsets: np.ndarray,
+              indices: np.ndarray, status: np.ndarray) -> tuple:
+    # Часть работы исполнителя: результат clip_scene и счётчики предикатов, набранные за неё в этом потоке
+    before = PREDICATE_STATS.as_dict()
+    result = clipper.clip_scene(vertices, offsets, indices, status)
+    return result, {key: value - before[key] for key, value in PREDICATE_STATS.as_dict().items()}
+
+
+def clip_shared_part(clipper: Clipper, scene: tuple, indices: np.ndarray, status: np.ndarray) -> tuple:
+    # Часть работы процесса-исполнителя над сценой из общей памяти
+    return clip_part(clipper, *attached_scene(*scene), indices, status)
+
+
+def contour_lists(vertices: np.ndarray, offsets: np.ndarray, source: np.ndarray,
+                  count: int) -> List[List[List[Tuple[float, float]]]]:
+    # Контуры (vertices, offsets, source) в виде списков контуров для count фигур
+    results = [[] for _ in range(count)]
+    points = list(map(tuple, vertices.tolist()))
+    for k, start, end in zip(source.tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+        results[k].append(points[start:end])
+    return results
+
+
+class ClipPool:
+    """
+    Отсечение больших наборов фигур на нескольких ядрах. Фигуры делятся на
+    непрерывные части, результаты собираются в исходном порядке. Потоки
+    ('thread') выигрывают только на пакетных функциях NumPy, которые отпускают
+    GIL; отсечение многоугольников — чистый Python, ему нужны процессы
+    ('process'). Процессам сцена передаётся один раз через общую память, в
+    каждом задании идут только номера фигур.
+    """
+
+    def __init__(self, workers: int, backend: str = 'process'):
+        if workers < 1:
+            raise ValueError(f"число исполнителей должно быть положительным: {workers}")
+        if backend not in POOL_BACKENDS:
+            raise ValueError(f"неизвестный пул: {backend}")
+        self.workers = workers
+        self.backend = backend
+        self.executor = None  # создаётся при первом отсечении
+        self.memory = None    # блок общей памяти со сценой процессов
+        self.scene = None     # массивы сцены для потоков или (имя блока, вершин, фигур) для процессов
+
+    def share(self, vertices, offsets):
+        """
+        Передача сцены (vertices, offsets) исполнителям. Для процессов массивы
+        копируются в новый блок общей памяти, прежний блок освобождается.
+        """
+        vertices = np.ascontiguousarray(vertices, dtype=np.float64).reshape(-1, 2)
+        offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        self.release()
+        if self.backend == 'thread':
+            self.scene = (vertices, offsets)
+            return
+        self.memory = SharedMemory(create=True, size=max(vertices.nbytes + offsets.nbytes, 1))
+        self.memory.buf[:vertices.nbytes] = vertices.tobytes()
+        self.memory.buf[vertices.nbytes:vertices.nbytes + offsets.nbytes] = offsets.tobytes()
+        self.scene = (self.memory.name, len(vertices), len(offsets) - 1)
+
+    def clip(self, clipper: Clipper, indices, status) -> List[List[List[Tuple[float, float]]]]:
         """
-        Запуск отсечения для всех нарисованных фигур (отрезков и многоугольников).
+        Результаты отсечения фигур indices общей сцены при положении рамок
+        status, по списку контуров на фигуру в порядке indices.
         """
+        if self.scene is None:
+            raise ValueError("сцена не передана пулу")
+        indices = np.asarray(indices, dtype=np.intp)
+        status = np.asarray(status, dtype=np.int8)
+        if self.executor is None:
+            if self.backend == 'thread':
+                self.executor = ThreadPoolExecutor(self.workers)
+            else:
+                # spawn, а не fork: в родителе уже работают SDL и потоки NumPy
+                self.executor = ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'))
+        clipper = clipper.copy()
+        parts = [part for part in np.array_split(np.arange(len(indices)), self.workers * PARALLEL_CHUNKS) if len(part)]
+        part_indices = [indices[part] for part in parts]
+        part_status = [status[part] for part in parts]
+        if self.backend == 'thread':
+            parts_done = self.executor.map(clip_part, itertools.repeat(clipper), itertools.repeat(self.scene[0]),
+                                           itertools.repeat(self.scene[1]), part_indices, part_status)
+        else:
+            parts_done = self.executor.map(clip_shared_part, itertools.repeat(clipper),
+                                           itertools.repeat(self.scene), part_indices, part_status)
+        outputs = []
+        for output, stats in parts_done:
+            outputs.append(output)
+            PREDICATE_STATS.add(stats)
+        results = []
+        for part, output in zip(parts, outputs):
+            results.extend(contour_lists(*output, len(part)))
+        return results
+
+    def release(self):
+        # Освобождение блока общей памяти текущей сцены
+        self.scene = None
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.release()
+
+
+class App(Clipper):
+    def __init__(self, workers: int = 1, backend: str = 'process'):
+        super().__init__()
+        pygame.init()
+        self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        # Меняем заголовок окна (можно дополнить уточнением “Обновлённый интерфейс”):
+        pygame.display.set_caption("Алгоритм Коэна-Сазерленда (Обновлённый интерфейс)")
+        self.clock = pygame.time.Clock()
+        # Изменяем шрифт и размер на что-то более читаемое:
+        self.font = pygame.font.SysFont("Arial", 20)
+
+        self.mode = Mode.LINE
+        self.state = State.DRAWING
+        self.temp_point = None
+        self.current_line = []
+        self.current_polygon = []
+        self.shapes = []
+        self.window_start = None
+        self.drag_anchor = None
         self.clipped_shapes = []
-        for shape in self.shapes:
-            # Отрезки (2 точки)
-            if len(shape) == 2:
-                accept, x1, y1, x2, y2 = self.cohen_sutherland_clip(shape[0][0], shape[0][1],
-                                                                    shape[1][0], shape[1][1])
-                if accept:
-                    self.clipped_shapes.append([(x1, y1), (x2, y2)])
-            # Многоугольники
+        # Кэш отсечения: результат и положение рамки для каждой фигуры из self.shapes
+        self.shape_boxes = np.empty((0, 4))
+        self.shape_segments = np.empty((0, 4))  # концы отрезков, NaN для многоугольников
+        self.shape_index = RTree()  # рамки фигур по их номерам в self.shapes
+        self.clip_results = []
+        self.clip_status = np.empty(0, dtype=np.int8)
+        self.clip_visible = np.empty(0, dtype=np.intp)  # номера фигур, задевающих окно
+        self.clip_key = None
+        self.clip_box = None
+        self.clip_dirty = False
+        self.recomputed = 0
+        # Большие пересчёты раздаются пулу, если исполнителей больше одного
+        self.clip_pool = ClipPool(workers, backend) if workers > 1 else None
+        self.scene_shared = False  # передана ли пулу текущая сцена
+        self.show_grid = True
+        self.creating_window = False
+        self.window_mode = False
+        # Кэш отрисовки: слой перерисовывается, только когда меняется то, что на нём
+        self.grid_layer = None
+        self.shape_layer = None
+        self.drawn_shapes = 0  # сколько фигур из self.shapes уже на shape_layer
+        self.clip_layer = None
+        self.drawn_clipped = None  # список clipped_shapes, нарисованный на clip_layer
+        self.panel_layer = None
+        self.panel_text = {}  # строка панели → (текст, поверхность)
+        self.frame_time = 0
+        self.fps_text = "FPS: —"
+        self.fps_time = 0
+
+    def draw_grid(self, surface: pygame.Surface):
+        """
+        Отрисовка сетки и осей координат.
+        """
+        if not self.show_grid:
+            return
+
+        # Вертикальные и горизонтальные линии сетки:
+        for x in range(0, WINDOW_WIDTH - INFO_PANEL_WIDTH, GRID_SIZE):
+            pygame.draw.line(surface, GRID_COLOR, (x, 0), (x, WINDOW_HEIGHT))
+        for y in range(0, WINDOW_HEIGHT, GRID_SIZE):
+            pygame.draw.line(surface, GRID_COLOR, (0, y), (WINDOW_WIDTH - INFO_PANEL_WIDTH, y))
+
+        # Оси X и Y:
+        mid_x = (WINDOW_WIDTH - INFO_PANEL_WIDTH) // 2
+        mid_y = WINDOW_HEIGHT // 2
+        pygame.draw.line(surface, AXIS_COLOR, (0, mid_y), (WINDOW_WIDTH - INFO_PANEL_WIDTH, mid_y), 2)
+        pygame.draw.line(surface, AXIS_COLOR, (mid_x, 0), (mid_x, WINDOW_HEIGHT), 2)
+
+        # Подписи на осях X и Y:
+        for i in range(-10, 11):
+            if i != 0:
+                x_pos = mid_x + (i * GRID_SIZE)
+                label_x = self.font.render(str(i), True, TEXT_COLOR)
+                surface.blit(label_x, (x_pos - 10, mid_y + 5))
+
+                y_pos = mid_y - (i * GRID_SIZE)
+                label_y = self.font.render(str(i), True, TEXT_COLOR)
+                surface.blit(label_y, (mid_x + 5, y_pos - 10))
+
+    @staticmethod
+    def transparent_layer() -> pygame.Surface:
+        layer = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+        layer.fill(LAYER_KEY)
+        layer.set_colorkey(LAYER_KEY)
+        return layer
+
+    def grid_surface(self) -> pygame.Surface:
+        # Фон с сеткой меняется только по G
+        if self.grid_layer is None:
+            self.grid_layer = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+            self.grid_layer.fill(BACKGROUND)
+            self.draw_grid(self.grid_layer)
+        return self.grid_layer
+
+    def shape_surface(self) -> pygame.Surface:
+        """
+        Слой нарисованных фигур. Новые фигуры дорисовываются поверх, удаление
+        и загрузка сцены сбрасывают слой (shape_layer = None) целиком.
+        """
+        if self.shape_layer is None:
+            self.shape_layer = self.transparent_layer()
+            self.drawn_shapes = 0
+        if self.drawn_shapes < len(self.shapes):
+            # RLE-слой накладывается в разы быстрее, но рисовать на нём — значит
+            # перекодировать его на каждой линии, поэтому RLE включается после
+            self.shape_layer.set_colorkey(LAYER_KEY)
+            for shape in self.shapes[self.drawn_shapes:]:
+                color = POLYGON_COLOR if len(shape) > 2 else SHAPE_COLOR
+                pygame.draw.lines(self.shape_layer, color, len(shape) > 2, shape, 3)
+            self.shape_layer.set_colorkey(LAYER_KEY, pygame.RLEACCEL)
+            self.drawn_shapes = len(self.shapes)
+        return self.shape_layer
+
+    def clip_surface(self) -> pygame.Surface:
+        # update_clipping заменяет список clipped_shapes, только когда результат изменился
+        if self.clip_layer is None:
+            self.clip_layer = self.transparent_layer()
+        if self.drawn_clipped is not self.clipped_shapes:
+            self.clip_layer.fill(LAYER_KEY)
+            for shape in self.clipped_shapes:
+                pygame.draw.lines(self.clip_layer, CLIPPED_COLOR, len(shape) > 2, shape, 3)
+            self.drawn_clipped = self.clipped_shapes
+        return self.clip_layer
+
+    def panel_line(self, y: int, text: str):
+        # Строка панели рендерится шрифтом заново, только если текст изменился
+        cached = self.panel_text.get(y)
+        if cached is None or cached[0] != text:
+            cached = self.panel_text[y] = (text, self.font.render(text, True, TEXT_COLOR))
+        self.screen.blit(cached[1], (WINDOW_WIDTH - INFO_PANEL_WIDTH + 20, y))
+
+    def draw_info_panel(self):
+        """
+        Отрисовка панели с информацией и подсказками управления. Фон и
+        подсказки рисуются один раз, строки состояния — по тексту из кэша.
+        """
+        if self.panel_layer is None:
+            self.panel_layer = self.draw_panel_layer()
+        # Слой начинается на пиксель левее панели: там проходит разделительная линия
+        self.screen.blit(self.panel_layer, (WINDOW_WIDTH - INFO_PANEL_WIDTH - 1, 0))
+
+        # FPS обновляется пару раз в секунду: так его можно прочитать, а строку
+        # не приходится рендерить каждый кадр
+        now = time.perf_counter()
+        if now - self.fps_time >= FPS_INTERVAL:
+            self.fps_text = f"FPS: {self.clock.get_fps():.0f} (кадр {self.frame_time:.1f} мс)"
+            self.fps_time = now
+
+        self.panel_line(20, f"Режим: {'Многоугольник' if self.mode == Mode.POLYGON else 'Линия'}")
+        self.panel_line(50, f"Окно: {'Включено' if self.window_mode else 'Выключено'}")
+        self.panel_line(80, f"Состояние: {'Рисование' if self.state == State.DRAWING else 'Создание окна'}")
+        self.panel_line(110, f"Отсечение: {self.ENGINE_NAMES[self.active_engine()]}")
+        self.panel_line(140, f"Операция: {self.OPERATION_NAMES[self.operation]}")
+        self.panel_line(170, f"Пересчитано: {self.recomputed} из {len(self.shapes)}")
+        self.panel_line(200, self.fps_text)
+        exact, total = PREDICATE_STATS.exact, PREDICATE_STATS.fast + PREDICATE_STATS.exact
+        self.panel_line(230, f"Точные предикаты: {exact} из {total}")
+        if self.clip_pool is None:
+            self.panel_line(260, "Параллельно: нет")
+        else:
+            kind = 'потоков' if self.clip_pool.backend == 'thread' else 'процессов'
+            self.panel_line(260, f"Параллельно: {self.clip_pool.workers} {kind}")
+
+    def draw_panel_layer(self) -> pygame.Surface:
+        layer = pygame.Surface((INFO_PANEL_WIDTH + 1, WINDOW_HEIGHT))
+        layer.fill(PANEL_COLOR)
+        pygame.draw.line(layer, AXIS_COLOR, (1, 0), (1, WINDOW_HEIGHT), 3)
+
+        controls = [
+            "Управление:",
+            "M    - Сменить режим (линия/многоуг.)",
+            "W    - Вкл/выкл создание окна",
+            "ПКМ  - Перетащить окно",
+            "K    - Последний многоуг. как окно",
+            "E    - Сменить алгоритм отсечения",
+            "O    - Сменить операцию (многоуг.)",
+            "Space - Замкнуть многоугольник",
+            "Enter - Пересчитать отсечение заново",
+            "Backspace - Удалить последнюю точку",
+            "Delete    - Удалить последнюю фигуру",
+            "C    - Сбросить окно отсечения",
+            "G    - Показать/скрыть сетку",
+            f"S / L - Сохранить/загрузить {SCENE_PATH}",
+            f"R    - Случайная сцена ({SCENE_SIZE} фигур)",
+            "ESC  - Очистить всё",
+        ]
+
+        y_offset = 300
+        for control in controls:
+            control_surface = self.font.render(control, True, TEXT_COLOR)
+            layer.blit(control_surface, (21, y_offset))
+            y_offset += 30
+        return layer
+
+    @staticmethod
+    def shape_box(shape: List[Tuple[float, float]]) -> Tuple[float, float, float, float]:
+        xs = [x for x, _ in shape]
+        ys = [y for _, y in shape]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def add_shape(self, shape: List[Tuple[float, float]]):
+        self.shapes.append(shape)
+        self.shape_boxes = np.vstack([self.shape_boxes, self.shape_box(shape)])
+        self.shape_index.insert(len(self.shapes) - 1, self.shape_box(shape))
+        self.shape_segments = np.vstack([self.shape_segments, shape[0] + shape[1] if len(shape) == 2 else [np.nan] * 4])
+        self.clip_results.append([])
+        self.clip_status = np.append(self.clip_status, np.int8(BOX_UNKNOWN))
+        self.clip_dirty = True
+        self.scene_shared = False
+
+    def remove_shape(self, index: int) -> List[Tuple[float, float]]:
+        shape = self.shapes.pop(index)
+        if index == len(self.shapes):
+            self.shape_index.remove(index, self.shape_boxes[index].tolist())
+        self.shape_boxes = np.delete(self.shape_boxes, index, axis=0)
+        if index < len(self.shapes):
+            # Номера следующих фигур сдвинулись — индекс строится заново пакетно
+            self.shape_index = RTree.bulk_load(self.shape_boxes, range(len(self.shapes)))
+        self.shape_layer = None
+        self.shape_segments = np.delete(self.shape_segments, index, axis=0)
+        del self.clip_results[index]
+        self.clip_status = np.delete(self.clip_status, index)
+        self.clip_dirty = True
+        self.scene_shared = False
+        return shape
+
+    def load_shapes(self, vertices, offsets):
+        """
+        Замена всех фигур сценой из массивов (vertices, offsets), как в файле
+        сцены. Рамки, концы отрезков и R-дерево строятся пакетно, а не через
+        add_shape для каждой фигуры. Созданные списки вершин живут до следующей
+        загрузки, поэтому они замораживаются: иначе каждый проход сборщика мусора
+        обходил бы сотни тысяч объектов.
+        """
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.intp)
+        count = len(offsets) - 1
+        points = list(map(tuple, vertices.tolist()))
+        self.shapes = [points[a:b] for a, b in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+        if count:
+            starts = offsets[:-1]
+            self.shape_boxes = np.stack([np.minimum.reduceat(vertices[:, 0], starts),
+                                         np.minimum.reduceat(vertices[:, 1], starts),
+                                         np.maximum.reduceat(vertices[:, 0], starts),
+                                         np.maximum.reduceat(vertices[:, 1], starts)], axis=1)
+        else:
+            self.shape_boxes = np.empty((0, 4))
+        self.shape_segments = np.full((count, 4), np.nan)
+        segments = np.flatnonzero(np.diff(offsets) == 2)
+        self.shape_segments[segments] = np.hstack([vertices[offsets[segments]], vertices[offsets[segments] + 1]])
+        self.shape_index = RTree.bulk_load(self.shape_boxes, range(count))
+        self.clip_results = [[] for _ in range(count)]
+        self.clip_status = np.full(count, BOX_UNKNOWN, dtype=np.int8)
+        self.clip_visible = np.empty(0, dtype=np.intp)
+        self.clipped_shapes = []
+        self.clip_dirty = True
+        self.scene_shared = False
+        if self.clip_pool is not None:
+            self.clip_pool.share(vertices, offsets)
+            self.scene_shared = True
+        self.current_line = []
+        self.current_polygon = []
+        self.shape_layer = None
+        gc.collect()
+        gc.freeze()
+
+    def scene_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Фигуры в виде (vertices, offsets) для save_scene
+        offsets = np.zeros(len(self.shapes) + 1, dtype=np.int64)
+        np.cumsum([len(shape) for shape in self.shapes], out=offsets[1:])
+        vertices = np.array(list(itertools.chain.from_iterable(self.shapes)), dtype=np.float64).reshape(-1, 2)
+        return vertices, offsets
+
+    def clear_shapes(self):
+        self.shapes = []
+        self.shape_layer = None
+        self.shape_boxes = np.empty((0, 4))
+        self.shape_segments = np.empty((0, 4))
+        self.shape_index = RTree()
+        self.clip_results = []
+        self.clip_status = np.empty(0, dtype=np.int8)
+        self.clip_dirty = True
+        self.scene_shared = False
+
+    def query_window(self, box: Tuple[float, float, float, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Фигуры, рамки которых задевают рамку окна: упорядоченные номера и их
+        положение (внутри или на границе). Небольшое окно опрашивает R-дерево,
+        так что работа пропорциональна видимым фигурам; большое окно дешевле
+        проверить одним векторным проходом по shape_boxes. Целиком внутри может
+        быть только прямоугольное окно: для окна-многоугольника рамка внутри его
+        рамки ничего не гарантирует.
+        """
+        inside_status = BOX_CROSSING if self.clip_region else BOX_INSIDE
+        if len(self.shape_index) and box_area(box) * RTREE_SCAN_RATIO < box_area(self.shape_index.root.bounds()):
+            inside, crossing = self.shape_index.window_query(box)
+            indices = np.array(inside + crossing, dtype=np.intp)
+            status = np.full(len(indices), BOX_CROSSING, dtype=np.int8)
+            status[:len(inside)] = inside_status
+            order = np.argsort(indices)
+            return indices[order], status[order]
+
+        xmin, ymin, xmax, ymax = box
+        bx0, by0, bx1, by1 = self.shape_boxes.T
+        indices = np.flatnonzero(~((bx1 < xmin) | (bx0 > xmax) | (by1 < ymin) | (by0 > ymax)))
+        bx0, by0, bx1, by1 = self.shape_boxes[indices].T
+        status = np.where((bx0 >= xmin) & (bx1 <= xmax) & (by0 >= ymin) & (by1 <= ymax),
+                          inside_status, BOX_CROSSING).astype(np.int8)
+        return indices, status
+
+    def classify_shapes(self, box: Tuple[float, float, float, float]) -> np.ndarray:
+        # Положение рамок всех фигур: всё, чего нет в query_window, лежит снаружи
+        indices, visible = self.query_window(box)
+        status = np.full(len(self.shapes), BOX_OUTSIDE, dtype=np.int8)
+        status[indices] = visible
+        return status
+
+    def edges_affect(self, old: Tuple[float, float, float, float], new: Tuple[float, float, float, float],
+                     indices: np.ndarray) -> np.ndarray:
+        """
+        Какие из фигур indices своими рамками доходят до полосы между старым и
+        новым положением хотя бы одной сдвинувшейся стороны окна. Для остальных
+        эта сторона не участвует в отсечении ни до, ни после, и результат не меняется.
+        """
+        bx0, by0, bx1, by1 = self.shape_boxes[indices].T
+        affected = np.zeros(len(indices), dtype=bool)
+        if old[0] != new[0]:
+            affected |= bx0 <= max(old[0], new[0])
+        if old[1] != new[1]:
+            affected |= by0 <= max(old[1], new[1])
+        if old[2] != new[2]:
+            affected |= bx1 >= min(old[2], new[2])
+        if old[3] != new[3]:
+            affected |= by1 >= min(old[3], new[3])
+        return affected
+
+    def recompute(self, indices: np.ndarray, status: np.ndarray):
+        """
+        Пересекающие границу отрезки отсекаются одним пакетом, остальное — по
+        одной фигуре. Фигуры без готового результата при достаточном их числе
+        уходят пулу исполнителей.
+        """
+        batched = (status[indices] == BOX_CROSSING) & ~np.isnan(self.shape_segments[indices, 0])
+        if self.active_engine() == 'region':
+            batched[:] = False
+
+        single = indices[~batched]
+        pending = []
+        for i, position in zip(single.tolist(), status[single].tolist()):
+            result = self.trivial_result(self.shapes[i], position)
+            if result is None:
+                pending.append(i)
+            else:
+                self.clip_results[i] = result
+
+        batch = indices[batched]
+        if self.clip_pool is not None and len(pending) + len(batch) >= PARALLEL_MIN_SHAPES:
+            if not self.scene_shared:
+                self.clip_pool.share(*self.scene_arrays())
+                self.scene_shared = True
+            work = np.union1d(np.array(pending, dtype=np.intp), batch)
+            for i, result in zip(work.tolist(), self.clip_pool.clip(self, work, status[work])):
+                self.clip_results[i] = result
+            return
+
+        for i in pending:
+            self.clip_results[i] = self.clip_shape(self.shapes[i])
+        if len(batch):
+            accept, clipped = self.batch_clip(self.shape_segments[batch])
+            for i in batch[~accept].tolist():
+                self.clip_results[i] = []
+            for i, (x1, y1, x2, y2) in zip(batch[accept].tolist(), clipped[accept].tolist()):
+                self.clip_results[i] = [[(x1, y1), (x2, y2)]]
+
+    def update_clipping(self, full: bool = False):
+        """
+        Инкрементальное отсечение, вызывается каждый кадр. Результат фигуры
+        пересчитывается, только если её рамка сменила положение относительно окна
+        или задевает сдвинувшуюся сторону окна; фигуры целиком внутри или снаружи
+        и старого, и нового окна сохраняют прежний результат. Смена алгоритма,
+        операции или окна-многоугольника сбрасывает кэш целиком, как и объединение,
+        результат которого зависит от окна для любой фигуры.
+        """
+        box = self.window_box()
+        if box is None:
+            if self.clip_key is not None or self.clip_dirty:
+                self.clip_results = [[] for _ in self.shapes]
+                self.clip_status = np.full(len(self.shapes), BOX_UNKNOWN, dtype=np.int8)
+                self.clip_visible = np.empty(0, dtype=np.intp)
+                self.clipped_shapes = []
+                self.clip_key = self.clip_box = None
+                self.clip_dirty = False
+                self.recomputed = 0
+            return
+
+        key = (self.active_engine(), self.operation, self.clip_region)
+        if not full and not self.clip_dirty and key == self.clip_key and box == self.clip_box:
+            return
+
+        if full or self.clip_dirty or key != self.clip_key or self.operation == 'union':
+            status = self.classify_shapes(box)
+            if full or key != self.clip_key or self.operation == 'union':
+                indices = np.arange(len(self.shapes))
             else:
-                clipped = self.clip_polygon(shape)
-                if clipped:
-                    self.clipped_shapes.append(clipped)
+                stale = status != self.clip_status
+                if box != self.clip_box:
+                    stale |= (status == BOX_CROSSING) & self.edges_affect(self.clip_box, box, np.arange(len(self.shapes)))
+                indices = np.flatnonzero(stale)
+            self.clip_status = status
+            self.clip_visible = np.flatnonzero(status != BOX_OUTSIDE)
+        else:
+            # Сдвинулось только окно: положение может смениться лишь у фигур,
+            # задевающих старое или новое окно, остальные снаружи обоих
+            visible, visible_status = self.query_window(box)
+            candidates = np.union1d(self.clip_visible, visible)
+            status = np.full(len(candidates), BOX_OUTSIDE, dtype=np.int8)
+            status[np.searchsorted(candidates, visible)] = visible_status
+            stale = status != self.clip_status[candidates]
+            stale |= (status == BOX_CROSSING) & self.edges_affect(self.clip_box, box, candidates)
+            indices = candidates[stale]
+            self.clip_status[candidates] = status
+            self.clip_visible = visible
+        self.recompute(indices, self.clip_status)
+
+        self.clip_key = key
+        self.clip_box = box
+        self.clip_dirty = False
+        self.recomputed = len(indices)
+        # При пересечении результат есть только у фигур, задевающих окно
+        shown = self.clip_visible.tolist() if self.operation == 'intersection' else range(len(self.shapes))
+        self.clipped_shapes = list(itertools.chain.from_iterable(self.clip_results[i] for i in shown))
+
+    def clip_shapes(self):
+        """
+        Полный пересчёт отсечения для всех нарисованных фигур (отрезков и многоугольников).
+        """
+        self.update_clipping(full=True)
+
+    def move_window(self, pos):
+        # Перетаскивание прямоугольного окна правой кнопкой
+        dx, dy = pos[0] - self.drag_anchor[0], pos[1] - self.drag_anchor[1]
+        xmin, ymin, xmax, ymax = self.clipping_window
+        self.clipping_window = (xmin + dx, ymin + dy, xmax + dx, ymax + dy)
+        self.drag_anchor = pos
 
     def handle_mouse_click(self, pos):
         x, y = pos
@@ -271,7 +1813,7 @@ class App:
                     self.current_line = [pos]
                 else:
                     self.current_line.append(pos)
-                    self.shapes.append(self.current_line)
+                    self.add_shape(self.current_line)
                     self.current_line = []
             else:
                 # Режим многоугольника
@@ -284,7 +1826,7 @@ class App:
             x1, y1 = self.window_start
             if x < WINDOW_WIDTH - INFO_PANEL_WIDTH:
                 self.clipping_window = (min(x1, x), min(y1, y), max(x1, x), max(y1, y))
-                self.clipped_shapes = []
+                self.clip_region = None
                 self.creating_window = False
                 self.window_start = None
 
@@ -313,14 +1855,28 @@ class App:
                     # Замыкание многоугольника (пробел)
                     elif event.key == pygame.K_SPACE and self.mode == Mode.POLYGON:
                         if len(self.current_polygon) == 2:
-                            self.shapes.append(self.current_polygon)
+                            self.add_shape(self.current_polygon)
                             self.current_polygon = []
                         elif len(self.current_polygon) > 2:
-                            self.shapes.append(self.current_polygon)
+                            self.add_shape(self.current_polygon)
                             self.current_polygon = []
 
+                    # Последний многоугольник как окно отсечения (K)
+                    elif event.key == pygame.K_k:
+                        polygons = [i for i, shape in enumerate(self.shapes) if len(shape) > 2]
+                        if polygons and self.set_region(self.shapes[polygons[-1]]):
+                            self.remove_shape(polygons[-1])
+
+                    # Смена алгоритма отсечения отрезков (E)
+                    elif event.key == pygame.K_e:
+                        self.next_engine()
+
+                    # Смена булевой операции для многоугольников (O)
+                    elif event.key == pygame.K_o:
+                        self.next_operation()
+
                     # Отсечение (Enter)
-                    elif event.key == pygame.K_RETURN and self.clipping_window:
+                    elif event.key == pygame.K_RETURN and self.window_polygon():
                         self.clip_shapes()
 
                     # Удаление последней точки (Backspace)
@@ -331,25 +1887,36 @@ class App:
                     # Удаление последней фигуры (Delete)
                     elif event.key == pygame.K_DELETE:
                         if self.shapes:
-                            self.shapes.pop()
+                            self.remove_shape(len(self.shapes) - 1)
 
                     # Сброс окна отсечения (C)
                     elif event.key == pygame.K_c:
                         self.clipping_window = None
-                        self.clipped_shapes = []
+                        self.clip_region = None
                         self.state = State.DRAWING
 
                     # Показать/скрыть сетку (G)
                     elif event.key == pygame.K_g:
                         self.show_grid = not self.show_grid
+                        self.grid_layer = None
+
+                    # Сохранение и загрузка сцены (S, L)
+                    elif event.key == pygame.K_s:
+                        save_scene(SCENE_PATH, *self.scene_arrays())
+                    elif event.key == pygame.K_l and os.path.exists(SCENE_PATH):
+                        self.load_shapes(*load_scene(SCENE_PATH))
+
+                    # Случайная сцена (R)
+                    elif event.key == pygame.K_r:
+                        self.load_shapes(*generate_scene(SCENE_SIZE, random.randrange(2 ** 32)))
 
                     # Очистить всё (ESC)
                     elif event.key == pygame.K_ESCAPE:
-                        self.shapes = []
+                        self.clear_shapes()
                         self.current_line = []
                         self.current_polygon = []
-                        self.clipped_shapes = []
                         self.clipping_window = None
+                        self.clip_region = None
                         self.state = State.DRAWING
                         self.creating_window = False
                         self.window_mode = False
@@ -358,16 +1925,37 @@ class App:
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:
                         self.handle_mouse_click(event.pos)
+                    elif event.button == 3 and self.clipping_window:
+                        x, y = event.pos
+                        xmin, ymin, xmax, ymax = self.clipping_window
+                        if xmin <= x <= xmax and ymin <= y <= ymax:
+                            self.drag_anchor = event.pos
+
+                elif event.type == pygame.MOUSEMOTION:
+                    if self.drag_anchor and self.clipping_window:
+                        self.move_window(event.pos)
 
                 elif event.type == pygame.MOUSEBUTTONUP:
                     if event.button == 1:
                         self.handle_mouse_up(event.pos)
+                    elif event.button == 3:
+                        self.drag_anchor = None
+
+            # Окно, которое сейчас растягивают, отсекает фигуры уже во время создания
+            if self.creating_window and self.window_start:
+                mouse_pos = pygame.mouse.get_pos()
+                if mouse_pos[0] < WINDOW_WIDTH - INFO_PANEL_WIDTH:
+                    (x1, y1), (x2, y2) = self.window_start, mouse_pos
+                    self.clipping_window = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+                    self.clip_region = None
 
-            # Заливка фона
-            self.screen.fill(BACKGROUND)
+            frame_start = time.perf_counter()
 
-            # Сетка
-            self.draw_grid()
+            # Отсечение пересчитывается только для затронутых фигур
+            self.update_clipping()
+
+            # Фон с сеткой
+            self.screen.blit(self.grid_surface(), (0, 0))
 
             # Уже созданное окно отсечения
             if self.clipping_window:
@@ -375,6 +1963,9 @@ class App:
                 window_rect = pygame.Rect(x, y, w - x, h - y)
                 pygame.draw.rect(self.screen, WINDOW_COLOR, window_rect)
                 pygame.draw.rect(self.screen, AXIS_COLOR, window_rect, 2)
+            elif self.clip_region:
+                pygame.draw.polygon(self.screen, WINDOW_COLOR, self.clip_region)
+                pygame.draw.polygon(self.screen, AXIS_COLOR, self.clip_region, 2)
 
             # Процесс создания окна отсечения (рисуем прямоугольник следом за мышкой)
             if self.creating_window and self.window_start:
@@ -387,10 +1978,8 @@ class App:
                     pygame.draw.rect(self.screen, WINDOW_COLOR, rect)
                     pygame.draw.rect(self.screen, AXIS_COLOR, rect, 2)
 
-            # Отрисовка уже готовых фигур (линий или многоугольников)
-            for shape in self.shapes:
-                color = POLYGON_COLOR if len(shape) > 2 else SHAPE_COLOR
-                pygame.draw.lines(self.screen, color, len(shape) > 2, shape, 3)
+            # Уже готовые фигуры (линии и многоугольники)
+            self.screen.blit(self.shape_surface(), (0, 0))
 
             # Текущий отрезок, рисуем “на лету”
             if self.current_line:
@@ -405,17 +1994,580 @@ class App:
                     pygame.draw.circle(self.screen, POLYGON_COLOR, point, 5)
 
             # Отсечённые фигуры
-            for shape in self.clipped_shapes:
-                pygame.draw.lines(self.screen, CLIPPED_COLOR, len(shape) > 2, shape, 3)
+            self.screen.blit(self.clip_surface(), (0, 0))
 
             # Информационная панель справа
             self.draw_info_panel()
 
             pygame.display.flip()
+            self.frame_time = (time.perf_counter() - frame_start) * 1000  # в миллисекундах
             self.clock.tick(60)
 
+        if self.clip_pool is not None:
+            self.clip_pool.close()
         pygame.quit()
 
-if __name__ == "__main__":
-    app = App()
+
+def save_scene(path: str, vertices, offsets):
+    """
+    Запись сцены: фигура i — вершины vertices[offsets[i]:offsets[i + 1]],
+    две вершины — отрезок, больше — многоугольник (как в App.shapes).
+    """
+    vertices = np.ascontiguousarray(vertices, dtype='<f8').reshape(-1, 2)
+    offsets = np.ascontiguousarray(offsets, dtype='<i8')
+    with open(path, 'wb') as f:
+        f.write(SCENE_HEADER.pack(SCENE_MAGIC, len(offsets) - 1, len(vertices)))
+        f.write(offsets.tobytes())
+        f.write(vertices.tobytes())
+
+
+def load_scene(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Сцена, отображённая в память: (vertices, offsets) без чтения файла целиком"""
+    with open(path, 'rb') as f:
+        magic, count, vertex_count = SCENE_HEADER.unpack(f.read(SCENE_HEADER.size))
+    if magic != SCENE_MAGIC:
+        raise ValueError(f"{path}: не файл сцены")
+    offsets = np.memmap(path, dtype='<i8', mode='r', offset=SCENE_HEADER.size, shape=(count + 1,))
+    if vertex_count:
+        vertices = np.memmap(path, dtype='<f8', mode='r', offset=SCENE_HEADER.size + 8 * (count + 1),
+                             shape=(vertex_count, 2))
+    else:
+        vertices = np.empty((0, 2))  # memmap не умеет отображать ноль байт
+    return vertices, offsets
+
+
+def generate_scene(count: int, seed: int = 0, polygon_share: float = 0.5,
+                   size: float = 40.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Случайная сцена в области рисования: отрезки длиной до 2·size и звёздные
+    (значит, простые) многоугольники из 3–8 вершин радиусом до size. Вершина j
+    из k лежит в своём секторе оборота [j/k, (j + 0.4)/k), так что соседние
+    вершины расходятся меньше чем на пол-оборота и центр виден из всех рёбер.
+    """
+    rng = np.random.default_rng(seed)
+    polygon = rng.random(count) < polygon_share
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.where(polygon, rng.integers(3, 9, count), 2), out=offsets[1:])
+    sides = np.diff(offsets)
+    owner = np.repeat(np.arange(count), sides)
+    local = np.arange(offsets[-1]) - offsets[owner]
+
+    turn = (local + 0.4 * rng.random(offsets[-1])) / sides[owner]
+    angle = np.where(polygon[owner], 2 * np.pi * turn, 2 * np.pi * rng.random(count)[owner] + np.pi * local)
+    radius = np.where(polygon[owner], rng.uniform(0.4, 1.0, offsets[-1]), 1.0)
+    radius *= rng.uniform(0.2, 1.0, count)[owner] * size
+
+    width, height = WINDOW_WIDTH - INFO_PANEL_WIDTH, WINDOW_HEIGHT
+    center = np.stack([rng.uniform(size, width - size, count), rng.uniform(size, height - size, count)], axis=1)
+    vertices = center[owner] + radius[:, None] * np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    return vertices, offsets
+
+
+BENCHMARK_WINDOW = (400, 200, 600, 400)
+
+
+def benchmark_segments(rng: random.Random, case: str, count: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Наборы отрезков для окна BENCHMARK_WINDOW:
+    random  — концы равномерно в области втрое больше окна;
+    inside  — оба конца внутри, тривиальное принятие;
+    corners — из угловой области в противоположную через окно, у Коэна-Сазерленда
+              до четырёх пересечений на отрезок;
+    near    — срезают угол мимо окна, тривиально не отбрасываются.
+    """
+    xmin, ymin, xmax, ymax = BENCHMARK_WINDOW
+    w, h = xmax - xmin, ymax - ymin
+    segments = []
+    for _ in range(count):
+        if case == 'inside':
+            segment = (rng.randint(xmin, xmax), rng.randint(ymin, ymax), rng.randint(xmin, xmax), rng.randint(ymin, ymax))
+        elif case == 'corners':
+            dx, dy = rng.randint(1, w // 4), rng.randint(1, h // 4)
+            segment = (xmin - dx, ymin - dy, xmax + dy, ymax + dx)
+        elif case == 'near':
+            d = rng.randint(1, w // 2)
+            segment = (xmin - d - 1, ymin + rng.randint(0, d // 2), xmin + rng.randint(0, d // 2), ymin - d - 1)
+        else:
+            segment = (rng.randint(xmin - w, xmax + w), rng.randint(ymin - h, ymax + h),
+                       rng.randint(xmin - w, xmax + w), rng.randint(ymin - h, ymax + h))
+        segments.append(segment)
+    return segments
+
+
+def run_benchmark(cases=('random', 'inside', 'corners', 'near'), count=10000, repeat=5, seed=0,
+                  modes=('scalar', 'batch')) -> List[dict]:
+    """Замер алгоритмов отсечения на наборах отрезков, нс на отрезок"""
+    clipper = Clipper(window=BENCHMARK_WINDOW)
+    results = []
+    for case in cases:
+        segments = benchmark_segments(random.Random(f"{seed}:{case}"), case, count)
+        array = np.array(segments, dtype=np.float64)
+        for engine in Clipper.CLIP_ENGINES:
+            clipper.engine = engine
+            for mode in modes:
+                if mode == 'batch':
+                    def workload():
+                        return int(clipper.batch_clip(array)[0].sum())
+                else:
+                    def workload():
+                        return sum(clipper.clip_segment(*segment)[0] for segment in segments)
+
+                accepted = workload()
+                samples = []
+                for _ in range(repeat):
+                    start = time.perf_counter_ns()
+                    workload()
+                    samples.append((time.perf_counter_ns() - start) / count)
+                results.append({
+                    'case': case,
+                    'engine': engine,
+                    'mode': mode,
+                    'accepted': accepted,
+                    'ns_per_segment': statistics.mean(samples),
+                    'ns_per_segment_min': min(samples),
+                })
+    return results
+
+
+def print_benchmark(results: List[dict]):
+    print(f"{'case':10s}{'engine':>18s}{'mode':>8s}{'accepted':>10s}{'ns/seg':>10s}{'min':>10s}")
+    for case in results:
+        print(f"{case['case']:10s}{case['engine']:>18s}{case['mode']:>8s}{case['accepted']:10d}"
+              f"{case['ns_per_segment']:10.1f}{case['ns_per_segment_min']:10.1f}")
+
+
+def run_scaling(vertices, offsets, window=SCALING_WINDOW, operation='union', workers=(1, 2, 4),
+                backends=POOL_BACKENDS, repeat=3) -> List[dict]:
+    """
+    Замер полного отсечения сцены пулом ClipPool при разном числе исполнителей,
+    лучшее время из repeat. Ускорение и эффективность считаются относительно
+    отсечения в одном потоке без пула (строка 'serial').
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    clipper = Clipper(window=window, operation=operation)
+    starts = offsets[:-1]
+    boxes = np.stack([np.minimum.reduceat(vertices[:, 0], starts), np.minimum.reduceat(vertices[:, 1], starts),
+                      np.maximum.reduceat(vertices[:, 0], starts), np.maximum.reduceat(vertices[:, 1], starts)],
+                     axis=1)
+    status = clipper.box_status(boxes)
+    indices = np.arange(len(starts))
+
+    def best(workload):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            workload()
+            samples.append(time.perf_counter() - start)
+        return min(samples)
+
+    serial = best(lambda: contour_lists(*clipper.clip_scene(vertices, offsets, indices, status), len(indices)))
+    results = [{'backend': 'serial', 'workers': 1, 'seconds': serial, 'speedup': 1.0, 'efficiency': 1.0}]
+    for backend in backends:
+        for count in workers:
+            pool = ClipPool(count, backend)
+            try:
+                pool.share(vertices, offsets)
+                pool.clip(clipper, indices[:1], status[:1])  # запуск исполнителей не входит в замер
+                seconds = best(lambda: pool.clip(clipper, indices, status))
+            finally:
+                pool.close()
+            results.append({
+                'backend': backend,
+                'workers': count,
+                'seconds': seconds,
+                'speedup': serial / seconds,
+                'efficiency': serial / seconds / count,
+            })
+    return results
+
+
+def print_scaling(results: List[dict]):
+    print(f"{'backend':10s}{'workers':>8s}{'ms':>10s}{'speedup':>9s}{'eff.':>7s}")
+    for case in results:
+        print(f"{case['backend']:10s}{case['workers']:8d}{case['seconds'] * 1000:10.1f}"
+              f"{case['speedup']:9.2f}{case['efficiency']:7.2f}")
+
+
+# Потоковое отсечение: по одной фигуре на строку, GeoJSON (Feature или голая
+# геометрия, допускается префикс RS из RFC 8142) или WKT
+STREAM_FORMATS = ('geojson', 'wkt')
+RECORD_SEPARATOR = '\x1e'
+WKT_TYPES = {
+    'LINESTRING': 'LineString',
+    'MULTILINESTRING': 'MultiLineString',
+    'POLYGON': 'Polygon',
+    'MULTIPOLYGON': 'MultiPolygon',
+}
+GEOMETRY_DEPTH = {'LineString': 1, 'MultiLineString': 2, 'Polygon': 2, 'MultiPolygon': 3}  # вложенность списков точек
+WKT_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+WKT_POINT = re.compile(rf'({WKT_NUMBER})\s+({WKT_NUMBER})(?:\s+{WKT_NUMBER})*')
+WKT_GEOMETRY = re.compile(r'\s*([A-Za-z]+)(?:\s+(?:ZM|Z|M)(?=\s*[(E]))?\s*(.*?)\s*$', re.S)
+
+
+def parse_wkt(text: str) -> dict:
+    """
+    Геометрия WKT в виде словаря GeoJSON: скобки становятся списками, пары
+    «x y» — парами координат (z и m отбрасываются).
+    """
+    match = WKT_GEOMETRY.match(text)
+    if not match or match[1].upper() not in WKT_TYPES:
+        raise ValueError(f"неподдерживаемая геометрия: {text[:40]}")
+    body = match[2]
+    if body.upper() == 'EMPTY':
+        coordinates = []
+    else:
+        body = WKT_POINT.sub(lambda point: f'[{float(point[1])!r},{float(point[2])!r}]', body)
+        coordinates = json.loads(body.replace('(', '[').replace(')', ']'))
+    return {'type': WKT_TYPES[match[1].upper()], 'coordinates': coordinates}
+
+
+def format_wkt(geometry: dict) -> str:
+    def ring(points):
+        return '(' + ', '.join(f'{float(x)!r} {float(y)!r}' for x, y in points) + ')'
+
+    kind, coordinates = geometry['type'], geometry['coordinates']
+    if kind == 'LineString':
+        body = ring(coordinates)
+    elif kind == 'MultiPolygon':
+        body = '(' + ', '.join('(' + ', '.join(map(ring, polygon)) + ')' for polygon in coordinates) + ')'
+    else:
+        body = '(' + ', '.join(map(ring, coordinates)) + ')'
+    return f"{kind.upper()} {body}"
+
+
+def plane_coordinates(coordinates, depth: int):
+    # Координаты точек как пары float, z и m отбрасываются
+    if depth == 0:
+        x, y = coordinates[:2]
+        return float(x), float(y)
+    return [plane_coordinates(item, depth - 1) for item in coordinates]
+
+
+def parse_record(line: str):
+    """
+    Разбор строки потока: (geometry, feature, format), где feature — исходный
+    Feature (его свойства переносятся в результат) или None. Координаты
+    геометрии приводятся к парам float, так что ошибка в записи всплывает здесь,
+    а не посреди пачки.
+    """
+    text = line.strip().lstrip(RECORD_SEPARATOR)
+    if text.startswith('{'):
+        record = json.loads(text)
+        if record.get('type') == 'Feature':
+            geometry, feature, record_format = record.get('geometry'), record, 'geojson'
+        else:
+            geometry, feature, record_format = record, None, 'geojson'
+    else:
+        geometry, feature, record_format = parse_wkt(text), None, 'wkt'
+    if not isinstance(geometry, dict) or geometry.get('type') not in GEOMETRY_DEPTH:
+        raise ValueError("неподдерживаемая геометрия")
+    kind = geometry['type']
+    return {'type': kind, 'coordinates': plane_coordinates(geometry['coordinates'], GEOMETRY_DEPTH[kind])}, \
+        feature, record_format
+
+
+def open_ring(ring: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    # Контур без повторённой в конце первой вершины
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        return ring[:-1]
+    return ring
+
+
+def closed_ring(contour: List[Tuple[float, float]], counterclockwise: bool) -> List[List[float]]:
+    if (signed_area(contour) > 0) != counterclockwise:
+        contour = contour[::-1]
+    # + 0.0 убирает -0.0, который даёт отсечение по нулевой границе
+    return [[x + 0.0, y + 0.0] for x, y in contour] + [[contour[0][0] + 0.0, contour[0][1] + 0.0]]
+
+
+def interior_point(contour: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """
+    Точка строго внутри контура: середина самого длинного ребра, чуть
+    сдвинутая внутрь. Она не лежит на границах соседних контуров, даже если
+    контуры касаются друг друга.
+    """
+    n = len(contour)
+    i = max(range(n), key=lambda k: math.dist(contour[k], contour[(k + 1) % n]))
+    (ax, ay), (bx, by) = contour[i], contour[(i + 1) % n]
+    sign = 1 if signed_area(contour) > 0 else -1
+    shift = 1e-6 * sign
+    return (ax + bx) / 2 - (by - ay) * shift, (ay + by) / 2 + (bx - ax) * shift
+
+
+def nest_contours(contours: List[List[Tuple[float, float]]]) -> List[List[List[List[float]]]]:
+    """
+    Сборка многоугольников с дырами из контуров по глубине вложенности:
+    контур чётной глубины — внешний (против часовой стрелки), нечётной — дыра
+    (по часовой) ближайшего охватывающего контура.
+    """
+    contours = sorted((c for c in contours if len(c) > 2 and signed_area(c) != 0),
+                      key=lambda c: -abs(signed_area(c)))
+    boxes = [(min(x for x, _ in c), min(y for _, y in c), max(x for x, _ in c), max(y for _, y in c))
+             for c in contours]
+    depth, polygons, owner = [], [], []
+    for i, contour in enumerate(contours):
+        x, y = interior_point(contour)
+        parents = [j for j in range(i)
+                   if boxes[j][0] <= x <= boxes[j][2] and boxes[j][1] <= y <= boxes[j][3]
+                   and point_in_polygon(x, y, contours[j])]
+        depth.append(len(parents))
+        if depth[i] % 2 == 0:
+            owner.append(len(polygons))
+            polygons.append([closed_ring(contour, True)])
+        else:
+            owner.append(owner[parents[-1]])
+            polygons[owner[i]].append(closed_ring(contour, False))
+    return polygons
+
+
+def join_pieces(pieces: np.ndarray, edges: np.ndarray) -> List[List[List[float]]]:
+    """
+    Склейка кусков рёбер ломаной: кусок продолжает предыдущую часть, если
+    начинается на следующем ребре там, где закончился предыдущий кусок.
+    """
+    lines, previous = [], None
+    for (x1, y1, x2, y2), edge in zip(pieces.tolist(), edges.tolist()):
+        if lines and edge == previous + 1:
+            px, py = lines[-1][-1]
+            if (math.isclose(x1, px, rel_tol=JOIN_TOLERANCE, abs_tol=JOIN_TOLERANCE)
+                    and math.isclose(y1, py, rel_tol=JOIN_TOLERANCE, abs_tol=JOIN_TOLERANCE)):
+                lines[-1].append([x2, y2])
+                previous = edge
+                continue
+        lines.append([[x1, y1], [x2, y2]])
+        previous = edge
+    return lines
+
+
+def clip_geometries(clipper: Clipper, geometries: List[dict]) -> List[dict]:
+    """
+    Отсечение пачки геометрий GeoJSON. Рёбра всех ломаных отсекаются одним
+    вызовом clip_segment_array, внешние контуры и дыры многоугольников — двумя
+    вызовами clip_polygon_array: дыра пересекается с окном при пересечении и
+    теряет его часть при объединении и разности. Части мультиполигона не
+    пересекаются между собой, но окно может задевать несколько из них, поэтому
+    их объединение с окном записывается как разность частей с окном плюс само окно.
+    Возвращает геометрии результата, None для пустых.
+    """
+    hole_operation = 'intersection' if clipper.operation == 'intersection' else 'difference'
+    lines, edges = [], []  # (геометрия, первое ребро, за последним ребром), рёбра ломаных
+    polygons = []          # (геометрия, число дыр, операция для внешнего контура)
+    outers, holes = [], []
+    edge_count = 0
+    for g, geometry in enumerate(geometries):
+        kind, coordinates = geometry['type'], geometry['coordinates']
+        if kind in ('LineString', 'MultiLineString'):
+            for line in ([coordinates] if kind == 'LineString' else coordinates):
+                points = np.array(line, dtype=np.float64).reshape(-1, 2)
+                edges.append(np.hstack([points[:-1], points[1:]]))
+                lines.append((g, edge_count, edge_count + len(edges[-1])))
+                edge_count += len(edges[-1])
+        else:
+            for rings in ([coordinates] if kind == 'Polygon' else coordinates):
+                rings = [ring for ring in map(open_ring, rings) if len(ring) > 2]
+                if rings:
+                    multi_union = kind == 'MultiPolygon' and clipper.operation == 'union'
+                    polygons.append((g, len(rings) - 1, 'difference' if multi_union else clipper.operation))
+                    outers.append(rings[0])
+                    holes.extend(rings[1:])
+
+    parts = [[] for _ in geometries]
+    if lines:
+        pieces, source = clipper.clip_segment_array(np.vstack(edges))
+        for g, start, end in lines:
+            a, b = np.searchsorted(source, (start, end))
+            parts[g].extend(join_pieces(pieces[a:b], source[a:b]))
+
+    if outers:
+        def clip_rings(rings, operation):
+            vertices, offsets, source = clipper.clip_polygon_array(
+                list(itertools.chain.from_iterable(rings)),
+                np.cumsum([0] + [len(ring) for ring in rings]), operation)
+            contours = [[] for _ in rings]
+            for i, (start, end) in zip(source.tolist(), zip(offsets[:-1].tolist(), offsets[1:].tolist())):
+                contours[i].append([(x, y) for x, y in vertices[start:end].tolist()])
+            return contours
+
+        outer_contours = [None] * len(outers)
+        for operation in {operation for _, _, operation in polygons}:
+            chosen = [i for i, polygon in enumerate(polygons) if polygon[2] == operation]
+            for i, contours in zip(chosen, clip_rings([outers[i] for i in chosen], operation)):
+                outer_contours[i] = contours
+        hole_contours = clip_rings(holes, hole_operation) if holes else []
+        first_hole = 0
+        for (g, hole_count, operation), contours in zip(polygons, outer_contours):
+            for hole in hole_contours[first_hole:first_hole + hole_count]:
+                contours = contours + hole
+            first_hole += hole_count
+            parts[g].extend(nest_contours(contours))
+        window = clipper.window_polygon()
+        for g in sorted({g for g, _, operation in polygons if operation != clipper.operation}):
+            parts[g].append([closed_ring(window, True)])
+
+    results = []
+    for geometry, coordinates in zip(geometries, parts):
+        if not coordinates:
+            results.append(None)
+            continue
+        kind = geometry['type']
+        single = kind in ('LineString', 'Polygon') and len(coordinates) == 1
+        if kind in ('LineString', 'MultiLineString'):
+            kind = 'LineString' if single else 'MultiLineString'
+        else:
+            kind = 'Polygon' if single else 'MultiPolygon'
+        results.append({'type': kind, 'coordinates': coordinates[0] if single else coordinates})
+    return results
+
+
+def clip_stream(clipper: Clipper, source, target, output_format: str = None, chunk_size: int = 10000) -> dict:
+    """
+    Отсечение потока фигур пачками по chunk_size строк: в памяти одновременно
+    только одна пачка, результат записывается сразу после её обработки.
+    Пустые результаты не выводятся, нераспознанные строки пропускаются.
+    """
+    counts = {'read': 0, 'written': 0, 'empty': 0, 'skipped': 0}
+    lines = (line for line in source if line.strip(RECORD_SEPARATOR + ' \t\r\n'))
+    while True:
+        chunk = list(itertools.islice(lines, chunk_size))
+        if not chunk:
+            break
+        counts['read'] += len(chunk)
+        records = []
+        for line in chunk:
+            try:
+                records.append(parse_record(line))
+            except (ValueError, KeyError, TypeError):
+                counts['skipped'] += 1
+
+        output = []
+        for (_, feature, record_format), geometry in zip(records, clip_geometries(clipper, [r[0] for r in records])):
+            if geometry is None:
+                counts['empty'] += 1
+                continue
+            if (output_format or record_format) == 'wkt':
+                output.append(format_wkt(geometry))
+            elif feature is not None:
+                output.append(json.dumps({**feature, 'geometry': geometry}, ensure_ascii=False))
+            else:
+                output.append(json.dumps(geometry))
+        counts['written'] += len(output)
+        if output:
+            target.write('\n'.join(output) + '\n')
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отсечение отрезков и многоугольников")
+    subparsers = parser.add_subparsers(dest='command')
+
+    bench_parser = subparsers.add_parser('bench', help="сравнение алгоритмов отсечения без окна")
+    bench_parser.add_argument('--cases', nargs='+', choices=['random', 'inside', 'corners', 'near'],
+                              default=['random', 'inside', 'corners', 'near'])
+    bench_parser.add_argument('--count', type=int, default=10000)
+    bench_parser.add_argument('--modes', nargs='+', choices=['scalar', 'batch'], default=['scalar', 'batch'])
+    bench_parser.add_argument('--repeat', type=int, default=5)
+    bench_parser.add_argument('--seed', type=int, default=0)
+
+    clip_parser = subparsers.add_parser('clip', help="потоковое отсечение фигур из NDJSON-GeoJSON или WKT")
+    clip_parser.add_argument('input', help="файл с одной фигурой на строку, '-' — стандартный ввод")
+    clip_parser.add_argument('output', nargs='?', default='-', help="файл результата, по умолчанию стандартный вывод")
+    window_group = clip_parser.add_mutually_exclusive_group(required=True)
+    window_group.add_argument('--window', nargs=4, type=float, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'))
+    window_group.add_argument('--region', nargs='+', type=float, metavar='X Y',
+                              help="вершины окна-многоугольника x1 y1 x2 y2 ...")
+    clip_parser.add_argument('--engine', choices=list(Clipper.CLIP_ENGINES), default='cohen_sutherland')
+    clip_parser.add_argument('--operation', choices=BOOLEAN_OPERATIONS, default='intersection')
+    clip_parser.add_argument('--format', choices=STREAM_FORMATS,
+                             help="формат вывода, по умолчанию как у каждой входной записи")
+    clip_parser.add_argument('--chunk-size', type=int, default=10000)
+
+    cpu_count = os.cpu_count() or 1
+    scale_parser = subparsers.add_parser('scale', help="ускорение параллельного отсечения сцены")
+    scale_parser.add_argument('scene', nargs='?', help="файл сцены, по умолчанию случайная сцена")
+    scale_parser.add_argument('--window', nargs=4, type=float, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                              default=SCALING_WINDOW)
+    scale_parser.add_argument('--operation', choices=BOOLEAN_OPERATIONS, default='union')
+    scale_parser.add_argument('--workers', nargs='+', type=int,
+                              default=sorted({2 ** k for k in range(cpu_count.bit_length())} | {cpu_count}))
+    scale_parser.add_argument('--backends', nargs='+', choices=POOL_BACKENDS, default=list(POOL_BACKENDS))
+    scale_parser.add_argument('--repeat', type=int, default=3)
+    scale_parser.add_argument('--seed', type=int, default=0)
+
+    generate_parser = subparsers.add_parser('generate', help="случайная сцена из отрезков и многоугольников")
+    generate_parser.add_argument('output', nargs='?', default=SCENE_PATH)
+    generate_parser.add_argument('--count', type=int, default=SCENE_SIZE)
+    generate_parser.add_argument('--polygons', type=float, default=0.5, help="доля многоугольников")
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    parser.add_argument('--scene', help="файл сцены, открываемый в окне")
+    parser.add_argument('--workers', type=int, default=cpu_count,
+                        help="исполнителей для больших пересчётов в окне, 1 — без пула")
+    parser.add_argument('--backend', choices=POOL_BACKENDS, default='process')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        print_benchmark(run_benchmark(args.cases, args.count, args.repeat, args.seed, args.modes))
+        return 0
+
+    if args.command == 'scale':
+        if min(args.workers) < 1 or args.repeat < 1:
+            parser.error("--workers и --repeat должны быть положительными")
+        if args.scene:
+            vertices, offsets = load_scene(args.scene)
+        else:
+            vertices, offsets = generate_scene(SCENE_SIZE, args.seed)
+        xmin, ymin, xmax, ymax = args.window
+        window = (min(xmin, xmax), min(ymin, ymax), max(xmin, xmax), max(ymin, ymax))
+        print(f"{len(offsets) - 1} фигур, ядер: {cpu_count}", file=sys.stderr)
+        print_scaling(run_scaling(vertices, offsets, window, args.operation, args.workers, args.backends, args.repeat))
+        return 0
+
+    if args.command == 'generate':
+        vertices, offsets = generate_scene(args.count, args.seed, args.polygons)
+        save_scene(args.output, vertices, offsets)
+        print(f"{args.output}: {args.count} фигур, {len(vertices)} вершин", file=sys.stderr)
+        return 0
+
+    if args.command == 'clip':
+        if args.chunk_size < 1:
+            parser.error("--chunk-size должен быть положительным")
+        if args.window:
+            xmin, ymin, xmax, ymax = args.window
+            clipper = Clipper(window=(min(xmin, xmax), min(ymin, ymax), max(xmin, xmax), max(ymin, ymax)),
+                              engine=args.engine, operation=args.operation)
+        else:
+            region = list(zip(args.region[::2], args.region[1::2]))
+            if len(args.region) % 2 or len(region) < 3:
+                parser.error("--region ждёт не меньше трёх пар координат")
+            clipper = Clipper(engine=args.engine, operation=args.operation)
+            if not clipper.set_region(region):
+                parser.error("вырожденное окно-многоугольник")
+
+        source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+        target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+        try:
+            counts = clip_stream(clipper, source, target, args.format, args.chunk_size)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if target is not sys.stdout:
+                target.close()
+        print(f"прочитано {counts['read']}, записано {counts['written']}, пусто {counts['empty']}, "
+              f"пропущено {counts['skipped']}", file=sys.stderr)
+        print(f"предикаты: {PREDICATE_STATS.fast} по float, {PREDICATE_STATS.exact} точно", file=sys.stderr)
+        return 0
+
+    if pygame is None:
+        parser.error("для окна нужен pygame")
+    if args.workers < 1:
+        parser.error("--workers должен быть положительным")
+    app = App(args.workers, args.backend)
+    if args.scene:
+        app.load_shapes(*load_scene(args.scene))
     app.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())